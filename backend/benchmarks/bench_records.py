@@ -0,0 +1,152 @@
+"""
+内部记录（models.records）与 pydantic 响应模型（models.schemas）的对比
+
+  - 每行构造耗时：解析器每行构造一个 Grade / Exam / Course（含上课时间段）
+  - 每个缓存条目的内存：一份课表（40 门课）/ 一份成绩（120 条）常驻内存的字节数
+  - 边界序列化耗时：记录 to_json() 与模型 model_dump_json()
+
+用法（在 backend 目录下）：python -m benchmarks.bench_records
+"""
+
+import gc
+import random
+import timeit
+import tracemalloc
+
+from models import records, schemas
+
+
+def _grade_kwargs(rng: random.Random, i: int) -> dict:
+    return dict(
+        semester=f"20{rng.randint(20, 25)}-20{rng.randint(21, 26)}学年秋季学期",
+        course_id=f"GRA{i:08d}",
+        course_name=f"课程名称{i}",
+        score=str(rng.randint(60, 100)),
+        credits=float(rng.choice((1, 2, 3))),
+        gpa_point=rng.choice((4.0, 3.7, 3.3)),
+        exam_type="考试",
+        course_category="专业必修",
+        course_nature="必修",
+        regular_score="90",
+        final_score="88",
+        study_type="初修",
+    )
+
+
+def _exam_kwargs(rng: random.Random, i: int) -> dict:
+    return dict(
+        course_name=f"课程名称{i}",
+        credits="2",
+        category="必修",
+        exam_type="考试",
+        exam_time=f"2026-01-{rng.randint(1, 28):02d} 09:00-11:00",
+        exam_location=f"教八{rng.randint(100, 500)}",
+        seat_number=str(rng.randint(1, 120)),
+    )
+
+
+def _course_kwargs(rng: random.Random, i: int) -> tuple[dict, list[dict]]:
+    slots = [
+        dict(weeks_mask=((1 << 17) - 2), day_of_week=rng.randint(1, 5),
+             start_section=rng.randint(1, 6), end_section=rng.randint(7, 12),
+             classroom=f"教八{rng.randint(100, 500)}", capacity=rng.randint(30, 200))
+        for _ in range(rng.randint(1, 3))
+    ]
+    course = dict(
+        course_id=f"GRA{i:08d}",
+        course_name=f"课程名称{i}",
+        total_hours=48,
+        credits=2.0,
+        class_number="01",
+        teachers=["张三", "李四"],
+        raw_time_location="1-16周 三[5-6] 教八301(120)",
+    )
+    return course, slots
+
+
+def _build_schedule(slot_cls, course_cls, response_cls, n: int):
+    rng = random.Random(0)
+    courses = []
+    for i in range(n):
+        course, slots = _course_kwargs(rng, i)
+        courses.append(course_cls(**course, slots=[slot_cls(**s) for s in slots]))
+    return response_cls(semester_label="2025-2026学年春季学期", student_id="202311000000",
+                        total_courses=n, total_credits=2.0 * n, courses=courses)
+
+
+def build_schedule_model(n: int = 40):
+    return _build_schedule(schemas.ScheduleSlot, schemas.Course,
+                           schemas.ScheduleResponse, n)
+
+
+def build_schedule_record(n: int = 40):
+    return _build_schedule(records.ScheduleSlotRecord, records.CourseRecord,
+                           records.ScheduleRecord, n)
+
+
+def build_grades_model(n: int = 120):
+    rng = random.Random(0)
+    return schemas.GradesResponse(grades=[schemas.Grade(**_grade_kwargs(rng, i)) for i in range(n)])
+
+
+def build_grades_record(n: int = 120):
+    rng = random.Random(0)
+    return records.GradesRecord(grades=[records.GradeRecord(**_grade_kwargs(rng, i)) for i in range(n)])
+
+
+def per_call_us(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def retained_bytes(build, copies: int = 50) -> float:
+    """build() 结果常驻内存的平均字节数"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build() for _ in range(copies)]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return (after - before) / copies
+
+
+def main():
+    rng = random.Random(1)
+    grade = _grade_kwargs(rng, 1)
+    exam = _exam_kwargs(rng, 1)
+    course, slots = _course_kwargs(rng, 1)
+
+    print("每行构造耗时（微秒）             pydantic    record")
+    rows = [
+        ("Grade", lambda: schemas.Grade(**grade), lambda: records.GradeRecord(**grade)),
+        ("Exam", lambda: schemas.Exam(**exam), lambda: records.ExamRecord(**exam)),
+        ("Course + slots",
+         lambda: schemas.Course(**course, slots=[schemas.ScheduleSlot(**s) for s in slots]),
+         lambda: records.CourseRecord(**course, slots=[records.ScheduleSlotRecord(**s) for s in slots])),
+    ]
+    for name, model, record in rows:
+        m, r = per_call_us(model, 20000), per_call_us(record, 20000)
+        print(f"  {name:<28}{m:>10.2f}{r:>10.2f}   ({m / r:.1f}x)")
+
+    print("每个缓存条目的内存（KB）         pydantic    record")
+    for name, model, record in [
+        ("课表（40 门课）", build_schedule_model, build_schedule_record),
+        ("成绩（120 条）", build_grades_model, build_grades_record),
+    ]:
+        m, r = retained_bytes(model) / 1024, retained_bytes(record) / 1024
+        print(f"  {name:<24}{m:>10.1f}{r:>10.1f}   ({m / r:.1f}x)")
+
+    print("序列化为 JSON（微秒）            pydantic    record")
+    for name, model, record in [
+        ("课表（40 门课）", build_schedule_model(), build_schedule_record()),
+        ("成绩（120 条）", build_grades_model(), build_grades_record()),
+    ]:
+        assert model.model_dump_json().encode("utf-8") == record.to_json()
+        m = per_call_us(lambda: model.model_dump_json().encode("utf-8"), 200)
+        r = per_call_us(record.to_json, 200)
+        print(f"  {name:<24}{m:>10.1f}{r:>10.1f}   ({m / r:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
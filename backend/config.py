@@ -2,6 +2,8 @@
 北师大教务系统 App 后端配置
 """
 
+import os
+
 # WebVPN 配置
 WEBVPN_HOST = "onevpn.bnu.edu.cn"
 WEBVPN_LOGIN_URL = f"https://{WEBVPN_HOST}/login"
@@ -52,3 +54,86 @@ DEFAULT_HEADERS = {
     "Accept-Encoding": "gzip, deflate, br",
     "Connection": "keep-alive",
 }
+
+# 上游 HTTP 客户端（每个用户会话一个连接池）
+UPSTREAM_MAX_CONNECTIONS = 10
+UPSTREAM_MAX_KEEPALIVE = 5
+
+# 考试安排：同一会话相邻考试轮次（kslc）请求的最小间隔（秒），避免 VPN 限流
+EXAM_ROUND_INTERVAL = 2.0
+
+# 上游限流（令牌桶）：全局 + 每个学号各一个桶
+UPSTREAM_RATE_GLOBAL = 20.0         # 全局每秒请求数
+UPSTREAM_BURST_GLOBAL = 40          # 全局突发容量
+UPSTREAM_RATE_PER_STUDENT = 1.0     # 每个学号每秒请求数
+UPSTREAM_BURST_PER_STUDENT = 10     # 每个学号突发容量（一次登录约 7 个请求）
+UPSTREAM_MAX_QUEUE = 500            # 排队等待的请求上限，超过直接拒绝
+UPSTREAM_MAX_WAIT = 10.0            # 单个请求最长排队时间（秒）
+
+# 登录执行池：同时进行的 CAS 登录数上限，其余排队
+LOGIN_MAX_CONCURRENCY = 16
+LOGIN_MAX_QUEUE = 1000
+LOGIN_QUEUE_DEADLINE = 10.0         # 排队最长等待（秒），需小于客户端超时
+LOGIN_INITIAL_DURATION = 3.0        # 无历史数据时估算单次登录耗时（秒）
+# 登录成功后在后台预取的数据（逗号分隔，可选 grades / exams；留空关闭）。
+# 当前学期课表直接复用登录时下载的页面，不需要额外请求
+LOGIN_PREFETCH = tuple(
+    name.strip() for name in os.environ.get("LOGIN_PREFETCH", "grades,exams").split(",")
+    if name.strip()
+)
+
+# 会话存储：memory:// | sqlite:///sessions.db | redis://host:6379/0
+# 多 worker 部署时需使用 sqlite 或 redis，使任意 worker 都能恢复同一用户的会话
+SESSION_STORE_URL = os.environ.get("SESSION_STORE_URL", "memory://")
+SESSION_STORE_SYNC_INTERVAL = 60    # 本地会话与共享存储同步的最小间隔（秒）
+
+# 重启保留会话：memory 后端关闭时把会话写入快照文件，启动时恢复（留空则禁用）
+SESSION_SNAPSHOT_PATH = os.environ.get("SESSION_SNAPSHOT_PATH", "session_snapshot.json")
+SESSION_SNAPSHOT_INTERVAL = 5 * 60  # 运行期间定期快照的间隔（秒），0 = 仅关闭时
+
+# 会话后台保活：定期探测仍活跃用户的会话，请求路径上不再同步验证
+KEEPALIVE_INTERVAL = 30             # 扫描间隔（秒）
+KEEPALIVE_REFRESH_AFTER = 4 * 60    # 距上次验证超过该时间即探测（应小于免验窗口 5 分钟）
+KEEPALIVE_MAX_PROBES = 50           # 每轮最多探测的会话数
+KEEPALIVE_CONCURRENCY = 4           # 探测并发数
+KEEPALIVE_PROBE_LEASE = 60          # 同一会话的探测租约（秒）：多 worker 时租约期内只有一个 worker 探测
+
+# 本地会话缓存上限：超出时淘汰最久未使用的会话（会话仍可从存储恢复）
+SESSION_CACHE_MAX_ENTRIES = 5000
+SESSION_CACHE_MAX_BYTES = 256 * 1024 * 1024   # 估算内存上限
+SESSION_REAP_INTERVAL = 60          # 清理过期会话、关闭已淘汰会话的间隔（秒）
+# 被淘汰/替换的会话至少再保留该时间才关闭连接池：已取到该会话的请求可能仍在使用
+# （应大于一次数据抓取的最长耗时，含限流排队）
+SESSION_CLOSE_GRACE = 120
+
+# 响应缓存（课表 / 成绩 / 考试解析结果）
+CACHE_TTL_SCHEDULE = 7 * 24 * 3600  # 课表一学期内基本不变
+CACHE_TTL_GRADES = 3 * 24 * 3600    # 成绩在考试周可能更新
+CACHE_TTL_EXAMS = 30 * 60           # 考试安排随时可能发布
+# stale-while-revalidate：超过 fresh 时间的课表/成绩先返回旧数据，同时后台刷新
+CACHE_FRESH_SCHEDULE = 6 * 3600
+CACHE_FRESH_GRADES = 1 * 3600
+# 负缓存：确实为空的结果（如没有考试）短时间缓存；
+# 上游失败/被限流的结果按 key 指数退避（BASE, 2*BASE, ... 最多 MAX 秒）
+CACHE_TTL_EMPTY = 10 * 60
+CACHE_FAILURE_BACKOFF_BASE = 30
+CACHE_FAILURE_BACKOFF_MAX = 30 * 60
+CACHE_MAX_ENTRIES = 20000           # 每个命名空间的条目上限
+CACHE_MAX_BYTES = 64 * 1024 * 1024  # 每个命名空间的估算内存上限
+
+# 响应缓存磁盘层（SQLite，写透）：重启后缓存仍然有效；留空则仅使用内存缓存
+CACHE_DISK_PATH = os.environ.get("CACHE_DISK_PATH", "response_cache.db")
+CACHE_DISK_MAX_BYTES = 256 * 1024 * 1024
+
+# 教务系统安全 token（课表 t、成绩 kingoKey）在同一会话内的最长复用时间（秒）
+JWXT_TOKEN_MAX_AGE = 30 * 60
+
+# 解析结果按上游原始字节的哈希复用（相同页面不再重复解析）
+PARSE_MEMO_MAX_ENTRIES = 2000
+PARSE_MEMO_MAX_BYTES = 32 * 1024 * 1024   # 按原始页面字节数估算
+
+# 成绩查询边下载边解析（流式，内存占用与单行相当）；False 时整页下载后再解析
+GRADES_STREAM_PARSE = True
+# Content-Length（可能是压缩后的长度）小于该值的响应仍整页读取：先查解析结果复用
+# （services.parse_memo），命中时跳过解析；流式解析在下载的同时已经完成，复用只省内存
+GRADES_STREAM_MIN_BYTES = 32 * 1024
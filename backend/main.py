@@ -2,13 +2,19 @@
 北师大教务课表成绩 App - FastAPI 后端入口
 """
 
+import math
 import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from routers import auth, schedule, grades, exams, semester
+from services import metrics, session_manager
+from services.disk_cache import close_disk_cache
+from services.rate_limit import RateLimitExceeded
+from services.upstream import SessionExpired
 
 # 配置日志
 logging.basicConfig(
@@ -21,7 +27,10 @@ logging.basicConfig(
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     logging.info("🚀 BNU Schedule API 启动")
+    await session_manager.startup_sessions()
     yield
+    await session_manager.shutdown_sessions()
+    await close_disk_cache()
     logging.info("🛑 BNU Schedule API 关闭")
 
 
@@ -41,6 +50,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
+    """上游限流排队过深 → 429，提示客户端稍后重试"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "请求过于频繁，请稍后重试"},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
+@app.exception_handler(SessionExpired)
+async def session_expired_handler(request: Request, exc: SessionExpired):
+    """数据接口返回登录页（上游会话已失效）→ 401，与会话过期的提示相同"""
+    return JSONResponse(status_code=401, content={"detail": "会话已过期，请重新登录"})
+
+
 # 注册路由
 app.include_router(auth.router)
 app.include_router(schedule.router)
@@ -63,6 +89,12 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/stats")
+async def stats():
+    """运行指标（限流、缓存、排队等）"""
+    return metrics.collect()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True,
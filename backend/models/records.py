@@ -0,0 +1,208 @@
+"""
+内部数据记录
+
+解析器、解析结果复用（services.parse_memo）和响应缓存（services.cache）使用的轻量记录：
+slots dataclass，构造时不做校验，每个实例没有 __dict__ 和 pydantic 的额外状态。
+字段与 models.schemas 中同名的响应模型一一对应（顺序相同），只在序列化时转换：
+
+  - to_json()：直接输出 JSON 字节，与对应响应模型的 model_dump_json() 逐字节一致
+    （compact=True 对应序列化上下文 {"compact": True}，课表周次输出为 weeks_mask）
+  - from_json()：从上述 JSON 读回（磁盘缓存层）
+  - 路由未命中缓存而直接返回记录时，由 FastAPI 按 response_model 转换
+
+tests/test_records.py 核对每个记录与响应模型的字段名和顺序，并用一份样例数据
+比较两边的 JSON 输出：只改了一边时测试失败，而不是悄悄输出不同的结果。
+"""
+
+from dataclasses import dataclass, field
+
+import pydantic_core
+from pydantic import TypeAdapter
+
+from utils.weeks import has_week, iter_weeks, to_mask
+
+
+def _dumps(obj) -> bytes:
+    # 与 pydantic 模型的 JSON 输出一致（NaN / Infinity 输出为 null）
+    return pydantic_core.to_json(obj, inf_nan_mode="null")
+
+
+# 字段与响应模型完全相同的记录：按 dataclass 字段生成的序列化器直接输出（不校验）
+_adapters: dict[type, TypeAdapter] = {}
+
+
+def _dump_dataclass(obj) -> bytes:
+    adapter = _adapters.get(type(obj))
+    if adapter is None:
+        adapter = _adapters[type(obj)] = TypeAdapter(type(obj))
+    return adapter.dump_json(obj)
+
+
+# ============ 课表 ============
+
+@dataclass(slots=True)
+class ScheduleSlotRecord:
+    """课表中的一个时间段（对应 ScheduleSlot）"""
+    weeks_mask: int            # 上课周次位掩码（utils.weeks）
+    day_of_week: int
+    start_section: int
+    end_section: int
+    classroom: str
+    capacity: int = 0
+
+    @property
+    def weeks(self) -> list[int]:
+        return list(iter_weeks(self.weeks_mask))
+
+    def has_week(self, week: int) -> bool:
+        """第 week 周是否上课"""
+        return has_week(self.weeks_mask, week)
+
+    def to_dict(self, compact: bool = False) -> dict:
+        data = {"weeks_mask": self.weeks_mask} if compact else {"weeks": self.weeks}
+        data["day_of_week"] = self.day_of_week
+        data["start_section"] = self.start_section
+        data["end_section"] = self.end_section
+        data["classroom"] = self.classroom
+        data["capacity"] = self.capacity
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ScheduleSlotRecord":
+        weeks_mask = data["weeks_mask"] if "weeks_mask" in data else to_mask(data["weeks"])
+        return cls(weeks_mask, data["day_of_week"], data["start_section"],
+                   data["end_section"], data["classroom"], data.get("capacity", 0))
+
+
+@dataclass(slots=True)
+class CourseRecord:
+    """课程信息（对应 Course）"""
+    course_id: str
+    course_name: str
+    total_hours: int = 0
+    credits: float = 0.0
+    class_number: str = ""
+    teachers: list[str] = field(default_factory=list)
+    slots: list[ScheduleSlotRecord] = field(default_factory=list)
+    course_type: str = ""
+    is_minor: str = ""
+    raw_time_location: str = ""
+
+    def to_dict(self, compact: bool = False) -> dict:
+        return {
+            "course_id": self.course_id,
+            "course_name": self.course_name,
+            "total_hours": self.total_hours,
+            "credits": self.credits,
+            "class_number": self.class_number,
+            "teachers": self.teachers,
+            "slots": [slot.to_dict(compact) for slot in self.slots],
+            "course_type": self.course_type,
+            "is_minor": self.is_minor,
+            "raw_time_location": self.raw_time_location,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CourseRecord":
+        data = dict(data)
+        data["slots"] = [ScheduleSlotRecord.from_dict(s) for s in data.get("slots", ())]
+        return cls(**data)
+
+
+@dataclass(slots=True)
+class ScheduleRecord:
+    """课表（对应 ScheduleResponse）"""
+    semester_label: str = ""
+    student_id: str = ""
+    student_name: str = ""
+    class_name: str = ""
+    total_courses: int = 0
+    total_credits: float = 0.0
+    courses: list[CourseRecord] = field(default_factory=list)
+
+    def to_json(self, compact: bool = False) -> bytes:
+        return _dumps({
+            "semester_label": self.semester_label,
+            "student_id": self.student_id,
+            "student_name": self.student_name,
+            "class_name": self.class_name,
+            "total_courses": self.total_courses,
+            "total_credits": self.total_credits,
+            "courses": [course.to_dict(compact) for course in self.courses],
+        })
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "ScheduleRecord":
+        obj = pydantic_core.from_json(data)
+        obj["courses"] = [CourseRecord.from_dict(c) for c in obj.get("courses", ())]
+        return cls(**obj)
+
+
+# ============ 成绩 ============
+
+@dataclass(slots=True)
+class GradeRecord:
+    """成绩记录（对应 Grade）"""
+    semester: str = ""
+    course_id: str = ""
+    course_name: str = ""
+    score: str = ""
+    credits: float = 0.0
+    total_hours: int = 0
+    gpa_point: float = 0.0
+    exam_type: str = ""
+    course_category: str = ""
+    course_nature: str = ""
+    regular_score: str = ""
+    final_score: str = ""
+    study_type: str = ""
+    remark: str = ""
+
+
+@dataclass(slots=True)
+class GradesRecord:
+    """成绩列表（对应 GradesResponse）"""
+    grades: list[GradeRecord] = field(default_factory=list)
+    semester_gpa: float = 0.0
+    total_gpa: float = 0.0
+    total_credits: float = 0.0
+
+    def to_json(self, compact: bool = False) -> bytes:
+        return _dump_dataclass(self)
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "GradesRecord":
+        obj = pydantic_core.from_json(data)
+        obj["grades"] = [GradeRecord(**g) for g in obj.get("grades", ())]
+        return cls(**obj)
+
+
+# ============ 考试 ============
+
+@dataclass(slots=True)
+class ExamRecord:
+    """考试安排（对应 Exam）"""
+    course_name: str = ""
+    credits: str = ""
+    category: str = ""
+    exam_type: str = ""
+    exam_time: str = ""
+    exam_location: str = ""
+    seat_number: str = ""
+    exam_round: str = ""
+
+
+@dataclass(slots=True)
+class ExamsRecord:
+    """考试安排列表（对应 ExamsResponse）"""
+    exams: list[ExamRecord] = field(default_factory=list)
+
+    def to_json(self, compact: bool = False) -> bytes:
+        return _dump_dataclass(self)
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "ExamsRecord":
+        obj = pydantic_core.from_json(data)
+        obj["exams"] = [ExamRecord(**e) for e in obj.get("exams", ())]
+        return cls(**obj)
+
@@ -4,7 +4,15 @@ Pydantic 数据模型
 
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import (
+    BaseModel,
+    Field,
+    computed_field,
+    model_serializer,
+    model_validator,
+)
+
+from utils.weeks import has_week, iter_weeks, to_mask
 
 
 # ============ 请求模型 ============
@@ -36,14 +44,47 @@ class LoginResponse(BaseModel):
 
 
 class ScheduleSlot(BaseModel):
-    """课表中的一个时间段"""
-    weeks: list[int]           # 上课周次列表，如 [1,2,3,8]
+    """
+    课表中的一个时间段
+
+    周次在内部以位掩码保存（utils.weeks）。默认输出周次列表 weeks；
+    序列化上下文 {"compact": True} 时改为输出 weeks_mask（第 n 位 = 第 n 周）。
+    """
+    weeks_mask: int = Field(0, exclude=True)  # 上课周次位掩码
     day_of_week: int           # 星期几 (1=周一, 7=周日)
     start_section: int         # 起始节次
     end_section: int           # 结束节次
     classroom: str             # 教室
     capacity: int = 0          # 教室容量
 
+    @model_validator(mode="before")
+    @classmethod
+    def _weeks_from_list(cls, data):
+        # 按周次列表构造（如磁盘缓存中的 JSON）
+        if isinstance(data, dict) and "weeks" in data:
+            data = dict(data)
+            data["weeks_mask"] = to_mask(data.pop("weeks"))
+        return data
+
+    @computed_field
+    @property
+    def weeks(self) -> list[int]:
+        """上课周次列表，如 [1,2,3,8]"""
+        return list(iter_weeks(self.weeks_mask))
+
+    def has_week(self, week: int) -> bool:
+        """第 week 周是否上课"""
+        return has_week(self.weeks_mask, week)
+
+    @model_serializer(mode="wrap")
+    def _serialize(self, handler, info):
+        data = handler(self)
+        weeks = data.pop("weeks")
+        if info.context and info.context.get("compact"):
+            return {"weeks_mask": self.weeks_mask, **data}
+        # 与原先的字段顺序一致
+        return {"weeks": weeks, **data}
+
 
 class Course(BaseModel):
     """课程信息"""
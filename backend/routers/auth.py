@@ -2,26 +2,48 @@
 认证路由
 """
 
+import math
 from datetime import datetime, timedelta
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from jose import jwt
 
 from config import JWT_SECRET_KEY, JWT_ALGORITHM, JWT_EXPIRE_MINUTES
 from models.schemas import LoginRequest, LoginResponse
+from services.login_pool import LoginQueueFull
 from services.session_manager import get_or_create_session, invalidate_session
 
 router = APIRouter(prefix="/api/auth", tags=["认证"])
 
 
 @router.post("/login", response_model=LoginResponse)
-async def login(req: LoginRequest):
-    """用户登录"""
-    auth_service, error_msg = get_or_create_session(req.student_id, req.password)
+async def login(req: LoginRequest, response: Response):
+    """
+    用户登录
+
+    响应头 X-Login-Queue-Position / X-Login-Queue-Wait：本次登录入队时的位置
+    （0 = 没有排队）和排队秒数
+    """
+    try:
+        auth_service, error_msg, wait = await get_or_create_session(req.student_id, req.password)
+    except LoginQueueFull as e:
+        # 登录排队：返回排队位置和预计等待时间，客户端稍后重试
+        eta = max(1, math.ceil(e.eta))
+        raise HTTPException(
+            status_code=503,
+            detail=f"{e}，前方约 {e.position} 人，预计 {eta} 秒后重试",
+            headers={
+                "Retry-After": str(eta),
+                "X-Login-Queue-Position": str(e.position),
+            },
+        )
     
     if not auth_service:
         raise HTTPException(status_code=401, detail=error_msg or "登录失败，请检查学号和密码")
     
+    response.headers["X-Login-Queue-Position"] = str(wait.position)
+    response.headers["X-Login-Queue-Wait"] = f"{wait.waited:.1f}"
+    
     # 生成 JWT token
     expire = datetime.utcnow() + timedelta(minutes=JWT_EXPIRE_MINUTES)
     payload = {
@@ -41,5 +63,5 @@ async def login(req: LoginRequest):
 @router.post("/logout")
 async def logout(student_id: str):
     """用户登出"""
-    invalidate_session(student_id)
+    await invalidate_session(student_id)
     return {"message": "已登出"}
@@ -1,12 +1,17 @@
 """
-路由依赖项：JWT 认证和 session 获取
+路由依赖项：JWT 认证和 session 获取，以及缓存相关的响应头
 """
 
+import math
+import time
 import logging
-from fastapi import Header, HTTPException
+from typing import Optional
+
+from fastapi import Header, HTTPException, Response
 from jose import jwt, JWTError
 
 from config import JWT_SECRET_KEY, JWT_ALGORITHM
+from services.cache import CacheLookup, compact_json
 from services.session_manager import get_cached_session
 
 logger = logging.getLogger(__name__)
@@ -35,7 +40,7 @@ async def get_current_session(authorization: str = Header(...)):
     
     # 获取缓存的 session
     logger.info(f"获取缓存 session: student_id={student_id}")
-    auth_service = get_cached_session(student_id)
+    auth_service = await get_cached_session(student_id)
     if not auth_service:
         logger.warning(f"未找到缓存 session: {student_id}")
         raise HTTPException(status_code=401, detail="会话已过期，请重新登录")
@@ -53,3 +58,64 @@ async def get_current_session(authorization: str = Header(...)):
         "session": session,
         "auth_service": auth_service,
     }
+
+
+def cache_response(response: Response, lookup: CacheLookup,
+                   if_none_match: Optional[str] = None,
+                   compact: bool = False) -> Optional[Response]:
+    """
+    设置缓存相关响应头，并直接用缓存条目构造响应。
+
+    - X-Cache: HIT / STALE / MISS；Age: 缓存数据的秒数
+      （STALE 表示返回的是旧数据，新数据正在后台刷新，稍后再请求即可拿到）
+    - ETag: 内容哈希；Cache-Control: private, no-cache（客户端每次带 If-None-Match 校验）
+
+    If-None-Match 与当前 ETag 一致时返回 304；否则返回携带缓存中已序列化 JSON 字节的
+    响应（跳过 response_model 的校验和序列化）。结果未进入缓存时响应为 no-store、
+    不带 ETag 并返回 None，由路由按常规方式返回模型。
+
+    条目只是上游失败后的退避占位（CacheEntry.placeholder，没有真实数据）时返回 503，
+    X-Cache: BACKOFF，Retry-After 为剩余的退避秒数，客户端不会把它当成"没有数据"。
+
+    compact=True 时返回紧凑格式（services.cache.compact_json），ETag 与默认格式不同；
+    结果未进入缓存时也直接返回紧凑格式的响应。
+    """
+    entry = lookup.entry
+    if entry is not None and entry.placeholder:
+        retry_after = max(1, math.ceil(entry.expires_at - time.time()))
+        raise HTTPException(
+            status_code=503,
+            detail="教务系统暂时无法访问，请稍后重试",
+            headers={"X-Cache": "BACKOFF", "Retry-After": str(retry_after),
+                     "Cache-Control": "no-store"},
+        )
+    response.headers["X-Cache"] = lookup.status
+    response.headers["Age"] = str(int(lookup.age))
+    if entry is None:
+        # 结果未进入缓存，客户端不应缓存或据此校验
+        response.headers["Cache-Control"] = "no-store"
+        if compact:
+            return Response(content=compact_json(lookup.value),
+                            media_type="application/json",
+                            headers=dict(response.headers))
+        return None
+    etag = entry.compact_etag if compact else entry.etag
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    headers = dict(response.headers)
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    body = entry.compact_body if compact else entry.json_body
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
@@ -2,23 +2,30 @@
 考试安排路由
 """
 
-from fastapi import APIRouter, Depends, Query
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, Query, Response
 
 from models.schemas import ExamsResponse
-from services.exams import fetch_exams
-from routers.deps import get_current_session
+from services.exams import lookup_exams
+from routers.deps import get_current_session, cache_response
 
 router = APIRouter(prefix="/api", tags=["考试"])
 
 
 @router.get("/exams", response_model=ExamsResponse)
 async def get_exams(
+    response: Response,
     year: int = Query(0, description="学年起始年份，0=当前"),
     semester: int = Query(-1, description="学期：-1=当前, 0=秋季, 1=春季"),
+    if_none_match: Optional[str] = Header(None),
     session_info=Depends(get_current_session),
 ):
     """获取考试安排"""
     session = session_info["session"]
     student_id = session_info["student_id"]
-    result = fetch_exams(session, student_id=student_id, year=year, semester=semester)
-    return result
+    lookup = await lookup_exams(session, student_id=student_id, year=year, semester=semester)
+    cached = cache_response(response, lookup, if_none_match)
+    if cached is not None:
+        return cached
+    return lookup.value
@@ -2,17 +2,21 @@
 成绩路由
 """
 
-from fastapi import APIRouter, Depends
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, Response
 
 from models.schemas import GradesResponse
-from services.grades import fetch_grades
-from routers.deps import get_current_session
+from services.grades import lookup_grades
+from routers.deps import get_current_session, cache_response
 
 router = APIRouter(prefix="/api", tags=["成绩"])
 
 
 @router.get("/grades", response_model=GradesResponse)
-async def get_grades(year: int = 0, year_end: int = 0, semester: int = -1,
+async def get_grades(response: Response,
+                     year: int = 0, year_end: int = 0, semester: int = -1,
+                     if_none_match: Optional[str] = Header(None),
                      session_info=Depends(get_current_session)):
     """
     获取成绩
@@ -24,6 +28,9 @@ async def get_grades(year: int = 0, year_end: int = 0, semester: int = -1,
     session = session_info["session"]
     student_id = session_info["student_id"]
     
-    result = fetch_grades(session, student_id=student_id,
-                          year=year, year_end=year_end, semester=semester)
-    return result
+    lookup = await lookup_grades(session, student_id=student_id,
+                                 year=year, year_end=year_end, semester=semester)
+    cached = cache_response(response, lookup, if_none_match)
+    if cached is not None:
+        return cached
+    return lookup.value
@@ -2,29 +2,40 @@
 课表路由
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 
 from models.schemas import ScheduleResponse
-from services.schedule import fetch_schedule
-from routers.deps import get_current_session
+from services.schedule import lookup_schedule
+from routers.deps import get_current_session, cache_response
 
 router = APIRouter(prefix="/api", tags=["课表"])
 
 
 @router.get("/schedule", response_model=ScheduleResponse)
-async def get_schedule(year: int = 2025, semester: int = 1,
+async def get_schedule(response: Response,
+                       year: int = 2025, semester: int = 1,
+                       compact: bool = False,
+                       if_none_match: Optional[str] = Header(None),
                        session_info=Depends(get_current_session)):
     """
     获取课表
     
     - year: 学年起始年份，如 2025
     - semester: 0=秋季, 1=春季
+    - compact: 为 true 时上课周次以位掩码 weeks_mask（第 n 位 = 第 n 周）
+      代替列表 weeks 返回
     """
     session = session_info["session"]
     student_id = session_info["student_id"]
     
-    result = fetch_schedule(session, student_id=student_id,
-                            year=year, semester=semester)
+    lookup = await lookup_schedule(session, student_id=student_id,
+                                   year=year, semester=semester)
+    cached = cache_response(response, lookup, if_none_match, compact)
+    if cached is not None:
+        return cached
+    result = lookup.value
     
     if not result.courses:
         # 可能是 token 过期或无数据
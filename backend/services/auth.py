@@ -11,55 +11,76 @@ onevpn 统一身份认证登录服务
 """
 
 import re
+import time
 import random
 import logging
 from typing import Optional
 from urllib.parse import urljoin
 
-import requests
 from bs4 import BeautifulSoup
 
 from config import (
     WEBVPN_HOST,
     WEBVPN_LOGIN_URL,
-    DEFAULT_HEADERS,
     HOME_PATH,
     SCHEDULE_DATA_PATH,
     vpn_url,
     cas_vpn_url,
 )
+from services.rate_limit import RateLimitExceeded
+from services.schedule import seed_schedule
+from services.upstream import (
+    UpstreamClient,
+    UpstreamTimeout,
+    UpstreamConnectionError,
+    is_login_page,
+)
 from utils.cas_des import str_enc
 
 logger = logging.getLogger(__name__)
 
+# ensure_logged_in 的结果
+SESSION_VALID = "valid"
+SESSION_DEAD = "dead"          # 被重定向到登录 / CAS 页面：会话确实已失效
+SESSION_UNKNOWN = "unknown"    # 网络错误、5xx 等：无法判断，会话保持原状，稍后再验证
+
 
 class AuthService:
     """onevpn 登录认证服务"""
     
     def __init__(self):
-        self.session: Optional[requests.Session] = None
+        self.session: Optional[UpstreamClient] = None
         self.student_id: str = ""
         self.student_name: str = ""
         self.class_name: str = ""
-        self.is_logged_in: bool = False
+        self.is_logged_in = False
+        self.verified_at: float = 0.0  # 上次确认 session 有效的时间
+
+    @property
+    def is_logged_in(self) -> bool:
+        """已登录，且数据接口没有发现会话失效（UpstreamClient.expired）"""
+        return self._logged_in and not (self.session is not None and self.session.expired)
+
+    @is_logged_in.setter
+    def is_logged_in(self, value: bool):
+        self._logged_in = value
     
-    def login(self, student_id: str, password: str) -> dict:
+    async def login(self, student_id: str, password: str) -> dict:
         """
         登录 onevpn 统一身份认证（两步流程）
         
         Returns:
             dict: {"success": bool, "message": str, "name": str, "class_name": str}
         """
-        self.session = requests.Session()
-        self.session.headers.update(DEFAULT_HEADERS)
+        self.session = UpstreamClient(limit_key=student_id)
         self.student_id = student_id
         
         try:
             # ── Step 1: 获取 CAS 登录页面 ──
             logger.info("正在获取 CAS 登录页面...")
-            resp = self.session.get(WEBVPN_LOGIN_URL, timeout=15)
+            resp = await self.session.get(WEBVPN_LOGIN_URL, timeout=15)
             resp.raise_for_status()
-            cas_page_url = resp.url  # 记住 CAS 页面的完整 URL
+            cas_page_url = str(resp.url)  # 记住 CAS 页面的完整 URL
             
             soup = BeautifulSoup(resp.text, "lxml")
             lt = self._get_input_value(soup, "lt")
@@ -106,7 +127,7 @@ class AuthService:
             }
             
             logger.info("正在调用 secondAuth 预验证...")
-            resp_sa = self.session.post(
+            resp_sa = await self.session.post(
                 second_auth_url,
                 data=second_auth_data,
                 headers=second_auth_headers,
@@ -161,7 +182,7 @@ class AuthService:
                 "Referer": cas_page_url,
             }
             
-            resp = self.session.post(
+            resp = await self.session.post(
                 login_url,
                 data=login_data,
                 headers=post_headers,
@@ -174,9 +195,9 @@ class AuthService:
                 self.is_logged_in = True
                 
                 # ── Step 7: 触发教务系统 CAS SSO ──
-                self._establish_edu_session()
+                await self._establish_edu_session()
                 
-                self._fetch_user_info()
+                await self._fetch_user_info()
                 logger.info(f"登录成功：{self.student_name or self.student_id}")
                 return {
                     "success": True,
@@ -189,9 +210,11 @@ class AuthService:
                 logger.warning(f"登录失败：{error_msg}")
                 return {"success": False, "message": error_msg}
         
-        except requests.Timeout:
+        except RateLimitExceeded:
+            return {"success": False, "message": "请求过于频繁，请稍后重试"}
+        except UpstreamTimeout:
             return {"success": False, "message": "连接超时，请稍后重试"}
-        except requests.ConnectionError:
+        except UpstreamConnectionError:
             return {"success": False, "message": "网络连接失败"}
         except Exception as e:
             logger.exception("登录过程中发生异常")
@@ -205,9 +228,9 @@ class AuthService:
             return inp.get("value", "")
         return ""
     
-    def _check_login_success(self, resp: requests.Response) -> bool:
+    def _check_login_success(self, resp) -> bool:
         """检查登录是否成功"""
-        cookies = self.session.cookies.get_dict()
+        cookies = self.session.cookie_names()
         
         # 1. 检查是否有 VPN ticket cookie
         has_vpn_ticket = any(
@@ -216,8 +239,9 @@ class AuthService:
         )
         
         # 2. 检查是否还在 CAS 登录页
-        is_at_cas_login = "/cas/login" in resp.url or (
-            "/login" in resp.url and "ticket" not in resp.url
+        final_url = str(resp.url)
+        is_at_cas_login = "/cas/login" in final_url or (
+            "/login" in final_url and "ticket" not in final_url
         )
         
         # 3. 检查页面中的失败标志
@@ -240,7 +264,7 @@ class AuthService:
         
         return not is_at_cas_login
     
-    def _extract_error_message(self, resp: requests.Response) -> str:
+    def _extract_error_message(self, resp) -> str:
         """从响应中提取错误信息"""
         soup = BeautifulSoup(resp.text, "lxml")
         
@@ -264,18 +288,21 @@ class AuthService:
         
         return "登录失败，请检查学号和密码"
     
-    def _establish_edu_session(self):
+    async def _establish_edu_session(self):
         """触发教务系统 CAS SSO，建立 JSESSIONID"""
         try:
             edu_root = vpn_url("")
             logger.info(f"正在触发教务系统 SSO: {edu_root}")
-            resp = self.session.get(edu_root, timeout=15, allow_redirects=True)
-            logger.info(f"教务系统 SSO 完成, final URL: {resp.url[:80]}, length: {len(resp.text)}")
+            resp = await self.session.get(edu_root, timeout=15, allow_redirects=True)
+            logger.info(f"教务系统 SSO 完成, final URL: {str(resp.url)[:80]}, length: {len(resp.text)}")
         except Exception as e:
             logger.warning(f"教务系统 SSO 失败: {e}")
     
-    def _fetch_user_info(self):
-        """登录成功后从课表数据页面获取用户信息（只查当前学期，速度优先）"""
+    async def _fetch_user_info(self):
+        """
+        登录成功后从课表数据页面获取用户信息（只查当前学期，速度优先），
+        同时用该页面预填课表缓存
+        """
         try:
             import base64
             from datetime import datetime
@@ -287,17 +314,24 @@ class AuthService:
             params_b64 = base64.b64encode(params_raw.encode()).decode()
             url = vpn_url(f"{SCHEDULE_DATA_PATH}?params={params_b64}")
             referer = vpn_url("frame/homes.html")
-            resp = self.session.get(url, timeout=10, 
-                                   headers={"Referer": referer})
-            resp.encoding = "gbk"
+            resp = await self.session.get(url, timeout=10,
+                                         headers={"Referer": referer},
+                                         encoding="gbk")
             
             if resp.status_code == 200 and len(resp.text) > 3000:
-                m = re.search(r'姓名[：:]\s*([^\s<,，]+)', resp.text)
-                if m:
-                    self.student_name = m.group(1)
-                m = re.search(r'所在班级[：:]\s*(.+?)(?:\s*</)', resp.text, re.DOTALL)
-                if m:
-                    self.class_name = m.group(1)
+                # 这就是 App 登录后首先请求的当前学期课表：解析后写入课表缓存
+                schedule = await seed_schedule(self.student_id, year, sem, resp)
+                if schedule is not None:
+                    self.student_name = schedule.student_name
+                    self.class_name = schedule.class_name
+                if not self.student_name:
+                    m = re.search(r'姓名[：:]\s*([^\s<,，]+)', resp.text)
+                    if m:
+                        self.student_name = m.group(1)
+                if not self.class_name:
+                    m = re.search(r'所在班级[：:]\s*(.+?)(?:\s*</)', resp.text, re.DOTALL)
+                    if m:
+                        self.class_name = m.group(1)
                 if self.student_name:
                     logger.info(f"用户信息：{self.student_name}, {self.class_name}")
                     return
@@ -306,33 +340,75 @@ class AuthService:
         except Exception as e:
             logger.warning(f"获取用户信息失败: {e}")
     
-    def get_session(self) -> Optional[requests.Session]:
+    def to_record(self, last_active: float) -> dict:
+        """序列化为会话存储记录（不含密码）"""
+        return {
+            "student_id": self.student_id,
+            "student_name": self.student_name,
+            "class_name": self.class_name,
+            "is_logged_in": self.is_logged_in,
+            "verified_at": self.verified_at,
+            "last_active": last_active,
+            "cookies": self.session.export_cookies() if self.session else [],
+        }
+    
+    @classmethod
+    def from_record(cls, record: dict) -> "AuthService":
+        """从会话存储记录恢复（重建上游客户端和 cookie jar）"""
+        service = cls()
+        service.student_id = record.get("student_id", "")
+        service.student_name = record.get("student_name", "")
+        service.class_name = record.get("class_name", "")
+        service.is_logged_in = record.get("is_logged_in", False)
+        service.verified_at = record.get("verified_at", 0.0)
+        service.session = UpstreamClient(limit_key=service.student_id)
+        service.session.import_cookies(record.get("cookies", []))
+        return service
+    
+    def get_session(self) -> Optional[UpstreamClient]:
         """获取已登录的 session"""
         if self.is_logged_in and self.session:
             return self.session
         return None
     
-    def ensure_logged_in(self) -> bool:
-        """检查 session 是否仍有效"""
+    async def ensure_logged_in(self) -> str:
+        """
+        检查 session 是否仍有效，返回 SESSION_VALID / SESSION_DEAD / SESSION_UNKNOWN。
+
+        只有被重定向到登录 / CAS 页面（或直接返回 CAS 登录页）才判定为失效；
+        网络错误、超时、5xx 等无法说明会话状态，返回 SESSION_UNKNOWN，会话保持不变。
+        """
         if not self.session or not self.is_logged_in:
-            return False
+            return SESSION_DEAD
         
         try:
             home_url = vpn_url(HOME_PATH)
-            resp = self.session.get(home_url, timeout=10, allow_redirects=False)
-            
-            if resp.status_code == 302:
-                location = resp.headers.get("Location", "")
-                if "login" in location.lower() or "cas" in location.lower():
-                    self.is_logged_in = False
-                    return False
-            
-            # 如果返回的是 CAS 登录页，也判定为失效
-            if resp.status_code == 200 and "统一身份认证" in resp.text[:1000]:
+            resp = await self.session.get(home_url, timeout=10, allow_redirects=False)
+        except RateLimitExceeded:
+            # 未能发出验证请求，不能据此判定 session 失效
+            raise
+        except Exception as e:
+            logger.info(f"验证 session 时请求失败，稍后重试: {self.student_id}: {e!r}")
+            return SESSION_UNKNOWN
+        
+        if resp.status_code == 302:
+            location = resp.headers.get("Location", "")
+            if "login" in location.lower() or "cas" in location.lower():
                 self.is_logged_in = False
-                return False
-            
-            return resp.status_code == 200
-        except Exception:
+                return SESSION_DEAD
+        
+        # 如果返回的是 CAS 登录页，也判定为失效
+        if resp.status_code == 200 and is_login_page(resp.text):
             self.is_logged_in = False
-            return False
+            return SESSION_DEAD
+        
+        if resp.status_code != 200:
+            return SESSION_UNKNOWN
+        self.verified_at = time.time()
+        return SESSION_VALID
+    
+    async def close(self):
+        """关闭底层上游连接"""
+        self.is_logged_in = False
+        if self.session and not self.session.is_closed:
+            await self.session.aclose()
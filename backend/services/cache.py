@@ -0,0 +1,491 @@
+"""
+响应缓存（TTL + LRU）
+
+课表、成绩、考试的解析结果统一缓存在这里，每类数据一个命名空间：
+  - 各命名空间独立的 TTL（课表变化少可以长一些，考试安排短一些）
+  - 可选 fresh_ttl（stale-while-revalidate）：超过 fresh_ttl 但未到 ttl 的条目为"陈旧"，
+    调用方可以先返回旧数据、再在后台刷新
+  - 按条目数和估算字节数做 LRU 淘汰
+  - key 为元组且第一个元素是学号，可按学号整体失效
+  - 负缓存：确实为空的结果以短 TTL 缓存（aset_empty）；上游失败/被限流时
+    record_failure 按 key 指数退避，退避期内不再向上游重试
+  - 每个条目保存序列化好的 JSON 字节（body，与模型一起替换/失效）和其内容哈希
+    （ETag，跨进程/重启稳定）：路由命中时直接返回这些字节，或对 If-None-Match 返回 304，
+    不再经过 response_model 校验和序列化；紧凑格式（compact_json）的字节按需生成
+  - 统计命中 / 未命中 / 过期 / 淘汰次数（/stats）
+  - 指定 model（models.records 中的记录类，提供 from_json）的命名空间写透到磁盘层（services.disk_cache），
+    内存未命中时从磁盘读回（JSON 字节直接作为响应体，记录用到时才解码），重启后依然有效；
+    异步接口 aget / aset 包含磁盘层
+"""
+
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from config import (
+    CACHE_MAX_ENTRIES, CACHE_MAX_BYTES,
+    CACHE_TTL_EMPTY, CACHE_FAILURE_BACKOFF_BASE, CACHE_FAILURE_BACKOFF_MAX,
+)
+from services import metrics
+from services.disk_cache import get_disk_cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    stored_at: float
+    expires_at: float
+    size: int
+    digest: str = ""
+    # 序列化好的 JSON 响应体（与 FastAPI 对 response_model 的输出逐字节一致）
+    body: Optional[bytes] = field(default=None, repr=False)
+    # 由本条目派生的数据（如成绩按学期切片），随条目一起替换/失效
+    derived: dict = field(default_factory=dict, repr=False)
+    # 紧凑格式的 JSON 响应体（有客户端请求时才生成，不计入 size）
+    compact: Optional[bytes] = field(default=None, repr=False)
+    # 上游失败时的占位条目（record_failure）：不是真实数据，路由返回 503 + Retry-After
+    placeholder: bool = False
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+    @property
+    def json_body(self) -> bytes:
+        """JSON 响应体，首次访问时序列化并保存"""
+        if self.body is None:
+            self.body = _to_json_bytes(self.value)
+        return self.body
+
+    @property
+    def etag(self) -> str:
+        """内容哈希（强 ETag），首次访问时计算并保存"""
+        if not self.digest:
+            self.digest = content_digest(self.json_body)
+        return f'"{self.digest}"'
+
+    @property
+    def compact_body(self) -> bytes:
+        """紧凑格式的 JSON 响应体（见 compact_json），首次访问时序列化并保存"""
+        if self.compact is None:
+            self.compact = compact_json(self.value)
+        return self.compact
+
+    @property
+    def compact_etag(self) -> str:
+        """紧凑格式的 ETag：由同一内容哈希派生，与默认格式的 ETag 不同"""
+        return self.etag[:-1] + '-c"'
+
+
+class DiskCacheEntry(CacheEntry):
+    """
+    从磁盘层读回的条目：JSON 字节直接作为响应体和 ETag 的来源，
+    记录（value）在第一次被访问时才解码——命中后直接返回字节的路由用不到它
+    """
+
+    def __init__(self, model: type, **kwargs):
+        self._model = model
+        self._value = None
+        super().__init__(value=None, **kwargs)
+
+    @property
+    def value(self) -> Any:
+        if self._value is None:
+            self._value = self._model.from_json(self.body)
+        return self._value
+
+    @value.setter
+    def value(self, value: Any):
+        self._value = value
+
+
+class CacheLookup:
+    """带缓存状态的查询结果：status 为 HIT / STALE / MISS；未给出 value 时取自 entry"""
+
+    def __init__(self, value: Any = None, status: str = "MISS",
+                 entry: Optional[CacheEntry] = None):
+        self._value = value
+        self.status = status
+        self.entry = entry
+
+    @property
+    def value(self) -> Any:
+        if self._value is None and self.entry is not None:
+            return self.entry.value
+        return self._value
+
+    @property
+    def age(self) -> float:
+        return self.entry.age if self.entry and self.status != "MISS" else 0.0
+
+    @property
+    def etag(self) -> str:
+        return self.entry.etag if self.entry else ""
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=12).hexdigest()
+
+
+def _to_json_bytes(value: Any, compact: bool = False) -> bytes:
+    # models.records 中的记录自带序列化；pydantic 模型通过序列化上下文选择格式
+    if hasattr(value, "to_json"):
+        return value.to_json(compact)
+    if hasattr(value, "model_dump_json"):
+        context = COMPACT_CONTEXT if compact else None
+        return value.model_dump_json(context=context).encode("utf-8")
+    return repr(value).encode("utf-8")
+
+
+# 序列化上下文：模型据此输出紧凑格式（如课表周次输出为位掩码 weeks_mask）
+COMPACT_CONTEXT = {"compact": True}
+
+
+def compact_json(value: Any) -> bytes:
+    """紧凑格式的 JSON 字节"""
+    return _to_json_bytes(value, compact=True)
+
+
+class ResponseCache:
+    """单个命名空间的 TTL + LRU 缓存"""
+
+    def __init__(self, namespace: str, ttl: float,
+                 max_entries: int = CACHE_MAX_ENTRIES,
+                 max_bytes: int = CACHE_MAX_BYTES,
+                 sizer: Optional[Callable[[Any], int]] = None,
+                 model: Optional[type] = None,
+                 fresh_ttl: Optional[float] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.fresh_ttl = ttl if fresh_ttl is None else fresh_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizer = sizer
+        self._model = model
+        self._data: OrderedDict[Hashable, CacheEntry] = OrderedDict()
+        # 学号 → 该学号的所有 key，用于按学号失效
+        self._by_student: dict[str, set] = {}
+        self._bytes = 0
+        self.negative_ttl = min(CACHE_TTL_EMPTY, ttl)
+        # key → (连续失败次数, 退避截止时间)
+        self._failures: dict[Hashable, tuple[int, float]] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.stale_hits = 0
+        self.empty_stores = 0
+        self.failures = 0
+        self.backoff_skips = 0
+
+    @property
+    def _disk(self):
+        # 磁盘层在第一次读写时才打开：仅导入模块不会创建数据库文件
+        return get_disk_cache() if self._model is not None else None
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get_entry(key, count=False) is not None
+
+    def get_entry(self, key: Hashable, count: bool = True) -> Optional[CacheEntry]:
+        entry = self._data.get(key)
+        if entry is None:
+            if count:
+                self.misses += 1
+            return None
+        if entry.expires_at <= time.time():
+            self._remove(key)
+            self.expired += 1
+            if count:
+                self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        if count:
+            self.hits += 1
+        return entry
+
+    def get(self, key: Hashable) -> Any:
+        entry = self.get_entry(key)
+        return entry.value if entry else None
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        """条目是否仍在 fresh_ttl 内（否则为陈旧，应后台刷新）"""
+        return time.time() - entry.stored_at < self.fresh_ttl
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None,
+            size: Optional[int] = None) -> CacheEntry:
+        now = time.time()
+        body = None
+        if size is None:
+            size, body = self._measure(value)
+        entry = CacheEntry(
+            value=value,
+            stored_at=now,
+            expires_at=now + (self.ttl if ttl is None else ttl),
+            size=size,
+            body=body,
+        )
+        self._put_entry(key, entry)
+        self._failures.pop(key, None)
+        return entry
+
+    def _measure(self, value: Any) -> tuple[int, Optional[bytes]]:
+        """
+        估算缓存值大小，返回 (大小, JSON 字节)：默认按 JSON 长度计，
+        序列化结果直接作为条目的响应体保存，不必在响应时再序列化一次
+        """
+        if self._sizer is not None:
+            return self._sizer(value), None
+        body = _to_json_bytes(value)
+        return len(body), body
+
+    async def aget_entry(self, key: Hashable) -> Optional[CacheEntry]:
+        """内存 → 磁盘层查找；磁盘命中时放回内存（记录在用到时才解码）"""
+        entry = self.get_entry(key, count=False)
+        if entry is None and self._disk is not None:
+            try:
+                stored = await self._disk.get(self.namespace, key)
+            except Exception as e:
+                logger.warning(f"读取磁盘缓存失败 [{self.namespace}]: {e}")
+                stored = None
+            if stored is not None:
+                data, stored_at, expires_at = stored
+                entry = DiskCacheEntry(
+                    self._model,
+                    stored_at=stored_at,
+                    expires_at=expires_at,
+                    size=2 * len(data),
+                    digest=content_digest(data),
+                    body=data,
+                )
+                self._put_entry(key, entry)
+                self.disk_hits += 1
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def aget(self, key: Hashable) -> Any:
+        entry = await self.aget_entry(key)
+        return entry.value if entry else None
+
+    async def aset(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> CacheEntry:
+        """写入内存并写透到磁盘层"""
+        if self._disk is None:
+            return self.set(key, value, ttl)
+        data = _to_json_bytes(value)
+        # 内存中同时保存记录和 JSON 字节，按两倍 JSON 长度估算
+        entry = self.set(key, value, ttl, size=2 * len(data))
+        entry.body = data
+        entry.digest = content_digest(data)
+        try:
+            await self._disk.put(self.namespace, key, _student_of(key), data,
+                                 entry.stored_at, entry.expires_at)
+        except Exception as e:
+            logger.warning(f"写入磁盘缓存失败 [{self.namespace}]: {e}")
+        return entry
+
+    def _put_entry(self, key: Hashable, entry: CacheEntry):
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = entry
+        self._bytes += entry.size
+        student_id = _student_of(key)
+        if student_id:
+            self._by_student.setdefault(student_id, set()).add(key)
+        self._evict_over_limit()
+
+    def derive(self, key: Hashable, entry: CacheEntry, derived_key: Hashable,
+               build: Callable[[], Any]) -> CacheEntry:
+        """
+        取出（或用 build() 生成）挂在 key 的条目 entry 上的派生条目。
+        派生条目的 JSON 大小计入父条目的 size 和缓存总字节数，随父条目一起淘汰。
+        """
+        derived = entry.derived.get(derived_key)
+        if derived is not None:
+            return derived
+        value = build()
+        body = _to_json_bytes(value)
+        derived = entry.derived[derived_key] = CacheEntry(
+            value=value,
+            stored_at=entry.stored_at,
+            expires_at=entry.expires_at,
+            size=len(body),
+            body=body,
+            placeholder=entry.placeholder,
+        )
+        entry.size += derived.size
+        if self._data.get(key) is entry:
+            self._bytes += derived.size
+            self._evict_over_limit()
+        return derived
+
+    def invalidate(self, key: Hashable):
+        if key in self._data:
+            self._remove(key)
+        self._failures.pop(key, None)
+
+    def invalidate_student(self, student_id: str) -> int:
+        """删除某个学号的所有缓存，返回删除条数"""
+        keys = self._by_student.pop(student_id, set())
+        for key in keys:
+            if key in self._data:
+                self._remove(key)
+        for key in [k for k in self._failures if _student_of(k) == student_id]:
+            del self._failures[key]
+        return len(keys)
+
+    def clear(self):
+        self._data.clear()
+        self._by_student.clear()
+        self._failures.clear()
+        self._bytes = 0
+
+    def _remove(self, key: Hashable) -> CacheEntry:
+        entry = self._data.pop(key)
+        self._bytes -= entry.size
+        student_id = _student_of(key)
+        keys = self._by_student.get(student_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_student[student_id]
+        return entry
+
+    async def aset_empty(self, key: Hashable, value: Any) -> CacheEntry:
+        """缓存确实为空的结果（短 TTL），避免没有数据的用户每次打开都完整抓取一遍"""
+        self.empty_stores += 1
+        return await self.aset(key, value, ttl=self.negative_ttl)
+
+    def record_failure(self, key: Hashable, placeholder: Any) -> float:
+        """
+        记录一次上游失败/被限流，返回退避秒数（连续失败时指数增长）。
+
+        退避期内 lookup 不会为该 key 发起刷新：有旧数据时继续返回旧数据，
+        没有时把 placeholder（空结果）作为仅内存的占位条目（CacheEntry.placeholder）
+        缓存到退避结束。
+        成功写入（set / aset）后失败计数清零。
+        """
+        now = time.time()
+        count = self._failures.get(key, (0, 0.0))[0] + 1
+        delay = min(CACHE_FAILURE_BACKOFF_MAX,
+                    CACHE_FAILURE_BACKOFF_BASE * 2 ** min(count - 1, 16))
+        self._failures[key] = (count, now + delay)
+        self.failures += 1
+        entry = self.get_entry(key, count=False)
+        if entry is not None and entry.placeholder:
+            # 占位条目与退避同时结束（路由据此给出 Retry-After）
+            entry.expires_at = now + delay
+        elif entry is None:
+            size, body = self._measure(placeholder)
+            self._put_entry(key, CacheEntry(
+                value=placeholder,
+                stored_at=now,
+                expires_at=now + delay,
+                size=size,
+                body=body,
+                placeholder=True,
+            ))
+        if len(self._failures) > self.max_entries:
+            self._failures = {k: v for k, v in self._failures.items() if v[1] > now}
+        return delay
+
+    def in_backoff(self, key: Hashable) -> bool:
+        failure = self._failures.get(key)
+        return failure is not None and failure[1] > time.time()
+
+    async def lookup(self, key: Hashable, flight, fetch: Callable[[], Awaitable[Any]]) -> CacheLookup:
+        """
+        stale-while-revalidate 查询：
+          - 新鲜条目直接返回（HIT）
+          - 陈旧条目立即返回（STALE），同时通过 flight 在后台刷新；
+            刷新与前台抓取共享 single-flight 和上游限流，失败时旧数据保留到 ttl
+          - 没有条目时经 flight 抓取并等待结果（MISS）
+
+        fetch() 负责写入本缓存：有效结果 aset，确实为空 aset_empty，失败 record_failure。
+        退避期内的陈旧条目不触发刷新。
+        """
+        entry = await self.aget_entry(key)
+        if entry is not None:
+            if self.is_fresh(entry):
+                return CacheLookup(None, "HIT", entry)
+            self.stale_hits += 1
+            if self.in_backoff(key):
+                self.backoff_skips += 1
+            else:
+                if not flight.in_flight(key):
+                    logger.info(f"[{self.namespace}] 缓存已陈旧（{entry.age:.0f}s），后台刷新: {key}")
+                flight.start(key, fetch)
+            return CacheLookup(None, "STALE", entry)
+        value = await flight.do(key, fetch)
+        return CacheLookup(value, "MISS", self.get_entry(key, count=False))
+
+    def _evict_over_limit(self):
+        while len(self._data) > 1 and (
+            len(self._data) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "ttl": self.ttl,
+            "fresh_ttl": self.fresh_ttl,
+            "entries": len(self._data),
+            "approx_bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "disk_hits": self.disk_hits,
+            "stale_hits": self.stale_hits,
+            "empty_stores": self.empty_stores,
+            "failures": self.failures,
+            "backoff_skips": self.backoff_skips,
+            "in_backoff": len(self._failures),
+        }
+
+
+def _student_of(key: Hashable) -> str:
+    if isinstance(key, tuple) and key and isinstance(key[0], str):
+        return key[0]
+    return ""
+
+
+# ---- 命名空间注册 ----
+_namespaces: dict[str, ResponseCache] = {}
+
+
+def get_cache(namespace: str, ttl: float, **kwargs) -> ResponseCache:
+    """获取（不存在则创建）一个命名空间的缓存"""
+    cache = _namespaces.get(namespace)
+    if cache is None:
+        cache = _namespaces[namespace] = ResponseCache(namespace, ttl, **kwargs)
+        metrics.register(f"cache.{namespace}", cache.stats)
+    return cache
+
+
+async def invalidate_student(student_id: str):
+    """删除某个学号在所有命名空间（含磁盘层）中的缓存"""
+    for cache in _namespaces.values():
+        cache.invalidate_student(student_id)
+    disk = get_disk_cache()
+    if disk is not None:
+        try:
+            await disk.delete_student(student_id)
+        except Exception as e:
+            logger.warning(f"删除磁盘缓存失败: {student_id}: {e}")
+
+
+def clear_all():
+    for cache in _namespaces.values():
+        cache.clear()
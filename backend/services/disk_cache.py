@@ -0,0 +1,228 @@
+"""
+响应缓存的磁盘层（SQLite）
+
+内存缓存（services.cache）的写透后端：解析结果以 zlib 压缩的 JSON 保存，
+带绝对过期时间，进程重启后仍然有效，避免重启后把限流的教务接口重新抓一遍。
+
+  - 表 entries：(namespace, key) 为主键，key 为 JSON 编码的缓存 key 元组
+  - 总大小超过 max_bytes 时按最近访问时间淘汰（数据库由所有 worker 共享，
+    总大小每次写入时在同一事务中从库里统计，而不是各进程自己累加）；读命中只在内存中记下访问时间，
+    攒够一批（或下次写入/淘汰时）再一次性写回，读路径不产生写事务
+  - 读出的是 JSON 字节，由调用方决定如何解码（pydantic 可直接从 JSON 校验，
+    或原样作为响应体返回）
+"""
+
+import json
+import time
+import zlib
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Hashable, Optional
+
+from config import CACHE_DISK_PATH, CACHE_DISK_MAX_BYTES
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# 每写入多少次顺带清理一次过期记录
+_PURGE_EVERY = 200
+
+# 攒够多少条访问时间后批量写回
+_TOUCH_BATCH = 64
+
+
+class DiskCache:
+    """SQLite 持久化缓存"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " student_id TEXT NOT NULL,"
+                " payload BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " stored_at REAL NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_student ON entries (student_id)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at)"
+            )
+            self._conn.commit()
+            # 最近一次从库中统计的总大小（仅用于 stats）
+            self._bytes = self._total_bytes()
+        self._writes = 0
+        # (namespace, key) → 尚未写回的最近访问时间
+        self._touched: dict[tuple[str, str], float] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        metrics.register("disk_cache", self.stats)
+
+    @staticmethod
+    def encode_key(key: Hashable) -> str:
+        return json.dumps(list(key) if isinstance(key, tuple) else key, ensure_ascii=False)
+
+    # ---- 同步实现（在线程池中执行） ----
+
+    def _get(self, namespace: str, key: str) -> Optional[tuple[bytes, float, float]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, stored_at, expires_at FROM entries"
+                " WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, now),
+            ).fetchone()
+            if row:
+                self._touched[(namespace, key)] = now
+                if len(self._touched) >= _TOUCH_BATCH:
+                    self._flush_touched()
+                    self._conn.commit()
+        if not row:
+            return None
+        return zlib.decompress(row[0]), row[1], row[2]
+
+    def _flush_touched(self):
+        """把攒下的访问时间写回（调用方持有锁并负责提交）"""
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+            [(at, namespace, key) for (namespace, key), at in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def _put(self, namespace: str, key: str, student_id: str, data: bytes,
+             stored_at: float, expires_at: float):
+        payload = zlib.compress(data)
+        with self._lock:
+            self._flush_touched()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries"
+                " (namespace, key, student_id, payload, size, stored_at, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (namespace, key, student_id, payload, len(payload),
+                 stored_at, expires_at, time.time()),
+            )
+            self._writes += 1
+            if self._writes % _PURGE_EVERY == 0:
+                self._delete_where("expires_at <= ?", (time.time(),))
+            self._bytes = self._total_bytes()
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _total_bytes(self) -> int:
+        """库中所有条目的总大小（包括其他 worker 写入的）"""
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _delete_where(self, where: str, params: tuple):
+        self._conn.execute(f"DELETE FROM entries WHERE {where}", params)
+        self._bytes = self._total_bytes()
+
+    def _evict(self):
+        """按最近访问时间淘汰，直到总大小降到上限的 90%（一条 DELETE 删除最旧的 n 条）"""
+        excess = self._bytes - self.max_bytes * 0.9
+        count = freed = 0
+        cursor = self._conn.execute("SELECT size FROM entries ORDER BY accessed_at")
+        for (size,) in cursor:
+            if freed >= excess:
+                break
+            count += 1
+            freed += size
+        cursor.close()
+        self._conn.execute(
+            "DELETE FROM entries WHERE rowid IN"
+            " (SELECT rowid FROM entries ORDER BY accessed_at LIMIT ?)",
+            (count,),
+        )
+        self._bytes -= freed
+        self.evictions += count
+
+    def _delete_student(self, student_id: str):
+        with self._lock:
+            self._delete_where("student_id = ?", (student_id,))
+            self._conn.commit()
+
+    def _close(self):
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+    # ---- 异步接口 ----
+
+    async def get(self, namespace: str, key: Hashable) -> Optional[tuple[bytes, float, float]]:
+        """返回 (JSON 字节, stored_at, expires_at)，不存在或已过期返回 None"""
+        result = await asyncio.to_thread(self._get, namespace, self.encode_key(key))
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    async def put(self, namespace: str, key: Hashable, student_id: str, data: bytes,
+                  stored_at: float, expires_at: float):
+        await asyncio.to_thread(
+            self._put, namespace, self.encode_key(key), student_id, data,
+            stored_at, expires_at,
+        )
+
+    async def delete_student(self, student_id: str):
+        await asyncio.to_thread(self._delete_student, student_id)
+
+    async def close(self):
+        """写回攒下的访问时间（保留重启后的 LRU 顺序）并关闭数据库"""
+        await asyncio.to_thread(self._close)
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "pending_touches": len(self._touched),
+        }
+
+
+_disk_cache: Optional[DiskCache] = None
+_disk_cache_failed = False
+
+
+def get_disk_cache() -> Optional[DiskCache]:
+    """
+    全局磁盘缓存，第一次调用时才打开数据库；
+    CACHE_DISK_PATH 为空或打开失败时返回 None（仅内存缓存）
+    """
+    global _disk_cache, _disk_cache_failed
+    if _disk_cache is None and CACHE_DISK_PATH and not _disk_cache_failed:
+        try:
+            _disk_cache = DiskCache(CACHE_DISK_PATH, CACHE_DISK_MAX_BYTES)
+        except sqlite3.Error as e:
+            _disk_cache_failed = True
+            logger.warning(f"无法打开磁盘缓存 {CACHE_DISK_PATH}: {e}")
+    return _disk_cache
+
+
+async def close_disk_cache():
+    """关闭时调用：关闭已打开的磁盘缓存（没有打开过则不创建）"""
+    global _disk_cache
+    if _disk_cache is not None:
+        disk, _disk_cache = _disk_cache, None
+        await disk.close()
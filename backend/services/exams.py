@@ -13,39 +13,59 @@
 
 import re
 import logging
-import time
 from typing import Optional
 
-import requests
-from bs4 import BeautifulSoup
-
-from config import vpn_url, EXAM_PATH
+from config import vpn_url, EXAM_PATH, EXAM_ROUND_INTERVAL, CACHE_TTL_EXAMS
+from services.cache import CacheLookup, get_cache
+from services.pacing import RoundScheduler
+from services.parse_memo import ParseMemo
+from services.rate_limit import RateLimitExceeded, is_throttled_page
+from services.singleflight import SingleFlight
+from services.tokens import is_token_rejected
+from services.upstream import SessionExpired, UpstreamClient, is_login_page
+from utils.html_table import Column, TableRow, TableSchema, extract_table, parse_with_fallback
 
 # 教务系统要求 Referer 头
 EDU_REFERER = {"Referer": vpn_url("frame/homes.html")}
 KSAP_REFERER = {"Referer": vpn_url("student/ksap.ksapb.html")}
-from models.schemas import Exam, ExamsResponse
+from models.records import ExamRecord, ExamsRecord
 
 logger = logging.getLogger(__name__)
 
 # ---- 缓存：key = (student_id, year, semester) ----
-_exam_cache: dict[tuple[str, int, int], ExamsResponse] = {}
+_exam_cache = get_cache("exams", CACHE_TTL_EXAMS, model=ExamsRecord)
+
+# 考试轮次间隔调度（按上游会话）
+exam_round_scheduler = RoundScheduler("exam_round", EXAM_ROUND_INTERVAL)
+
+# 并发的相同考试请求合并为一次上游抓取（DataTable.jsp 配额极少）
+_exam_flight = SingleFlight("exams")
 
+# 考试 DataTable 的空表等页面在学生之间完全相同，直接复用解析结果；解析输出变化时提升版本
+_parse_memo = ParseMemo("exams", version=1)
 
-def fetch_exams(session: requests.Session, student_id: str = "",
-                table_id: str = "2538", year: int = 0,
-                semester: int = -1) -> ExamsResponse:
+
+async def fetch_exams(session: UpstreamClient, student_id: str = "",
+                      table_id: str = "2538", year: int = 0,
+                      semester: int = -1) -> ExamsRecord:
     """
     获取考试安排，遍历所有考试轮次并合并结果。
     结果会被缓存，相同 (student_id, year, semester) 不再重复请求。
 
     Args:
-        session: 已登录的 requests.Session
+        session: 已登录的 UpstreamClient
         student_id: 学号 (xh)
         table_id: DataTable 的 ID
         year: 学年起始年份，0=当前
         semester: -1=当前, 0=秋季, 1=春季
     """
+    return (await lookup_exams(session, student_id, table_id, year, semester)).value
+
+
+async def lookup_exams(session: UpstreamClient, student_id: str = "",
+                       table_id: str = "2538", year: int = 0,
+                       semester: int = -1) -> CacheLookup:
+    """获取考试安排并附带缓存状态（HIT / MISS）"""
     # 确定学年学期
     if year <= 0 or semester < 0:
         from datetime import datetime
@@ -60,160 +80,167 @@ def fetch_exams(session: requests.Session, student_id: str = "",
             year = now.year - 1
             semester = 1  # 春季
 
-    # 检查缓存
     cache_key = (student_id, year, semester)
-    if cache_key in _exam_cache:
-        cached = _exam_cache[cache_key]
-        logger.info(f"考试数据命中缓存: {student_id} {year}/{semester}, "
-                    f"{len(cached.exams)} 条")
-        return cached
+    result = await _exam_cache.lookup(
+        cache_key,
+        _exam_flight,
+        lambda: _fetch_exams_upstream(session, student_id, table_id, year, semester),
+    )
+    if result.status != "MISS":
+        logger.info(f"考试数据命中缓存: {student_id} {year}/{semester}")
+    return result
+
+
+async def _fetch_exams_upstream(session: UpstreamClient, student_id: str,
+                                table_id: str, year: int,
+                                semester: int) -> ExamsRecord:
+    """从教务系统抓取所有考试轮次并写入缓存"""
+    cache_key = (student_id, year, semester)
 
     # 先访问考试安排页面建立上下文
     try:
-        session.get(vpn_url("student/ksap.ksapb.html"), timeout=10,
-                    headers=EDU_REFERER)
+        await session.get(vpn_url("student/ksap.ksapb.html"), timeout=10,
+                          headers=EDU_REFERER)
+    except RateLimitExceeded:
+        raise
     except Exception:
         pass
 
     all_exams = []
+    failed = False
 
     # 只遍历有数据的考试轮次: 1(随堂考试/考查) 和 3(期末考试)
     # kslc=2 和 kslc=4 在实际测试中始终返回空，跳过以避免浪费请求配额
     for kslc in [1, 3]:
-        # 每个轮次前重新访问考试页面，刷新 VPN 上下文
-        try:
-            session.get(vpn_url("student/ksap.ksapb.html"), timeout=10,
-                        headers=EDU_REFERER)
-        except Exception:
-            pass
-
-        # 轮次间较长延迟，避免 VPN 限流
-        if kslc > 1:
-            time.sleep(2.0)
-
-        # 使用 POST 表单提交，与浏览器行为一致
-        url = vpn_url(f"{EXAM_PATH}?tableId={table_id}")
-        form_data = {
-            "xh": student_id,
-            "xn": str(year),
-            "xq": str(semester),
-            "kslc": str(kslc),
-            "xnxqkslc": f"{year},{semester},{kslc}",
-            "menucode_current": "JW130603",
-        }
-
-        try:
-            resp = session.post(url, data=form_data, timeout=15,
-                                headers=KSAP_REFERER)
-            resp.encoding = "gbk"
-
-            if resp.status_code != 200:
-                continue
-
-            exams = parse_exams_html(resp.text)
-            all_exams.extend(exams)
-            logger.info(f"考试轮次 kslc={kslc}: {len(exams)} 条")
-
-        except Exception as e:
-            logger.warning(f"获取考试轮次 kslc={kslc} 失败: {e}")
-
-    result = ExamsResponse(exams=all_exams)
-
-    # 写入缓存（即使为空也缓存，避免反复请求触发限制）
+        # 轮次间较长延迟（从上一轮响应返回算起），避免 VPN 限流（非阻塞等待，只挂起当前用户）
+        async with exam_round_scheduler.round(session):
+            # 每个轮次前重新访问考试页面，刷新 VPN 上下文
+            try:
+                await session.get(vpn_url("student/ksap.ksapb.html"), timeout=10,
+                                  headers=EDU_REFERER)
+            except RateLimitExceeded:
+                raise
+            except Exception:
+                pass
+
+            # 使用 POST 表单提交，与浏览器行为一致
+            url = vpn_url(f"{EXAM_PATH}?tableId={table_id}")
+            form_data = {
+                "xh": student_id,
+                "xn": str(year),
+                "xq": str(semester),
+                "kslc": str(kslc),
+                "xnxqkslc": f"{year},{semester},{kslc}",
+                "menucode_current": "JW130603",
+            }
+
+            try:
+                resp = await session.post(url, data=form_data, timeout=15,
+                                          headers=KSAP_REFERER, encoding="gbk")
+
+                if resp.status_code != 200:
+                    failed = True
+                    continue
+
+                raw = resp.content
+                memo_key = _parse_memo.key(raw)
+                exams = _parse_memo.get(memo_key)
+                if exams is None:
+                    html = resp.text
+                    if is_login_page(html):
+                        logger.warning(f"考试轮次 kslc={kslc} 返回登录页，会话已失效")
+                        session.expired = True
+                        raise SessionExpired("考试安排请求返回登录页")
+                    if is_throttled_page(html):
+                        logger.warning(f"考试轮次 kslc={kslc} 被频率限制")
+                        failed = True
+                        continue
+                    exams, confirmed = _parse_exams_page(html)
+                    if not confirmed:
+                        # 既没有考试表格也没有"没有检索到记录"/"暂无"：请求被拒或页面异常
+                        reason = "被拒绝" if is_token_rejected(html) else "页面无法识别"
+                        logger.warning(f"考试轮次 kslc={kslc} {reason}")
+                        failed = True
+                        continue
+                    exams = _parse_memo.put(memo_key, exams, len(raw))
+                all_exams.extend(exams)
+                logger.info(f"考试轮次 kslc={kslc}: {len(exams)} 条")
+
+            except (RateLimitExceeded, SessionExpired):
+                raise
+            except Exception as e:
+                logger.warning(f"获取考试轮次 kslc={kslc} 失败: {e}")
+                failed = True
+
+    result = ExamsRecord(exams=all_exams)
+
+    # 写入缓存：有数据正常缓存；所有轮次都确认为空时短时间缓存；
+    # 有轮次失败且没拿到数据时进入退避，避免反复请求加重限制
     if all_exams:
-        _exam_cache[cache_key] = result
+        await _exam_cache.aset(cache_key, result)
         logger.info(f"考试数据已缓存: {student_id} {year}/{semester}, "
                     f"{len(all_exams)} 条")
-    # 空结果不缓存，下次可重试
+    elif failed:
+        delay = _exam_cache.record_failure(cache_key, result)
+        logger.warning(f"考试数据抓取失败，{delay:.0f} 秒内不再重试: {cache_key}")
+    else:
+        await _exam_cache.aset_empty(cache_key, result)
 
     return result
 
 
-def clear_exam_cache(student_id: str = ""):
-    """清除考试缓存，student_id 为空则清除全部"""
-    if not student_id:
-        _exam_cache.clear()
-        return
-    keys_to_remove = [k for k in _exam_cache if k[0] == student_id]
-    for k in keys_to_remove:
-        del _exam_cache[k]
-
+def parse_exams_html(html: str) -> list[ExamRecord]:
+    """解析考试安排 HTML，返回 ExamRecord 列表"""
+    return _parse_exams_page(html)[0]
 
-def parse_exams_html(html: str) -> list[Exam]:
-    """解析考试安排 HTML，返回 Exam 列表"""
-    soup = BeautifulSoup(html, "lxml")
-    exams = []
 
+def _parse_exams_page(html: str) -> tuple[list[ExamRecord], bool]:
+    """
+    解析考试安排页面；第二项为结果是否可信：页面中有考试表格（可能没有数据行），
+    或为"没有检索到记录"/"暂无"
+    """
     if "没有检索到记录" in html or "暂无" in html:
-        return exams
-
-    table = soup.find("table")
-    if not table:
-        return exams
-
-    # 获取表头
-    header_cells = []
-    first_row = table.find("tr")
-    if first_row:
-        header_cells = [td.get_text(strip=True) for td in first_row.find_all(["td", "th"])]
-
-    # 构建列索引映射
-    col_map = _build_column_map(header_cells)
+        return [], True
 
-    rows = table.find_all("tr")
-    for row in rows[1:] if header_cells else rows:  # 跳过表头行
-        cells = row.find_all("td")
-        if len(cells) < 3:
-            continue
+    rows = parse_with_fallback(html, lambda doc: extract_table(doc, _EXAMS_TABLE), "考试")
+    if rows is None:
+        return [], False
 
-        texts = [td.get_text(strip=True) for td in cells]
-
-        # 跳过空行或表头行
-        if not any(texts) or "序号" in texts[0] or "课程" in texts[0]:
-            continue
-
-        exam = _parse_exam_row_by_map(texts, col_map)
+    exams = []
+    for row in rows:
+        exam = _exam_from_row(row)
         if exam:
             exams.append(exam)
-
-    return exams
-
-
-def _build_column_map(headers: list[str]) -> dict[str, int]:
-    """根据表头构建列名到索引的映射"""
-    col_map = {}
-    keywords = {
-        "序号": "index",
-        "课程": "course",
-        "学分": "credits",
-        "类别": "category",
-        "考核方式": "exam_type",
-        "考试时间": "exam_time",
-        "时间": "exam_time",
-        "考试地点": "location",
-        "地点": "location",
-        "考场": "location",
-        "座位号": "seat",
-        "座位": "seat",
-    }
-    for i, h in enumerate(headers):
-        for kw, key in keywords.items():
-            if kw in h and key not in col_map:
-                col_map[key] = i
-                break
-    return col_map
-
-
-def _parse_exam_row_by_map(texts: list[str], col_map: dict[str, int]) -> Optional[Exam]:
-    """根据列映射解析一行考试数据"""
+    return exams, True
+
+
+# 考试表格：列位置按第一行表头的关键词确定（同一表头按关键词顺序取第一个未占用的字段）
+_EXAMS_TABLE = TableSchema(
+    columns=(
+        Column("index", headers=("序号",)),
+        Column("course", headers=("课程",)),
+        Column("credits", headers=("学分",)),
+        Column("category", headers=("类别",)),
+        Column("exam_type", headers=("考核方式",)),
+        Column("exam_time", headers=("考试时间", "时间")),
+        Column("location", headers=("考试地点", "地点", "考场")),
+        Column("seat", headers=("座位号", "座位")),
+    ),
+    use_tbody=False,
+    header_row=True,
+    min_cells=3,
+    # 跳过空行或表头行
+    skip_row=lambda texts: not any(texts) or "序号" in texts[0] or "课程" in texts[0],
+)
+
+_DATE_RE = re.compile(r'\d{4}[-/]\d{1,2}[-/]\d{1,2}')
+
+
+def _exam_from_row(row: TableRow) -> Optional[ExamRecord]:
+    """把一行表格数据转换为 ExamRecord"""
     try:
-        def get(key: str) -> str:
-            idx = col_map.get(key, -1)
-            if 0 <= idx < len(texts):
-                return texts[idx]
-            return ""
-
-        course_name = get("course")
+        texts = row.texts
+        course_name = row["course"]
         if not course_name:
             # 回退：尝试跳过序号列
             offset = 1 if texts[0].isdigit() and len(texts[0]) <= 3 else 0
@@ -222,20 +249,20 @@ def _parse_exam_row_by_map(texts: list[str], col_map: dict[str, int]) -> Optiona
         if not course_name:
             return None
 
-        exam = Exam(
+        exam = ExamRecord(
             course_name=course_name,
-            credits=get("credits"),
-            category=get("category"),
-            exam_type=get("exam_type"),
-            exam_time=get("exam_time"),
-            exam_location=get("location"),
-            seat_number=get("seat"),
+            credits=row["credits"],
+            category=row["category"],
+            exam_type=row["exam_type"],
+            exam_time=row["exam_time"],
+            exam_location=row["location"],
+            seat_number=row["seat"],
         )
 
         # 回退：如果没有通过列映射找到考试时间，尝试正则匹配
         if not exam.exam_time:
             for t in texts:
-                if re.search(r'\d{4}[-/]\d{1,2}[-/]\d{1,2}', t):
+                if _DATE_RE.search(t):
                     exam.exam_time = t
                     break
 
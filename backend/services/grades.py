@@ -12,15 +12,18 @@
   学年学期 | 课程/环节 | 学分 | 类别 | 课程性质 | 考核方式 | 修读性质
   | 平时成绩 | 期末成绩 | 综合成绩 | 辅修标记 | 备注
 
-注意：VPN 对请求有限频，每次成绩查询需 5 次请求（4 次 token + 1 次数据），
-因此需要做缓存——同一 session 同一查询参数只抓一次。
+注意：VPN 对请求有限频，完整流程每次查询需 5 次请求（4 次 token + 1 次数据），
+因此需要做缓存——同一 session 同一查询参数只抓一次；kingoKey 按会话复用
+（services.tokens），并学习获取 token 实际需要的最少步骤，热请求只需 1 次数据 POST。
+
+"入学以来"的成绩表格可能很大：默认边下载边解析（GradesStreamParser），
+不保存完整页面和文档树。
 """
 
 import re
+import codecs
 import logging
-
-import requests
-from bs4 import BeautifulSoup
+from typing import Optional
 
 from config import (
     vpn_url,
@@ -29,57 +32,101 @@ from config import (
     GRADES_MY_PATH,
     SET_TOKEN_PATH,
     HOME_PATH,
+    CACHE_TTL_GRADES,
+    CACHE_FRESH_GRADES,
+    JWXT_TOKEN_MAX_AGE,
+    GRADES_STREAM_PARSE,
+    GRADES_STREAM_MIN_BYTES,
+)
+from models.records import GradeRecord, GradesRecord
+from services.cache import CacheLookup, get_cache
+from services.parse_memo import ParseMemo
+from services.rate_limit import (
+    UPSTREAM_THROTTLE_MARKERS,
+    RateLimitExceeded,
+    is_throttled_page,
+)
+from services.singleflight import SingleFlight
+from services.tokens import TokenCache, is_token_rejected
+from services.upstream import LOGIN_PAGE_HEAD, SessionExpired, UpstreamClient, is_login_page
+from utils.html_table import (
+    Column,
+    TableRow,
+    TableSchema,
+    TableStream,
+    extract_table,
+    parse_with_fallback,
 )
-from models.schemas import Grade, GradesResponse
 
 logger = logging.getLogger(__name__)
 
-# ---- 缓存：key = (student_id, year, year_end, semester) ----
-_grades_cache: dict[tuple[str, int, int, int], GradesResponse] = {}
+# ---- 缓存：key = (student_id, year, year_end, semester)，通常只有"入学以来"的完整成绩 ----
+# 按学年/学期的查询从完整成绩在本地筛选（见 lookup_grades），不再单独请求上游；
+# 只有完整成绩中有无法识别的学期名称时才按学年/学期单独查询并缓存
+_grades_cache = get_cache("grades", CACHE_TTL_GRADES, model=GradesRecord,
+                          fresh_ttl=CACHE_FRESH_GRADES)
 
+# 并发的相同成绩请求合并为一次上游抓取（一次抓取 = 5 个请求）
+_grades_flight = SingleFlight("grades")
 
-def clear_grades_cache(student_id: str = ""):
-    """清除成绩缓存，student_id 为空则清除全部"""
-    if not student_id:
-        _grades_cache.clear()
-        return
-    keys_to_remove = [k for k in _grades_cache if k[0] == student_id]
-    for k in keys_to_remove:
-        del _grades_cache[k]
+# 相同的成绩页面（重复刷新、"没有检索到记录"）直接复用解析结果；解析输出变化时提升版本
+_parse_memo = ParseMemo("grades", version=1)
 
 EDU_REFERER = {"Referer": vpn_url("frame/homes.html")}
 
 
-def _get_grades_token(session: requests.Session) -> str:
+# 获取 kingoKey 的步骤，从最少到完整模拟浏览器；token 取不到或被拒时升级一级
+_GRADES_TOKEN_FLOWS = (
+    ("token",),
+    ("page", "iframe", "token"),
+    ("home", "page", "iframe", "foken", "token"),
+)
+
+
+async def _get_grades_token(session: UpstreamClient, level: int = len(_GRADES_TOKEN_FLOWS) - 1) -> str:
     """
     获取成绩查询所需的 token（kingoKey）。
 
-    完整流程：访问主页面 → 访问隐藏 iframe → 调用 SetTokenkey 获取 token
+    完整流程：访问 homes → 访问主页面 → 访问隐藏 iframe → 调用 SetTokenkey 获取 token；
+    level 选择 _GRADES_TOKEN_FLOWS 中的步骤组合（由 _grades_tokens 学习最少步骤）。
     """
+    steps = _GRADES_TOKEN_FLOWS[level]
     page_url = vpn_url(GRADES_PAGE_PATH)
     my_url = vpn_url(GRADES_MY_PATH)
     token_url = vpn_url(SET_TOKEN_PATH)
 
     try:
+        # 0. 访问 homes.html 确保教务上下文
+        if "home" in steps:
+            try:
+                await session.get(vpn_url(HOME_PATH), timeout=15)
+            except RateLimitExceeded:
+                raise
+            except Exception:
+                pass
+
         # 1. 访问主页面（建立页面上下文）
-        session.get(page_url, timeout=15, headers=EDU_REFERER)
+        if "page" in steps:
+            await session.get(page_url, timeout=15, headers=EDU_REFERER)
 
         # 2. 访问隐藏 iframe（模拟浏览器加载）
-        session.get(my_url, timeout=15, headers={"Referer": page_url})
+        if "iframe" in steps:
+            await session.get(my_url, timeout=15, headers={"Referer": page_url})
 
         # 3. 获取主页面 token（setFoken，非必需但模拟完整流程）
-        session.post(
-            token_url,
-            data="menucode=xscj.stuckcj.jsp",
-            headers={
-                "Referer": page_url,
-                "Content-Type": "application/x-www-form-urlencoded",
-            },
-            timeout=15,
-        )
+        if "foken" in steps:
+            await session.post(
+                token_url,
+                data="menucode=xscj.stuckcj.jsp",
+                headers={
+                    "Referer": page_url,
+                    "Content-Type": "application/x-www-form-urlencoded",
+                },
+                timeout=15,
+            )
 
         # 4. 获取 iframe token（setToken → kingoKey，用于表单提交）
-        resp = session.post(
+        resp = await session.post(
             token_url,
             data="menucode=xscj.stuckcj.my.jsp",
             headers={
@@ -91,52 +138,193 @@ def _get_grades_token(session: requests.Session) -> str:
 
         token = resp.text.strip()
         if token and not token.startswith("<"):
-            logger.info(f"成绩 token 获取成功: {token[:20]}...")
+            logger.info(f"成绩 token 获取成功（第 {level} 级）: {token[:20]}...")
             return token
         else:
-            logger.warning(f"成绩 token 无效: {token[:60]}")
+            logger.warning(f"成绩 token 无效（第 {level} 级）: {token[:60]}")
             return ""
 
+    except RateLimitExceeded:
+        raise
     except Exception as e:
         logger.warning(f"获取成绩 token 失败: {e}")
         return ""
 
 
-def fetch_grades(session: requests.Session, student_id: str = "",
-                 year: int = 0, year_end: int = 0, semester: int = -1,
-                 token: str = "") -> GradesResponse:
+# kingoKey 按会话复用（热请求只需 1 次数据 POST）
+_grades_tokens = TokenCache("grades", _get_grades_token, JWXT_TOKEN_MAX_AGE,
+                            levels=len(_GRADES_TOKEN_FLOWS))
+
+
+async def fetch_grades(session: UpstreamClient, student_id: str = "",
+                       year: int = 0, year_end: int = 0, semester: int = -1,
+                       token: str = "") -> GradesRecord:
     """
     获取成绩数据（带缓存）
 
     Args:
-        session: 已登录的 requests.Session
+        session: 已登录的 UpstreamClient
         student_id: 学号（用于缓存 key）
         year: 学年起始年份，0=全部（入学以来）
         year_end: 学年结束年份
         semester: -1=全部, 0=秋季, 1=春季
         token: token（可选，会自动获取）
     """
-    # 检查缓存
-    cache_key = (student_id, year, year_end, semester)
-    if student_id and cache_key in _grades_cache:
-        cached = _grades_cache[cache_key]
-        logger.info(f"成绩数据命中缓存: {student_id} year={year} sem={semester}, "
-                    f"{len(cached.grades)} 条")
-        return cached
-    # 访问 homes.html 确保上下文
-    try:
-        session.get(vpn_url(HOME_PATH), timeout=15)
-    except Exception:
-        pass
+    return (await lookup_grades(session, student_id, year, year_end,
+                                semester, token)).value
+
+
+async def lookup_grades(session: UpstreamClient, student_id: str = "",
+                        year: int = 0, year_end: int = 0, semester: int = -1,
+                        token: str = "") -> CacheLookup:
+    """
+    获取成绩数据并附带缓存状态（HIT / STALE / MISS）
+
+    上游只查询一次"入学以来"（sjxz1）的完整成绩并缓存；按学年（sjxz2）/
+    学期（sjxz3）的查询从完整成绩按学期字符串筛选，并重新计算该范围的 GPA。
+    完整成绩中有学期名称无法识别的成绩时，本地筛选无法判断它们属于哪个范围，
+    该查询改为直接向教务系统按学年/学期查询（单独缓存）。
+    完整成绩超过 CACHE_FRESH_GRADES 后先返回旧数据，同时在后台刷新。
+    """
+    if not student_id:
+        return CacheLookup(
+            await _fetch_grades_upstream(session, student_id, year, year_end,
+                                         semester, token)
+        )
+    full_key = (student_id, 0, 0, -1)
+    full = await _grades_cache.lookup(
+        full_key,
+        _grades_flight,
+        lambda: _fetch_grades_upstream(session, student_id, 0, 0, -1, token),
+    )
+    if full.status != "MISS":
+        logger.info(f"成绩数据命中缓存（{full.status}）: {student_id}")
+    if year == 0 and semester == -1:
+        return full
+
+    slice_key = (year, year_end, semester)
+    derived = full.entry.derived if full.entry is not None else None
+    if _unrecognized_semesters(full.value, derived):
+        return await _grades_cache.lookup(
+            (student_id, *slice_key),
+            _grades_flight,
+            lambda: _fetch_grades_upstream(session, student_id, *slice_key, token),
+        )
+    if full.entry is None:
+        return CacheLookup(_slice_grades(full.value, *slice_key), full.status)
+    # 切片挂在完整成绩的缓存条目上，完整成绩刷新后自动失效（大小计入完整成绩的条目）
+    sliced = _grades_cache.derive(
+        full_key, full.entry, slice_key,
+        lambda: _slice_grades(full.value, *slice_key, full.entry.derived),
+    )
+    return CacheLookup(sliced.value, full.status, sliced)
+
+
+_SEMESTER_RE = re.compile(r'(\d{4})\s*-\s*(\d{4})\s*学年\s*(秋|春)?')
+
+
+def _parse_semester_name(name: str) -> tuple[int, int, int]:
+    """
+    "2025-2026学年秋季学期" → (2025, 2026, 0)；春季为 1，其他（如夏季）为 -1。
+    无法识别时返回 (0, 0, -1)。
+    """
+    m = _SEMESTER_RE.search(name)
+    if not m:
+        return 0, 0, -1
+    term = {"秋": 0, "春": 1}.get(m.group(3) or "", -1)
+    return int(m.group(1)), int(m.group(2)), term
+
+
+def _semester_index(full: GradesRecord, derived: Optional[dict] = None) -> dict:
+    """学期字符串 → 该学期的成绩列表（保持原顺序）"""
+    index = derived.get("index") if derived is not None else None
+    if index is None:
+        index = {}
+        for grade in full.grades:
+            index.setdefault(grade.semester, []).append(grade)
+        if derived is not None:
+            derived["index"] = index
+    return index
+
+
+def _unrecognized_semesters(full: GradesRecord, derived: Optional[dict] = None) -> list[str]:
+    """完整成绩中无法识别学年学期的学期名称（这些成绩不会出现在任何本地筛选结果中）"""
+    names = derived.get("unrecognized") if derived is not None else None
+    if names is None:
+        index = _semester_index(full, derived)
+        names = [name for name in index if not _parse_semester_name(name)[0]]
+        if names:
+            rows = sum(len(index[name]) for name in names)
+            logger.warning(f"{rows} 条成绩的学期无法识别 {names}，按学年/学期的查询改为直接请求教务系统")
+        if derived is not None:
+            derived["unrecognized"] = names
+    return names
+
+
+def _slice_grades(full: GradesRecord, year: int, year_end: int, semester: int,
+                  derived: Optional[dict] = None) -> GradesRecord:
+    """
+    按学年/学期从完整成绩中筛选，语义与教务系统的查询方式一致：
+      semester == -1：学年 year ~ (year_end 或 year+1) 之间的所有学期（sjxz2）
+      semester >= 0：学年 year（0 表示不限）的指定学期（sjxz3）
+    """
+    last_year = year_end if year_end > 0 else year + 1
+    grades = []
+    for name, rows in _semester_index(full, derived).items():
+        start, end, term = _parse_semester_name(name)
+        if not start:
+            continue
+        if semester == -1:
+            if start < year or end > last_year:
+                continue
+        else:
+            if term != semester or (year > 0 and start != year):
+                continue
+        grades.extend(rows)
+    return _summarize(grades)
+
+
+class GpaTotals:
+    """按学分加权累计 GPA（仅 > 0 的绩点参与计算，"合格"类不计入）"""
+
+    __slots__ = ("weighted", "credits")
+
+    def __init__(self):
+        self.weighted = 0.0
+        self.credits = 0.0
+
+    def add(self, grade: GradeRecord):
+        if grade.credits > 0 and grade.gpa_point > 0:
+            self.weighted += grade.gpa_point * grade.credits
+            self.credits += grade.credits
+
+    @property
+    def gpa(self) -> float:
+        return round(self.weighted / self.credits, 4) if self.credits > 0 else 0.0
+
+    def response(self, grades: list[GradeRecord]) -> GradesRecord:
+        """grades 为累计时加入的全部成绩"""
+        response = GradesRecord(grades=grades, total_credits=self.credits)
+        if self.credits > 0:
+            response.total_gpa = self.gpa
+        return response
+
+
+def _summarize(grades: list[GradeRecord]) -> GradesRecord:
+    """计算成绩列表的总学分和 GPA"""
+    totals = GpaTotals()
+    for grade in grades:
+        totals.add(grade)
+    return totals.response(grades)
 
-    # 获取 token
-    if not token:
-        token = _get_grades_token(session)
 
-    if not token:
-        logger.warning("无法获取成绩 token，尝试无 token 查询")
+async def _fetch_grades_upstream(session: UpstreamClient, student_id: str,
+                                 year: int, year_end: int, semester: int,
+                                 token: str) -> GradesRecord:
+    """从教务系统抓取成绩并写入缓存"""
+    cache_key = (student_id, year, year_end, semester)
 
-    # 构建表单数据
+    # 构建表单数据（t 在发送前填入）
     # 根据查询类型选择 sjxz：
     #   sjxz1 = 入学以来（xn/xq disabled，不发送）
     #   sjxz2 = 学年（xq disabled）
@@ -149,7 +337,7 @@ def fetch_grades(session: requests.Session, student_id: str = "",
             "sjxz": "sjxz1",
             "ysyx": "yscj",
             "zfx": "0",
-            "t": token,
+            "t": "",
             "xn1": "",
             "sjxzS": "on",
             "ysyxS": "on",
@@ -161,7 +349,7 @@ def fetch_grades(session: requests.Session, student_id: str = "",
             "sjxz": "sjxz2",
             "ysyx": "yscj",
             "zfx": "0",
-            "t": token,
+            "t": "",
             "xn": str(year),
             "xn1": str(year_end) if year_end > 0 else str(year + 1),
             "sjxzS": "on",
@@ -174,7 +362,7 @@ def fetch_grades(session: requests.Session, student_id: str = "",
             "sjxz": "sjxz3",
             "ysyx": "yscj",
             "zfx": "0",
-            "t": token,
+            "t": "",
             "xn": str(year) if year > 0 else "",
             "xn1": str(year_end) if year_end > 0 else (str(year + 1) if year > 0 else ""),
             "xq": str(semester),
@@ -189,26 +377,231 @@ def fetch_grades(session: requests.Session, student_id: str = "",
     logger.info(f"查询成绩: sjxz={form_data['sjxz']}, year={year}, semester={semester}")
 
     try:
-        resp = session.post(url, data=form_data, timeout=15, headers=grades_referer)
-        resp.encoding = "gbk"
-
-        if resp.status_code != 200:
-            logger.warning(f"成绩请求失败: HTTP {resp.status_code}")
-            return GradesResponse()
-
-        result = parse_grades_html(resp.text)
-
-        # 写入缓存（有数据时才缓存）
+        # 使用会话缓存的 token；被拒时重新获取并重试一次（调用方指定的 token 不重试）
+        for attempt in range(2):
+            form_data["t"] = token or await _grades_tokens.get(session)
+            if not form_data["t"]:
+                logger.warning("无法获取成绩 token，尝试无 token 查询")
+
+            post = _post_grades_streaming if GRADES_STREAM_PARSE else _post_grades
+            result, problem = await post(session, url, form_data, grades_referer)
+            if problem == "http":
+                return _grades_failed(student_id, cache_key)
+            if problem == "expired":
+                logger.warning("成绩请求返回登录页，会话已失效")
+                session.expired = True
+                raise SessionExpired("成绩请求返回登录页")
+            if problem == "throttled":
+                logger.warning("成绩查询被频率限制")
+                return _grades_failed(student_id, cache_key)
+            if problem == "rejected":
+                if token or attempt:
+                    logger.warning("成绩 token 被拒绝")
+                    return _grades_failed(student_id, cache_key)
+                logger.warning("成绩 token 被拒绝，重新获取后重试")
+                _grades_tokens.invalidate(session, rejected=True)
+                continue
+            if problem == "unrecognized":
+                logger.warning("成绩页面无法识别（没有成绩表格）")
+                return _grades_failed(student_id, cache_key)
+            break
+
+        # 写入缓存（确认为空的结果短时间缓存）
         if student_id and result.grades:
-            _grades_cache[cache_key] = result
+            await _grades_cache.aset(cache_key, result)
             logger.info(f"成绩数据已缓存: {student_id} year={year} sem={semester}, "
                         f"{len(result.grades)} 条")
+        elif student_id:
+            await _grades_cache.aset_empty(cache_key, result)
 
         return result
 
+    except (RateLimitExceeded, SessionExpired):
+        raise
     except Exception as e:
         logger.exception(f"获取成绩失败: {e}")
-        return GradesResponse()
+        return _grades_failed(student_id, cache_key)
+
+
+async def _post_grades(session: UpstreamClient, url: str, form_data: dict,
+                       headers: dict) -> tuple[Optional[GradesRecord], str]:
+    """
+    提交成绩查询并解析整个页面（相同页面复用解析结果）。
+
+    Returns:
+        (结果, "")；失败时为 (None, "http" / "expired" / "throttled" / "rejected")，
+        既没有成绩表格也没有"没有检索到记录"时为 (None, "unrecognized")
+    """
+    resp = await session.post(url, data=form_data, timeout=15,
+                              headers=headers, encoding="gbk")
+    if resp.status_code != 200:
+        logger.warning(f"成绩请求失败: HTTP {resp.status_code}")
+        return None, "http"
+    return _grades_from_response(resp)
+
+
+def _grades_from_response(resp) -> tuple[Optional[GradesRecord], str]:
+    """解析已完整读取的成绩响应（见 _post_grades）"""
+    raw = resp.content
+    memo_key = _parse_memo.key(raw)
+    result = _parse_memo.get(memo_key)
+    if result is not None:
+        return result, ""
+    html = resp.text
+    if is_login_page(html):
+        return None, "expired"
+    if is_throttled_page(html):
+        return None, "throttled"
+    if is_token_rejected(html):
+        return None, "rejected"
+    result, confirmed = _parse_grades_page(html)
+    if not confirmed:
+        return None, "unrecognized"
+    return _parse_memo.put(memo_key, result, len(raw)), ""
+
+
+async def _post_grades_streaming(session: UpstreamClient, url: str, form_data: dict,
+                                 headers: dict) -> tuple[Optional[GradesRecord], str]:
+    """
+    与 _post_grades 相同，但边下载边解析（GradesStreamParser）：
+    不保存完整的响应字节、解码文本和文档树，"入学以来"的大表格也只占用单行的解析内存。
+
+    解析与下载同时进行，下载完才能算出内容哈希，此时解析已经完成：解析结果复用
+    （_parse_memo）在这里只起去重作用（相同页面共享同一份结果，不重复占用内存），
+    不省解析时间。因此已知较小（Content-Length < GRADES_STREAM_MIN_BYTES）的响应
+    仍整页读取后按 _post_grades 的方式处理，复用命中时跳过解析。
+    """
+    async with session.stream("POST", url, data=form_data, timeout=15,
+                              headers=headers, encoding="gbk") as resp:
+        if resp.status_code != 200:
+            logger.warning(f"成绩请求失败: HTTP {resp.status_code}")
+            return None, "http"
+
+        length = resp.headers.get("Content-Length", "")
+        if length.isdigit() and int(length) < GRADES_STREAM_MIN_BYTES:
+            await resp.aread()
+            return _grades_from_response(resp)
+
+        hasher = _parse_memo.hasher()
+        size = 0
+        parser = GradesStreamParser(resp.encoding or "gbk")
+        async for chunk in resp.aiter_bytes():
+            hasher.update(chunk)
+            size += len(chunk)
+            parser.feed(chunk)
+        parser.close()
+
+    memo_key = hasher.digest()
+    result = _parse_memo.get(memo_key)
+    if result is not None:
+        return result, ""
+    if parser.login_page:
+        return None, "expired"
+    if parser.throttled:
+        return None, "throttled"
+    if parser.rejected:
+        return None, "rejected"
+    if not parser.confirmed:
+        return None, "unrecognized"
+    return _parse_memo.put(memo_key, parser.result(), size), ""
+
+
+class GradesStreamParser:
+    """
+    成绩页面的增量解析器
+
+    feed(chunk) 传入原始响应字节：按块增量解码（GBK 多字节字符可以跨块），
+    交给 TableStream 逐行解析，返回本块新解析出的 GradeRecord；
+    totals 为到目前为止的累计学分和 GPA。close() 之后 result() 返回完整结果：
+    行的选取与 parse_grades_html 相同（TableStream 同样只取第一个 tbody 中的行），
+    只有表格嵌套在单元格中时行的顺序可能不同（见 TableStream）。
+
+    同时在解码后的文本中检查页面标记（可能跨块），供调用方区分
+    登录页（会话失效）、"没有检索到记录"、限流提示、token 被拒（没有表格）
+    和无法识别的页面（confirmed）。
+    """
+
+    def __init__(self, encoding: str = "gbk"):
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self._table = TableStream(_GRADES_TABLE)
+        self._tail = ""
+        self._head = ""          # 页面开头（判断登录页，见 is_login_page）
+        self._semester = ""
+        self.grades: list[GradeRecord] = []
+        self.totals = GpaTotals()
+        self.no_records = False
+        self.throttled = False
+        self.has_table = False
+
+    def feed(self, chunk: bytes) -> list[GradeRecord]:
+        return self._consume(self._decoder.decode(chunk))
+
+    def close(self) -> list[GradeRecord]:
+        grades = self._consume(self._decoder.decode(b"", final=True))
+        return grades + self._add_rows(self._table.close())
+
+    @property
+    def login_page(self) -> bool:
+        return is_login_page(self._head)
+
+    @property
+    def rejected(self) -> bool:
+        """与 is_token_rejected 对完整页面的判断相同"""
+        return not (self.has_table or self.no_records or self.throttled or self.login_page)
+
+    @property
+    def confirmed(self) -> bool:
+        """结果可信：页面中有成绩表格，或为"没有检索到记录"页面"""
+        return self.no_records or self._table.found
+
+    def result(self) -> GradesRecord:
+        if self.no_records or self.throttled:
+            return GradesRecord()
+        return self.totals.response(self.grades)
+
+    def _consume(self, text: str) -> list[GradeRecord]:
+        if not text:
+            return []
+        self._scan(text)
+        return self._add_rows(self._table.feed(text))
+
+    def _scan(self, text: str):
+        if len(self._head) < LOGIN_PAGE_HEAD:
+            self._head += text[:LOGIN_PAGE_HEAD - len(self._head)]
+        window = self._tail + text
+        if "没有检索到记录" in window:
+            self.no_records = True
+        if is_throttled_page(window):
+            self.throttled = True
+        if "<table" in window.lower():
+            self.has_table = True
+        self._tail = window[-(_MARKER_MAX_LEN - 1):]
+
+    def _add_rows(self, rows: list[TableRow]) -> list[GradeRecord]:
+        added = []
+        for row in rows:
+            # 学年学期（可能为空 → 同上一行的学期）
+            if row["semester"]:
+                self._semester = row["semester"]
+            grade = _grade_from_row(row, self._semester)
+            if grade is not None:
+                self.totals.add(grade)
+                added.append(grade)
+        self.grades.extend(added)
+        return added
+
+
+# 跨块检查页面标记时需要保留的上一块末尾长度
+_MARKER_MAX_LEN = max(len(m) for m in ("没有检索到记录", "<table", *UPSTREAM_THROTTLE_MARKERS))
+
+
+def _grades_failed(student_id: str, cache_key: tuple) -> GradesRecord:
+    """上游失败/被限流：返回空结果，并让该 key 进入退避"""
+    result = GradesRecord()
+    if student_id:
+        delay = _grades_cache.record_failure(cache_key, result)
+        logger.warning(f"成绩抓取失败，{delay:.0f} 秒内不再重试: {cache_key}")
+    return result
 
 
 def _score_to_gpa(score_str: str) -> float:
@@ -265,7 +658,7 @@ def _score_to_gpa(score_str: str) -> float:
     return grade_map.get(score_str, 0.0)
 
 
-def parse_grades_html(html: str) -> GradesResponse:
+def parse_grades_html(html: str) -> GradesRecord:
     """
     解析成绩 HTML 页面。
 
@@ -283,103 +676,64 @@ def parse_grades_html(html: str) -> GradesResponse:
       10: 辅修标记
       11: 备注
     """
-    response = GradesResponse()
+    return _parse_grades_page(html)[0]
 
-    if not html or "没有检索到记录" in html:
-        return response
 
-    if "频繁" in html or "1分钟" in html:
-        logger.warning("成绩查询被频率限制")
-        return response
+def _parse_grades_page(html: str) -> tuple[GradesRecord, bool]:
+    """
+    解析成绩页面；第二项为结果是否可信：页面中有成绩表格（可能没有数据行），
+    或为"没有检索到记录"。其余情况（限流提示、无法识别的页面）为 False。
+    """
+    if not html:
+        return GradesRecord(), False
 
-    soup = BeautifulSoup(html, "lxml")
-    table = soup.find("table")
-    if not table:
-        return response
+    if "没有检索到记录" in html:
+        return GradesRecord(), True
 
-    tbody = table.find("tbody") or table
-    rows = tbody.find_all("tr")
+    if is_throttled_page(html):
+        logger.warning("成绩查询被频率限制")
+        return GradesRecord(), False
+
+    rows = parse_with_fallback(html, lambda doc: extract_table(doc, _GRADES_TABLE), "成绩")
+    if rows is None:
+        return GradesRecord(), False
 
     grades = []
     current_semester = ""
-    total_weighted_gpa = 0.0
-    total_credits = 0.0
-
     for row in rows:
-        cells = row.find_all("td")
-        if len(cells) < 10:
-            continue
-
-        texts = [td.get_text(strip=True) for td in cells]
-
-        # 跳过表头行
-        if texts[0] == "学年学期" or texts[1] == "课程/环节":
-            continue
-
         # 学年学期（可能为空 → 同上一行的学期）
-        if texts[0]:
-            current_semester = texts[0]
-
-        # 课程名（格式：[GRA20038701]马克思主义与社会科学方法论）
-        raw_course = texts[1]
-        course_id = ""
-        course_name = raw_course
-        id_match = re.match(r'\[([^\]]+)\](.+)', raw_course)
-        if id_match:
-            course_id = id_match.group(1)
-            course_name = id_match.group(2).strip()
-
-        if not course_name:
-            continue
-
-        # 学分
-        credits = _safe_float(texts[2])
-
-        # 类别、课程性质、考核方式、修读性质
-        category = texts[3]       # 研究生/公共选修
-        nature = texts[4]         # 选修/必修
-        exam_type = texts[5]      # 考试/考查
-        study_type = texts[6]     # 初修/重修
-
-        # 成绩
-        regular_score = texts[7]   # 平时成绩
-        final_score = texts[8]     # 期末成绩
-        composite_score = texts[9] # 综合成绩
-
-        # 辅修标记、备注
-        remark = texts[11] if len(texts) > 11 else ""
-
-        # 计算绩点
-        gpa_point = _score_to_gpa(composite_score)
-
-        grade = Grade(
-            semester=current_semester,
-            course_id=course_id,
-            course_name=course_name,
-            score=composite_score,
-            credits=credits,
-            gpa_point=gpa_point,
-            exam_type=exam_type,
-            course_category=category,
-            course_nature=nature,
-            regular_score=regular_score,
-            final_score=final_score,
-            study_type=study_type,
-            remark=remark,
-        )
-        grades.append(grade)
-
-        # GPA 累计（仅数值成绩且 > 0 参与计算，"合格"类不计入）
-        if credits > 0 and gpa_point > 0:
-            total_weighted_gpa += gpa_point * credits
-            total_credits += credits
-
-    response.grades = grades
-    response.total_credits = total_credits
-    if total_credits > 0:
-        response.total_gpa = round(total_weighted_gpa / total_credits, 4)
-
-    return response
+        if row["semester"]:
+            current_semester = row["semester"]
+        grade = _grade_from_row(row, current_semester)
+        if grade is not None:
+            grades.append(grade)
+
+    return _summarize(grades), True
+
+
+def _grade_from_row(row: TableRow, semester: str) -> Optional[GradeRecord]:
+    """由一行成绩表格构造 GradeRecord；没有课程名的行返回 None"""
+    # 课程名（格式：[GRA20038701]马克思主义与社会科学方法论）
+    course_id, course_name = row["course"]
+    if not course_name:
+        return None
+
+    composite_score = row["score"]
+    return GradeRecord(
+        semester=semester,
+        course_id=course_id,
+        course_name=course_name,
+        score=composite_score,
+        credits=row["credits"],
+        gpa_point=_score_to_gpa(composite_score),
+        exam_type=row["exam_type"],
+        course_category=row["category"],
+        course_nature=row["nature"],
+        regular_score=row["regular_score"],
+        final_score=row["final_score"],
+        study_type=row["study_type"],
+        remark=row["remark"],
+    )
 
 
 def _safe_float(s: str) -> float:
@@ -387,3 +741,34 @@ def _safe_float(s: str) -> float:
         return float(s)
     except (ValueError, TypeError):
         return 0.0
+
+
+_COURSE_RE = re.compile(r'\[([^\]]+)\](.+)')
+
+
+def _split_course(raw: str) -> tuple[str, str]:
+    """[课程号]课程名 → (课程号, 课程名)；没有课程号时原样作为课程名"""
+    id_match = _COURSE_RE.match(raw)
+    if id_match:
+        return id_match.group(1), id_match.group(2).strip()
+    return "", raw
+
+
+# 成绩表格（列号见 parse_grades_html）；少于 10 列的行和表头行跳过
+_GRADES_TABLE = TableSchema(
+    columns=(
+        Column("semester", 0),
+        Column("course", 1, convert=_split_course),
+        Column("credits", 2, convert=_safe_float),
+        Column("category", 3),        # 研究生/公共选修
+        Column("nature", 4),          # 选修/必修
+        Column("exam_type", 5),       # 考试/考查
+        Column("study_type", 6),      # 初修/重修
+        Column("regular_score", 7),   # 平时成绩
+        Column("final_score", 8),     # 期末成绩
+        Column("score", 9),           # 综合成绩
+        Column("remark", 11),         # 备注（辅修标记不使用）
+    ),
+    min_cells=10,
+    skip_row=lambda texts: texts[0] == "学年学期" or texts[1] == "课程/环节",
+)
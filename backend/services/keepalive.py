@@ -0,0 +1,136 @@
+"""
+会话保活与验证调度
+
+以前请求路径上遇到空闲 5~30 分钟的会话会同步调用 ensure_logged_in
+（完整 GET 一次 homes.html），用户要多等一个上游往返。现在改由后台任务负责：
+  - 每隔 interval 秒扫描一次本地会话
+  - 用户仍活跃（未超过 max_idle）且距上次验证超过 refresh_after 的会话需要探测
+  - 最近活跃的用户优先，每轮最多探测 max_probes 个、并发 concurrency 个
+  - 上游限流器有排队时本轮让路给用户请求，被限流拒绝则提前结束本轮
+  - 确认失效（被重定向到登录页）的会话交给 on_dead 清理；网络错误、5xx 等
+    无法判断的探测不处理会话，下一轮再探测
+  - 多 worker 共享会话存储时，探测前先经 claim 确认：其他 worker 刚验证过
+    （存储中的 verified_at 较新）或正持有该会话的探测租约时本 worker 跳过；
+    探测成功后经 on_valid 把 verified_at 写回存储。同一会话的探测次数不随 worker 数增长
+
+探测本身（访问 homes.html）也会刷新 WebVPN 侧的会话，使其在空闲期间保持可用。
+"""
+
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from services import metrics
+from services.auth import SESSION_DEAD, SESSION_VALID, AuthService
+from services.rate_limit import RateLimitExceeded, upstream_limiter
+
+logger = logging.getLogger(__name__)
+
+
+class SessionKeepalive:
+    """后台会话保活调度器"""
+
+    def __init__(self,
+                 list_sessions: Callable[[], list[tuple[str, AuthService, float]]],
+                 on_dead: Callable[[str, AuthService], Awaitable[None]],
+                 interval: float, refresh_after: float, max_idle: float,
+                 max_probes: int, concurrency: int,
+                 claim: Optional[Callable[[str, AuthService], Awaitable[bool]]] = None,
+                 on_valid: Optional[Callable[[str, AuthService], Awaitable[None]]] = None):
+        self._list_sessions = list_sessions
+        self._on_dead = on_dead
+        self._claim = claim
+        self._on_valid = on_valid
+        self.interval = interval
+        self.refresh_after = refresh_after
+        self.max_idle = max_idle
+        self.max_probes = max_probes
+        self.concurrency = concurrency
+
+        self.ticks = 0
+        self.probes = 0
+        self.refreshed = 0
+        self.dead = 0
+        self.unknown = 0
+        self.deferred = 0
+        self.skipped = 0
+        self.last_backlog = 0
+        metrics.register("keepalive", self.stats)
+
+    async def run(self):
+        """后台循环（由 lifespan 启动，取消即停止）"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("会话保活失败")
+
+    def due_sessions(self, now: float) -> list[tuple[str, AuthService, float]]:
+        """需要探测的会话，最近活跃的在前"""
+        due = [
+            (sid, svc, last_active)
+            for sid, svc, last_active in self._list_sessions()
+            if svc.is_logged_in
+            and now - last_active < self.max_idle
+            and now - svc.verified_at >= self.refresh_after
+        ]
+        due.sort(key=lambda item: item[2], reverse=True)
+        return due
+
+    async def tick(self):
+        self.ticks += 1
+        due = self.due_sessions(time.time())
+        self.last_backlog = len(due)
+        if not due:
+            return
+        # 用户请求正在排队：本轮不占用上游配额
+        if upstream_limiter.waiting > 0:
+            self.deferred += 1
+            return
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        stop = asyncio.Event()
+
+        async def probe(student_id: str, auth_service: AuthService):
+            async with semaphore:
+                if stop.is_set():
+                    return
+                if self._claim is not None and not await self._claim(student_id, auth_service):
+                    # 其他 worker 已验证过或正在探测
+                    self.skipped += 1
+                    return
+                self.probes += 1
+                try:
+                    state = await auth_service.ensure_logged_in()
+                except RateLimitExceeded:
+                    stop.set()
+                    self.deferred += 1
+                    return
+                if state == SESSION_VALID:
+                    self.refreshed += 1
+                    if self._on_valid is not None:
+                        await self._on_valid(student_id, auth_service)
+                    return
+                if state != SESSION_DEAD:
+                    # 无法判断：verified_at 未更新，下一轮仍会探测
+                    self.unknown += 1
+                    return
+                self.dead += 1
+                logger.info(f"保活发现 session 已失效: {student_id}")
+                await self._on_dead(student_id, auth_service)
+
+        await asyncio.gather(*(probe(sid, svc) for sid, svc, _ in due[:self.max_probes]))
+
+    def stats(self) -> dict:
+        return {
+            "ticks": self.ticks,
+            "probes": self.probes,
+            "refreshed": self.refreshed,
+            "dead": self.dead,
+            "unknown": self.unknown,
+            "deferred": self.deferred,
+            "skipped": self.skipped,
+            "backlog": self.last_backlog,
+        }
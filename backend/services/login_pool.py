@@ -0,0 +1,176 @@
+"""
+登录执行池
+
+一次登录要走 6~7 步 CAS/WebVPN 流程。开学第一天大量学生同时登录时，
+不加控制的并发登录会把 CAS 压垮、一起超时。LoginPool 限制同时进行的登录数，
+其余请求按到达顺序（FIFO）排队：
+  - 排队位置 / 预计等待时间根据最近登录耗时（滑动平均）估算
+  - 预计等待超过 deadline 或队列已满时直接拒绝（LoginQueueFull），
+    由 /api/auth/login 返回 503 和排队信息，客户端稍后重试
+  - 已排队的请求等待超过 deadline 同样放弃
+  - 排队后成功执行的登录返回排队情况（QueueWait），由 /api/auth/login 通过响应头告知客户端
+"""
+
+import asyncio
+import math
+import time
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+
+from config import (
+    LOGIN_MAX_CONCURRENCY,
+    LOGIN_MAX_QUEUE,
+    LOGIN_QUEUE_DEADLINE,
+    LOGIN_INITIAL_DURATION,
+)
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 登录耗时滑动平均的权重
+_EWMA_ALPHA = 0.2
+
+
+class LoginQueueFull(Exception):
+    """登录排队已满或等待超时"""
+
+    def __init__(self, message: str, position: int, eta: float):
+        super().__init__(message)
+        self.position = position
+        self.eta = eta
+
+
+@dataclass
+class QueueWait:
+    """一次登录的排队情况：position 为入队时的位置（0 = 没有排队），waited 为排队秒数"""
+    position: int = 0
+    waited: float = 0.0
+
+
+class LoginPool:
+    """有界并发 + FIFO 排队的登录执行器"""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int,
+                 deadline: float, initial_duration: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.avg_duration = initial_duration
+
+        self._active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+        self.completed = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        metrics.register(f"login_pool.{name}", self.stats)
+
+    def estimate_wait(self, position: int) -> float:
+        """排在第 position 位（从 1 开始）的请求预计还要等待的秒数"""
+        if position <= 0:
+            return 0.0
+        return math.ceil(position / self.max_concurrency) * self.avg_duration
+
+    async def run(self, fn: Callable[[], Awaitable[T]]) -> tuple[T, QueueWait]:
+        """
+        在池中执行 fn()，返回 (结果, 排队情况)。
+
+        Raises:
+            LoginQueueFull: 队列已满、预计等待超过 deadline 或排队超时
+        """
+        start = time.monotonic()
+        position = 0
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+        else:
+            position = await self._enqueue()
+        waited = time.monotonic() - start
+
+        try:
+            result = await fn()
+        finally:
+            duration = time.monotonic() - start - waited
+            self.avg_duration += _EWMA_ALPHA * (duration - self.avg_duration)
+            self.completed += 1
+            self._release()
+        return result, QueueWait(position, waited)
+
+    async def _enqueue(self) -> int:
+        """排队直到分到名额，返回入队时的位置"""
+        position = len(self._waiters) + 1
+        eta = self.estimate_wait(position)
+        if position > self.max_queue or eta > self.deadline:
+            self.rejected += 1
+            raise LoginQueueFull("登录排队人数较多", position, eta)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self.queued += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(fut, timeout=self.deadline)
+        except asyncio.TimeoutError:
+            self._discard(fut)
+            self.timed_out += 1
+            raise LoginQueueFull("登录排队超时", self.queue_position(), self.avg_duration)
+        except asyncio.CancelledError:
+            # 已经被分到名额后才取消：把名额交给下一个
+            if fut.done() and not fut.cancelled():
+                self._release()
+            else:
+                self._discard(fut)
+            raise
+        finally:
+            waited = time.monotonic() - start
+            self.total_queue_wait += waited
+            self.max_queue_wait = max(self.max_queue_wait, waited)
+        return position
+
+    def _discard(self, fut: asyncio.Future):
+        try:
+            self._waiters.remove(fut)
+        except ValueError:
+            pass
+
+    def _release(self):
+        """释放一个名额：有人排队则直接移交给队首，否则归还"""
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._active -= 1
+
+    def queue_position(self) -> int:
+        return len(self._waiters)
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "queue_depth": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "avg_login_seconds": round(self.avg_duration, 3),
+            "completed": self.completed,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_queue_wait": round(self.total_queue_wait / self.queued, 3) if self.queued else 0.0,
+            "max_queue_wait": round(self.max_queue_wait, 3),
+        }
+
+
+login_pool = LoginPool(
+    "login",
+    max_concurrency=LOGIN_MAX_CONCURRENCY,
+    max_queue=LOGIN_MAX_QUEUE,
+    deadline=LOGIN_QUEUE_DEADLINE,
+    initial_duration=LOGIN_INITIAL_DURATION,
+)
@@ -0,0 +1,29 @@
+"""
+运行指标汇总
+
+各模块通过 register(name, provider) 注册一个返回 dict 的函数，
+/stats 接口调用 collect() 汇总输出，用于观察限流、缓存、排队等状态。
+"""
+
+import logging
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+_providers: dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, provider: Callable[[], dict]):
+    """注册指标提供者（同名覆盖）"""
+    _providers[name] = provider
+
+
+def collect() -> dict:
+    """汇总所有已注册的指标"""
+    result = {}
+    for name, provider in _providers.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            logger.warning(f"收集指标失败 {name}: {e}")
+    return result
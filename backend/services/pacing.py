@@ -0,0 +1,71 @@
+"""
+上游请求节奏控制
+
+RoundScheduler 保证同一个上游会话的相邻"轮次"请求之间至少间隔 interval 秒：
+从上一轮结束（响应返回）算起，而不是上一轮开始，上游响应慢时间隔也不会被压缩。
+等待通过 asyncio.sleep 完成，只挂起当前请求，其他用户的请求照常处理。
+"""
+
+import asyncio
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from services import metrics
+
+
+class RoundScheduler:
+    """按会话控制轮次间隔的非阻塞调度器"""
+
+    def __init__(self, name: str, interval: float):
+        self.name = name
+        self.interval = interval
+        # key → 上一轮结束时间；key 通常是 UpstreamClient，会话释放后自动清理
+        self._last_round: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._locks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self.rounds = 0
+        self.delayed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        metrics.register(f"pacing.{name}", self.stats)
+
+    @asynccontextmanager
+    async def round(self, key) -> AsyncIterator[float]:
+        """
+        async with scheduler.round(key) as waited：执行一轮请求。
+
+        进入时等待到 key 上一轮结束 interval 秒之后（waited 为实际等待的秒数），
+        退出时（包括异常）记录本轮结束时间。同一 key 的轮次按到达顺序串行执行，
+        不同 key 互不影响。
+        """
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+
+        async with lock:
+            waited = 0.0
+            last = self._last_round.get(key)
+            if last is not None:
+                delay = last + self.interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    waited = delay
+                    self.delayed += 1
+                    self.total_wait += delay
+                    self.max_wait = max(self.max_wait, delay)
+            try:
+                yield waited
+            finally:
+                self._last_round[key] = time.monotonic()
+                self.rounds += 1
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "rounds": self.rounds,
+            "delayed": self.delayed,
+            "total_wait": round(self.total_wait, 3),
+            "max_wait": round(self.max_wait, 3),
+            "avg_wait": round(self.total_wait / self.delayed, 3) if self.delayed else 0.0,
+        }
@@ -0,0 +1,88 @@
+"""
+解析结果复用（按内容寻址）
+
+很多上游页面在不同学生、不同次刷新之间是完全相同的（例如考试 DataTable 的空表、
+"没有检索到记录" 页面，同一学生重复刷新得到的课表），而每次解析都要重建
+一棵 BeautifulSoup 树。ParseMemo 以 "解析器版本 + 原始响应字节" 的哈希为 key
+缓存解析结果：字节相同则直接返回上次的结果，跳过解码和解析。
+
+  - 解析器输出格式变化时提升 version，旧结果自然失效
+  - 按条目数和原始字节数做 LRU 淘汰
+  - 结果在多个请求之间共享，调用方不得修改
+"""
+
+import hashlib
+from collections import OrderedDict
+from typing import Any, Optional
+
+from config import PARSE_MEMO_MAX_ENTRIES, PARSE_MEMO_MAX_BYTES
+from services import metrics
+
+
+class ParseMemo:
+    """单个解析器的结果缓存"""
+
+    def __init__(self, name: str, version: int,
+                 max_entries: int = PARSE_MEMO_MAX_ENTRIES,
+                 max_bytes: int = PARSE_MEMO_MAX_BYTES):
+        self.name = name
+        self.version = version
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: OrderedDict[bytes, tuple[Any, int]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        metrics.register(f"parse_memo.{name}", self.stats)
+
+    def key(self, raw: bytes) -> bytes:
+        h = self.hasher()
+        h.update(raw)
+        return h.digest()
+
+    def hasher(self):
+        """增量计算 key：对流式读取的每块调用 update()，最后 digest() 即为 key(完整字节)"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(b"%d:" % self.version)
+        return h
+
+    def get(self, key: bytes) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key: bytes, value: Any, size: int) -> Any:
+        """保存解析结果（size 为原始页面字节数），返回 value"""
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._data[key] = (value, size)
+        self._bytes += size
+        while len(self._data) > 1 and (
+            len(self._data) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            _, (_, evicted_size) = self._data.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+        return value
+
+    def clear(self):
+        self._data.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "entries": len(self._data),
+            "approx_bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,194 @@
+"""
+上游请求限流（令牌桶）
+
+WebVPN / 教务系统对请求频率有限制（成绩页面会返回 "频繁" / "1分钟" 提示，
+考试 DataTable.jsp 大约 4 次后不再返回数据）。所有经 UpstreamClient 发出的请求
+在发送前都要先从两个令牌桶各取一个令牌：
+  - 每个学号一个桶：限制单个用户的突发
+  - 全局一个桶：限制整个进程打到 WebVPN 的总速率
+
+拿不到令牌的请求排队等待（asyncio.sleep，不阻塞其他请求）。
+排队人数超过上限、或预计等待超过 max_wait 时直接失败（RateLimitExceeded），
+由路由层转换为 429。
+"""
+
+import asyncio
+import time
+import logging
+
+from config import (
+    UPSTREAM_RATE_GLOBAL,
+    UPSTREAM_BURST_GLOBAL,
+    UPSTREAM_RATE_PER_STUDENT,
+    UPSTREAM_BURST_PER_STUDENT,
+    UPSTREAM_MAX_QUEUE,
+    UPSTREAM_MAX_WAIT,
+)
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# 上游被限流时页面里出现的提示文字
+UPSTREAM_THROTTLE_MARKERS = ("频繁", "1分钟")
+
+
+def is_throttled_page(html: str) -> bool:
+    """上游返回的是否为限流提示页（"请求过于频繁" / "请1分钟后再试"）"""
+    return any(marker in html for marker in UPSTREAM_THROTTLE_MARKERS)
+
+# 每个学号的桶在闲置（已回满）后可以回收，超过该数量时触发清理
+_BUCKET_PRUNE_THRESHOLD = 1024
+
+
+class RateLimitExceeded(Exception):
+    """上游请求排队过深或等待过久"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """令牌桶：rate 个/秒，最多积攒 capacity 个"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """距离有一个可用令牌还需等待的秒数（0 表示可立即获取）"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """全局 + 按学号的两级令牌桶限流器，带有界等待队列"""
+
+    def __init__(self, name: str,
+                 global_rate: float, global_burst: float,
+                 key_rate: float, key_burst: float,
+                 max_queue: int, max_wait: float):
+        self.name = name
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self._global = TokenBucket(global_rate, global_burst)
+        self._global_lock = asyncio.Lock()
+        self._buckets: dict[str, TokenBucket] = {}
+        self._key_locks: dict[str, asyncio.Lock] = {}
+
+        self.waiting = 0
+        self.max_waiting = 0
+        self.acquired = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        metrics.register(f"rate_limit.{name}", self.stats)
+
+    async def acquire(self, key: str = ""):
+        """
+        获取一个请求配额（按学号桶 → 全局桶），必要时排队等待。
+
+        Raises:
+            RateLimitExceeded: 队列已满，或等待时间会超过 max_wait
+        """
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise RateLimitExceeded("上游请求排队已满",
+                                    retry_after=self.waiting / self._global.rate)
+
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            if key:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    self._prune_buckets(start)
+                    bucket = self._buckets[key] = TokenBucket(self.key_rate, self.key_burst)
+                    self._key_locks[key] = asyncio.Lock()
+                async with self._key_locks[key]:
+                    await self._wait_for(bucket, deadline)
+                    bucket.take(time.monotonic())
+
+            async with self._global_lock:
+                await self._wait_for(self._global, deadline)
+                self._global.take(time.monotonic())
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - start
+        self.acquired += 1
+        if waited > 0.001:
+            self.delayed += 1
+            self.total_wait += waited
+            self.max_wait_seen = max(self.max_wait_seen, waited)
+
+    async def _wait_for(self, bucket: TokenBucket, deadline: float):
+        while True:
+            now = time.monotonic()
+            delay = bucket.delay(now)
+            if delay <= 0:
+                return
+            if now + delay > deadline:
+                self.rejected += 1
+                raise RateLimitExceeded("上游请求等待超时", retry_after=delay)
+            await asyncio.sleep(delay)
+
+    def _prune_buckets(self, now: float):
+        """回收已回满且无人等待的学号桶（回满的桶与新建的桶等价）"""
+        if len(self._buckets) < _BUCKET_PRUNE_THRESHOLD:
+            return
+        idle = [
+            k for k, b in self._buckets.items()
+            if b.is_full(now) and not self._key_locks[k].locked()
+        ]
+        for k in idle:
+            del self._buckets[k]
+            del self._key_locks[k]
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "acquired": self.acquired,
+            "delayed": self.delayed,
+            "rejected": self.rejected,
+            "avg_wait": round(self.total_wait / self.delayed, 3) if self.delayed else 0.0,
+            "max_wait": round(self.max_wait_seen, 3),
+            "global_tokens": round(self._global.tokens, 2),
+            "tracked_students": len(self._buckets),
+        }
+
+
+# 所有 UpstreamClient 共用的限流器
+upstream_limiter = RateLimiter(
+    "upstream",
+    global_rate=UPSTREAM_RATE_GLOBAL,
+    global_burst=UPSTREAM_BURST_GLOBAL,
+    key_rate=UPSTREAM_RATE_PER_STUDENT,
+    key_burst=UPSTREAM_BURST_PER_STUDENT,
+    max_queue=UPSTREAM_MAX_QUEUE,
+    max_wait=UPSTREAM_MAX_WAIT,
+)
@@ -17,29 +17,34 @@ import base64
 import logging
 from typing import Optional
 
-import requests
-from bs4 import BeautifulSoup
-
-from config import vpn_url, SCHEDULE_DATA_PATH, SCHEDULE_PAGE_PATH
+from config import (
+    vpn_url, SCHEDULE_DATA_PATH, SCHEDULE_PAGE_PATH,
+    CACHE_TTL_SCHEDULE, CACHE_FRESH_SCHEDULE, JWXT_TOKEN_MAX_AGE,
+)
+from services.cache import CacheLookup, get_cache
+from services.parse_memo import ParseMemo
+from services.rate_limit import RateLimitExceeded, is_throttled_page
+from services.singleflight import SingleFlight
+from services.tokens import TokenCache, is_token_rejected
+from services.upstream import SessionExpired, UpstreamClient, is_login_page
+from utils.html_table import Column, TableRow, TableSchema, extract_table, parse_with_fallback
+from utils.weeks import iter_weeks, parse_mask
 
 # 教务系统要求 Referer 头
 EDU_REFERER = {"Referer": vpn_url("frame/homes.html")}
-from models.schemas import Course, ScheduleSlot, ScheduleResponse
+from models.records import CourseRecord, ScheduleRecord, ScheduleSlotRecord
 
 logger = logging.getLogger(__name__)
 
 # ---- 缓存：key = (student_id, year, semester) ----
-_schedule_cache: dict[tuple[str, int, int], ScheduleResponse] = {}
+_schedule_cache = get_cache("schedule", CACHE_TTL_SCHEDULE, model=ScheduleRecord,
+                            fresh_ttl=CACHE_FRESH_SCHEDULE)
 
+# 并发的相同课表请求合并为一次上游抓取
+_schedule_flight = SingleFlight("schedule")
 
-def clear_schedule_cache(student_id: str = ""):
-    """清除课表缓存，student_id 为空则清除全部"""
-    if not student_id:
-        _schedule_cache.clear()
-        return
-    keys_to_remove = [k for k in _schedule_cache if k[0] == student_id]
-    for k in keys_to_remove:
-        del _schedule_cache[k]
+# 相同的课表页面（同一学生重复刷新）直接复用解析结果；解析输出变化时提升版本
+_parse_memo = ParseMemo("schedule", version=1)
 
 # 星期映射
 DAY_MAP = {
@@ -63,23 +68,14 @@ def parse_weeks(weeks_str: str) -> list[int]:
     解析周次字符串
     "1-3,8" → [1, 2, 3, 8]
     "1-15" → [1, 2, ..., 15]
+    （课表内部使用位掩码 utils.weeks.parse_mask，这里供需要列表的调用方使用）
     """
-    weeks = []
-    for part in weeks_str.split(","):
-        part = part.strip()
-        if not part:
-            continue
-        if "-" in part:
-            start, end = part.split("-", 1)
-            weeks.extend(range(int(start), int(end) + 1))
-        else:
-            weeks.append(int(part))
-    return sorted(set(weeks))
+    return list(iter_weeks(parse_mask(weeks_str)))
 
 
-def parse_time_location(raw_text: str) -> list[ScheduleSlot]:
+def parse_time_location(raw_text: str) -> list[ScheduleSlotRecord]:
     """
-    解析上课时间地点文本，返回 ScheduleSlot 列表
+    解析上课时间地点文本，返回 ScheduleSlotRecord 列表
 
     输入示例：
       "1-3,8周 三[5-6] 在线教学(400),4周 三[5-6] 二101(210)"
@@ -93,7 +89,7 @@ def parse_time_location(raw_text: str) -> list[ScheduleSlot]:
     for match in matches:
         weeks_str, day_str, section_str, classroom, capacity = match
         
-        weeks = parse_weeks(weeks_str)
+        weeks_mask = parse_mask(weeks_str)
         day = DAY_MAP.get(day_str, 0)
         
         # 解析节次
@@ -104,8 +100,8 @@ def parse_time_location(raw_text: str) -> list[ScheduleSlot]:
         else:
             start_section = end_section = int(section_str)
         
-        slots.append(ScheduleSlot(
-            weeks=weeks,
+        slots.append(ScheduleSlotRecord(
+            weeks_mask=weeks_mask,
             day_of_week=day,
             start_section=start_section,
             end_section=end_section,
@@ -116,12 +112,12 @@ def parse_time_location(raw_text: str) -> list[ScheduleSlot]:
     return slots
 
 
-def get_schedule_token(session: requests.Session) -> str:
+async def get_schedule_token(session: UpstreamClient) -> str:
     """从课表页面获取安全 token"""
     try:
         page_url = vpn_url(SCHEDULE_PAGE_PATH)
-        resp = session.get(page_url, timeout=15, headers=EDU_REFERER)
-        resp.encoding = "gbk"
+        resp = await session.get(page_url, timeout=15, headers=EDU_REFERER,
+                                 encoding="gbk")
         
         # 从页面 JS 中提取 token
         # 通常在 getToken 调用或隐藏字段中
@@ -139,166 +135,266 @@ def get_schedule_token(session: requests.Session) -> str:
         if token_match:
             return token_match.group(1)
             
+    except RateLimitExceeded:
+        raise
     except Exception as e:
         logger.warning(f"获取课表 token 失败: {e}")
     
     return ""
 
 
-def fetch_schedule(session: requests.Session, student_id: str = "",
-                   year: int = 2025, semester: int = 1,
-                   token: str = "") -> ScheduleResponse:
+# 课表 t 参数按会话复用，不必每次都下载并扫描整个课表页面
+_schedule_tokens = TokenCache("schedule", get_schedule_token, JWXT_TOKEN_MAX_AGE)
+
+
+async def fetch_schedule(session: UpstreamClient, student_id: str = "",
+                         year: int = 2025, semester: int = 1,
+                         token: str = "") -> ScheduleRecord:
     """
     获取课表数据（带缓存）
     
     Args:
-        session: 已登录的 requests.Session
+        session: 已登录的 UpstreamClient
         student_id: 学号（用于缓存 key）
         year: 学年起始年份
         semester: 0=秋季, 1=春季
         token: 安全 token
     """
-    # 检查缓存
+    return (await lookup_schedule(session, student_id, year, semester, token)).value
+
+
+async def lookup_schedule(session: UpstreamClient, student_id: str = "",
+                          year: int = 2025, semester: int = 1,
+                          token: str = "") -> CacheLookup:
+    """
+    获取课表数据并附带缓存状态（HIT / STALE / MISS）
+
+    缓存超过 CACHE_FRESH_SCHEDULE 后先返回旧课表，同时在后台刷新。
+    """
+    if not student_id:
+        return CacheLookup(
+            await _fetch_schedule_upstream(session, student_id, year, semester, token)
+        )
+    cache_key = (student_id, year, semester)
+    result = await _schedule_cache.lookup(
+        cache_key,
+        _schedule_flight,
+        lambda: _fetch_schedule_upstream(session, student_id, year, semester, token),
+    )
+    if result.status != "MISS":
+        logger.info(f"课表数据命中缓存（{result.status}）: {student_id} {year}/{semester}")
+    return result
+
+
+async def _fetch_schedule_upstream(session: UpstreamClient, student_id: str,
+                                   year: int, semester: int,
+                                   token: str) -> ScheduleRecord:
+    """从教务系统抓取课表并写入缓存"""
     cache_key = (student_id, year, semester)
-    if student_id and cache_key in _schedule_cache:
-        cached = _schedule_cache[cache_key]
-        logger.info(f"课表数据命中缓存: {student_id} {year}/{semester}, "
-                    f"{len(cached.courses)} 门课")
-        return cached
     # 构造 params 参数（Base64 编码）
     params_raw = f"xn={year}&xq={semester}"
     params_b64 = base64.b64encode(params_raw.encode()).decode()
     
-    # 如果没有 token，尝试获取
-    if not token:
-        token = get_schedule_token(session)
-    
-    # 构造请求 URL
-    query = f"params={params_b64}"
-    if token:
-        query += f"&t={token}"
-    
-    url = vpn_url(f"{SCHEDULE_DATA_PATH}?{query}")
-    
     logger.info(f"请求课表：year={year}, semester={semester}")
     
     try:
-        resp = session.get(url, timeout=15, headers=EDU_REFERER)
-        resp.encoding = "gbk"
-        
-        if resp.status_code != 200:
-            logger.error(f"课表请求失败: HTTP {resp.status_code}")
-            return ScheduleResponse()
-        
-        result = parse_schedule_html(resp.text)
+        # 使用会话缓存的 token；被拒时重新获取并重试一次（调用方指定的 token 不重试）
+        for attempt in range(2):
+            t = token or await _schedule_tokens.get(session)
+
+            # 构造请求 URL
+            query = f"params={params_b64}"
+            if t:
+                query += f"&t={t}"
+            url = vpn_url(f"{SCHEDULE_DATA_PATH}?{query}")
+
+            resp = await session.get(url, timeout=15, headers=EDU_REFERER,
+                                     encoding="gbk")
+            
+            if resp.status_code != 200:
+                logger.error(f"课表请求失败: HTTP {resp.status_code}")
+                return _schedule_failed(student_id, cache_key)
+            
+            result, problem = _parse_response(resp)
+            if problem == "expired":
+                logger.warning("课表请求返回登录页，会话已失效")
+                session.expired = True
+                raise SessionExpired("课表请求返回登录页")
+            if problem == "throttled":
+                logger.warning("课表查询被频率限制")
+                return _schedule_failed(student_id, cache_key)
+            if problem == "rejected":
+                if token or attempt:
+                    logger.warning("课表 token 被拒绝")
+                    return _schedule_failed(student_id, cache_key)
+                logger.warning("课表 token 被拒绝，重新获取后重试")
+                _schedule_tokens.invalidate(session, rejected=True)
+                continue
+            if problem == "unrecognized":
+                logger.warning("课表页面无法识别（没有课表表格）")
+                return _schedule_failed(student_id, cache_key)
+            break
 
-        # 写入缓存（有课程时才缓存）
+        # 写入缓存（确认为空的结果短时间缓存）
         if student_id and result.courses:
-            _schedule_cache[cache_key] = result
+            await _schedule_cache.aset(cache_key, result)
             logger.info(f"课表数据已缓存: {student_id} {year}/{semester}, "
                         f"{len(result.courses)} 门课")
+        elif student_id:
+            await _schedule_cache.aset_empty(cache_key, result)
 
         return result
     
+    except (RateLimitExceeded, SessionExpired):
+        raise
     except Exception as e:
         logger.exception(f"获取课表失败: {e}")
-        return ScheduleResponse()
+        return _schedule_failed(student_id, cache_key)
 
 
-def parse_schedule_html(html: str) -> ScheduleResponse:
-    """解析课表 HTML 页面"""
-    soup = BeautifulSoup(html, "lxml")
-    response = ScheduleResponse()
-    
+def _parse_response(resp) -> tuple[Optional[ScheduleRecord], str]:
+    """
+    解析课表数据响应（相同页面复用解析结果）。
+
+    Returns:
+        (结果, "")；页面为登录页（会话失效）、限流提示或 token 被拒时为
+        (None, "expired" / "throttled" / "rejected")，
+        既没有课表表格也没有"没有检索到记录"时为 (None, "unrecognized")
+    """
+    raw = resp.content
+    memo_key = _parse_memo.key(raw)
+    result = _parse_memo.get(memo_key)
+    if result is not None:
+        return result, ""
+    html = resp.text
+    if is_login_page(html):
+        return None, "expired"
+    if is_throttled_page(html):
+        return None, "throttled"
+    if is_token_rejected(html):
+        return None, "rejected"
+    result, has_table = _parse_schedule_page(html)
+    if not has_table and "没有检索到记录" not in html:
+        return None, "unrecognized"
+    return _parse_memo.put(memo_key, result, len(raw)), ""
+
+
+async def seed_schedule(student_id: str, year: int, semester: int,
+                        resp) -> Optional[ScheduleRecord]:
+    """
+    用已经下载好的课表数据页面（登录时获取用户信息的那一次请求）填充课表缓存，
+    App 登录后请求同一学期课表时不必再访问上游。
+
+    Returns:
+        解析结果；页面无效（登录页、限流、token 被拒、无法识别）时返回 None
+    """
+    result, problem = _parse_response(resp)
+    if problem:
+        return None
+    if student_id and result.courses:
+        await _schedule_cache.aset((student_id, year, semester), result)
+        logger.info(f"登录时预填课表缓存: {student_id} {year}/{semester}, "
+                    f"{len(result.courses)} 门课")
+    return result
+
+
+def _schedule_failed(student_id: str, cache_key: tuple) -> ScheduleRecord:
+    """上游失败/被限流：返回空结果，并让该 key 进入退避"""
+    result = ScheduleRecord()
+    if student_id:
+        delay = _schedule_cache.record_failure(cache_key, result)
+        logger.warning(f"课表抓取失败，{delay:.0f} 秒内不再重试: {cache_key}")
+    return result
+
+
+def parse_schedule_html(html: str) -> ScheduleRecord:
+    """
+    解析课表 HTML 页面
+
+    页面信息块和课程表格都通过 utils.html_table 的文档接口读取：
+    默认 lxml，出错时回退到 BeautifulSoup，两者输出逐字段一致。
+    """
+    return _parse_schedule_page(html)[0]
+
+
+def _parse_schedule_page(html: str) -> tuple[ScheduleRecord, bool]:
+    """解析课表页面；第二项为页面中是否有课表表格（区分确实没有课程和无法识别的页面）"""
+    return parse_with_fallback(html, _parse_schedule_doc, "课表")
+
+
+def _parse_schedule_doc(doc) -> tuple[ScheduleRecord, bool]:
+    response = ScheduleRecord()
+
     # 提取学期标签
-    semester_el = soup.find("font", style=lambda s: s and "font-size:13px" in s)
-    if semester_el:
-        response.semester_label = semester_el.get_text(strip=True).strip("（）()")
-    
+    semester_el = doc.find("font", style="font-size:13px")
+    if semester_el is not None:
+        response.semester_label = doc.text(semester_el, strip=True).strip("（）()")
+
     # 提取学生信息
-    divs = soup.find_all("div", style=lambda s: s and "float:left" in str(s))
-    for div in divs:
-        text = div.get_text(strip=True)
-        if text.startswith("学号"):
-            response.student_id = text.split("：")[-1].split(":")[-1].strip()
-        elif text.startswith("姓名"):
-            response.student_name = text.split("：")[-1].split(":")[-1].strip()
-        elif text.startswith("所在班级"):
-            response.class_name = text.split("：")[-1].split(":")[-1].strip()
-    
+    for div in doc.find_all("div", style="float:left"):
+        _apply_student_info(response, doc.text(div, strip=True))
+
     # 提取课程总数和总学分
-    right_div = soup.find("div", style=lambda s: s and "float:right" in str(s))
-    if right_div:
-        text = right_div.get_text()
-        count_match = re.search(r'课程门数[：:](\d+)', text)
-        credits_match = re.search(r'总学分[：:](\d+\.?\d*)', text)
-        if count_match:
-            response.total_courses = int(count_match.group(1))
-        if credits_match:
-            response.total_credits = float(credits_match.group(1))
-    
+    right_div = doc.find("div", style="float:right")
+    if right_div is not None:
+        _apply_totals(response, doc.text(right_div))
+
     # 解析课程表格
-    table = soup.find("table")
-    if not table:
+    rows = extract_table(doc, _SCHEDULE_TABLE)
+    if rows is None:
         logger.warning("未找到课表表格")
-        return response
-    
-    tbody = table.find("tbody")
-    if not tbody:
-        tbody = table
-    
-    rows = tbody.find_all("tr")
-    courses = []
-    
-    for row in rows:
-        cells = row.find_all("td")
-        if len(cells) < 6:
-            continue
-        
-        # 提取可见单元格的文本
-        visible_cells = [
-            td for td in cells
-            if not td.get("style") or "display: none" not in td.get("style", "")
-        ]
-        
-        if len(visible_cells) < 6:
-            continue
-        
-        # 解析课程号和课程名
-        course_text = visible_cells[0].get_text(strip=True)
-        course_id_match = re.match(r'\[([^\]]+)\](.+)', course_text)
-        
-        if course_id_match:
-            course_id = course_id_match.group(1)
-            course_name = course_id_match.group(2)
-        else:
-            course_id = ""
-            course_name = course_text
-        
-        # 上课时间地点
-        raw_time_location = visible_cells[5].get_text(strip=True)
-        slots = parse_time_location(raw_time_location)
-        
-        # 教师列表
-        teachers_text = visible_cells[4].get_text(strip=True)
-        teachers = [t.strip() for t in teachers_text.split(";") if t.strip()]
-        
-        course = Course(
-            course_id=course_id,
-            course_name=course_name,
-            total_hours=_safe_int(visible_cells[1].get_text(strip=True)),
-            credits=_safe_float(visible_cells[2].get_text(strip=True)),
-            class_number=visible_cells[3].get_text(strip=True),
-            teachers=teachers,
-            slots=slots,
-            course_type=visible_cells[6].get_text(strip=True) if len(visible_cells) > 6 else "",
-            is_minor=visible_cells[7].get_text(strip=True) if len(visible_cells) > 7 else "",
-            raw_time_location=raw_time_location,
-        )
-        courses.append(course)
-    
-    response.courses = courses
-    return response
+        return response, False
+
+    response.courses = [_course_from_row(row) for row in rows]
+    return response, True
+
+
+def _apply_student_info(response: ScheduleRecord, text: str):
+    """"学号：/姓名：/所在班级：" 信息块"""
+    if text.startswith("学号"):
+        response.student_id = text.split("：")[-1].split(":")[-1].strip()
+    elif text.startswith("姓名"):
+        response.student_name = text.split("：")[-1].split(":")[-1].strip()
+    elif text.startswith("所在班级"):
+        response.class_name = text.split("：")[-1].split(":")[-1].strip()
+
+
+def _apply_totals(response: ScheduleRecord, text: str):
+    """"课程门数：N 总学分：X" 信息块"""
+    count_match = re.search(r'课程门数[：:](\d+)', text)
+    credits_match = re.search(r'总学分[：:](\d+\.?\d*)', text)
+    if count_match:
+        response.total_courses = int(count_match.group(1))
+    if credits_match:
+        response.total_credits = float(credits_match.group(1))
+
+
+def _course_from_row(row: TableRow) -> CourseRecord:
+    """由一行可见单元格构造课程"""
+    # 解析课程号和课程名
+    course_id_match = _COURSE_RE.match(row["course"])
+    if course_id_match:
+        course_id = course_id_match.group(1)
+        course_name = course_id_match.group(2)
+    else:
+        course_id = ""
+        course_name = row["course"]
+
+    # 上课时间地点
+    raw_time_location = row["time_location"]
+
+    return CourseRecord(
+        course_id=course_id,
+        course_name=course_name,
+        total_hours=row["total_hours"],
+        credits=row["credits"],
+        class_number=row["class_number"],
+        teachers=[t.strip() for t in row["teachers"].split(";") if t.strip()],
+        slots=parse_time_location(raw_time_location),
+        course_type=row["course_type"],
+        is_minor=row["is_minor"],
+        raw_time_location=raw_time_location,
+    )
 
 
 def _safe_int(s: str) -> int:
@@ -313,3 +409,24 @@ def _safe_float(s: str) -> float:
         return float(s)
     except (ValueError, TypeError):
         return 0.0
+
+
+_COURSE_RE = re.compile(r'\[([^\]]+)\](.+)')
+
+
+# 课程表格：只计可见单元格（隐藏列 style 含 display: none），少于 6 列的行跳过
+_SCHEDULE_TABLE = TableSchema(
+    columns=(
+        Column("course", 0),
+        Column("total_hours", 1, convert=_safe_int),
+        Column("credits", 2, convert=_safe_float),
+        Column("class_number", 3),
+        Column("teachers", 4),
+        Column("time_location", 5),
+        Column("course_type", 6),
+        Column("is_minor", 7),
+    ),
+    min_cells=6,
+    skip_hidden=True,
+    min_visible=6,
+)
@@ -0,0 +1,152 @@
+"""
+本地会话缓存（有界 LRU）
+
+student_id → (AuthService, last_active)。每个 AuthService 持有一个上游连接池，
+不加限制会让长期运行的进程 RSS 和文件描述符持续增长，因此：
+  - 条目数和估算内存都有上限，超出时淘汰最久未使用的会话
+  - 被淘汰/过期/替换的会话进入待关闭列表，由 reaper 关闭其连接池；
+    进入列表满 close_grace 秒后才关闭，已经取到该会话的请求可以正常完成
+被淘汰只影响本地：会话记录仍在共享存储中，下次请求会按需恢复。
+"""
+
+import time
+import logging
+from collections import OrderedDict
+from typing import Iterator
+
+from services.auth import AuthService
+
+logger = logging.getLogger(__name__)
+
+# 单个会话的基础内存估算（httpx 客户端、连接池、SSL 状态等），字节
+SESSION_BASE_BYTES = 48 * 1024
+
+
+def estimate_session_bytes(auth_service: AuthService) -> int:
+    """估算一个会话占用的内存：基础开销 + cookie 内容"""
+    size = SESSION_BASE_BYTES
+    if auth_service.session:
+        for c in auth_service.session.cookies.jar:
+            size += len(c.name) + len(c.value or "") + len(c.domain) + len(c.path)
+    return size
+
+
+class SessionCache:
+    """按最近使用排序的会话缓存，提供与 dict 相近的接口"""
+
+    def __init__(self, max_entries: int, max_bytes: int, close_grace: float = 0.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.close_grace = close_grace
+        self._data: OrderedDict[str, tuple[AuthService, float]] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._bytes = 0
+        # 已移出缓存、等待关闭连接池的会话：(会话, 移出时间)，按移出时间排序
+        self._pending_close: list[tuple[AuthService, float]] = []
+
+        self.evicted_lru = 0
+        self.evicted_idle = 0
+        self.closed = 0
+
+    def __contains__(self, student_id: str) -> bool:
+        return student_id in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __getitem__(self, student_id: str) -> tuple[AuthService, float]:
+        return self._data[student_id]
+
+    def get(self, student_id: str, default=None):
+        return self._data.get(student_id, default)
+
+    def __setitem__(self, student_id: str, entry: tuple[AuthService, float]):
+        old = self._data.get(student_id)
+        if old and old[0] is entry[0]:
+            # 仅更新活跃时间
+            self._data[student_id] = entry
+            self._data.move_to_end(student_id)
+            return
+        if old:
+            # 被新会话（重新登录）替换：旧会话可能仍有请求在用，延后关闭
+            self._remove(student_id)
+            self.retire(old[0])
+        self._data[student_id] = entry
+        size = estimate_session_bytes(entry[0])
+        self._sizes[student_id] = size
+        self._bytes += size
+        self._evict_over_limit()
+
+    def __delitem__(self, student_id: str):
+        self._remove(student_id)
+
+    def pop(self, student_id: str, default=None):
+        if student_id not in self._data:
+            return default
+        return self._remove(student_id)
+
+    def items(self) -> Iterator[tuple[str, tuple[AuthService, float]]]:
+        return iter(list(self._data.items()))
+
+    def values(self) -> Iterator[tuple[AuthService, float]]:
+        return iter(list(self._data.values()))
+
+    def _remove(self, student_id: str) -> tuple[AuthService, float]:
+        entry = self._data.pop(student_id)
+        self._bytes -= self._sizes.pop(student_id, 0)
+        return entry
+
+    def retire(self, auth_service: AuthService):
+        """放入待关闭列表（close_grace 秒后由 close_pending 关闭）"""
+        self._pending_close.append((auth_service, time.monotonic()))
+
+    def _evict_over_limit(self):
+        while len(self._data) > 1 and (
+            len(self._data) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            student_id = next(iter(self._data))
+            auth_service, _ = self._remove(student_id)
+            self.retire(auth_service)
+            self.evicted_lru += 1
+            logger.info(f"会话缓存已满，淘汰最久未使用的会话: {student_id}")
+
+    def evict_idle(self, now: float, max_idle: float) -> list[str]:
+        """移除空闲超过 max_idle 的会话（放入待关闭列表），返回被移除的学号"""
+        expired = [
+            sid for sid, (_, last_active) in self._data.items()
+            if now - last_active >= max_idle
+        ]
+        for sid in expired:
+            auth_service, _ = self._remove(sid)
+            self.retire(auth_service)
+            self.evicted_idle += 1
+        return expired
+
+    async def close_pending(self, force: bool = False):
+        """关闭进入待关闭列表已满 close_grace 秒的会话；force=True 时全部关闭（进程退出）"""
+        if force:
+            pending, self._pending_close = self._pending_close, []
+        else:
+            deadline = time.monotonic() - self.close_grace
+            split = 0
+            while split < len(self._pending_close) and self._pending_close[split][1] <= deadline:
+                split += 1
+            pending, self._pending_close = self._pending_close[:split], self._pending_close[split:]
+        for auth_service, _ in pending:
+            try:
+                await auth_service.close()
+                self.closed += 1
+            except Exception as e:
+                logger.warning(f"关闭会话失败: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "live": len(self._data),
+            "approx_bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "evicted_lru": self.evicted_lru,
+            "evicted_idle": self.evicted_idle,
+            "pending_close": len(self._pending_close),
+            "closed": self.closed,
+        }
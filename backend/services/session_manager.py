@@ -2,99 +2,454 @@
 Session 管理器
 
 管理用户的 WebVPN 会话，支持 session 缓存和自动续期。
+
+会话在本进程内缓存为 AuthService 对象，同时序列化写入共享会话存储
+（services.session_store）。其他 worker 本地没有该会话时从存储中恢复，
+因此可以用多个 uvicorn worker 部署。
+
+重启保留会话：关闭时（以及运行期间定期）把本地会话快照写入存储，
+启动后不批量验证，只有本 worker 实际收到请求的会话才从存储恢复，
+再由保活任务验证，避免重启后所有用户同时重新登录，也避免每个 worker
+各自把存储中的全部会话探测一遍。保活探测通过存储协调（读回 verified_at、
+按学号取探测租约），同一会话的探测不随 worker 数增长。
 """
 
+import hmac
 import time
+import asyncio
+import hashlib
 import logging
+import secrets
 from typing import Optional
 
-from services.auth import AuthService
+from config import (
+    SESSION_STORE_URL,
+    SESSION_STORE_SYNC_INTERVAL,
+    SESSION_SNAPSHOT_PATH,
+    SESSION_SNAPSHOT_INTERVAL,
+    KEEPALIVE_INTERVAL,
+    KEEPALIVE_REFRESH_AFTER,
+    KEEPALIVE_MAX_PROBES,
+    KEEPALIVE_CONCURRENCY,
+    KEEPALIVE_PROBE_LEASE,
+    SESSION_CACHE_MAX_ENTRIES,
+    SESSION_CACHE_MAX_BYTES,
+    SESSION_CLOSE_GRACE,
+    SESSION_REAP_INTERVAL,
+    LOGIN_PREFETCH,
+)
+from services.auth import SESSION_DEAD, SESSION_VALID, AuthService
+from services.cache import invalidate_student
+from services.exams import fetch_exams
+from services.grades import fetch_grades
+from services import metrics
+from services.keepalive import SessionKeepalive
+from services.login_pool import QueueWait, login_pool
+from services.session_cache import SessionCache
+from services.session_store import create_session_store
 
 logger = logging.getLogger(__name__)
 
 # 会话缓存：student_id → (AuthService, last_active_time)
-_session_cache: dict[str, tuple[AuthService, float]] = {}
+_session_cache = SessionCache(SESSION_CACHE_MAX_ENTRIES, SESSION_CACHE_MAX_BYTES,
+                              SESSION_CLOSE_GRACE)
+# 本地会话上次与共享存储同步的时间：student_id → timestamp
+_store_synced: dict[str, float] = {}
+# 共享会话存储（跨 worker）
+_store = create_session_store(SESSION_STORE_URL, SESSION_SNAPSHOT_PATH)
+# 后台任务（恢复验证、定期快照）
+_background_tasks: list[asyncio.Task] = []
+# 登录后的数据预取任务（保存引用，避免 task 被回收）
+_prefetch_tasks: set[asyncio.Task] = set()
 
 # Session 最大空闲时间（秒）
 SESSION_MAX_IDLE = 30 * 60  # 30 分钟
-# 跳过 HTTP 验证的时间窗口（秒）— 在此时间内直接复用 session
-SESSION_SKIP_VERIFY = 5 * 60  # 5 分钟
+
+# 进行中的登录：student_id → (密码摘要, 登录 task)
+_login_inflight: dict[str, tuple[bytes, asyncio.Task]] = {}
+_DIGEST_KEY = secrets.token_bytes(32)
+_login_stats = {"logins": 0, "coalesced": 0, "password_mismatch": 0}
 
 
-def get_or_create_session(student_id: str, password: str = "") -> tuple[Optional[AuthService], str]:
+async def get_or_create_session(student_id: str,
+                                password: str = "") -> tuple[Optional[AuthService], str, QueueWait]:
     """
     获取或创建用户会话
     
-    如果已有活跃会话则复用，否则创建新会话。
+    如果已有活跃会话则复用，否则创建新会话（登录在 login_pool 中排队执行）。
+    同一学号同时只进行一次登录：密码相同的并发请求共享这次登录的结果；
+    密码不同的请求等它结束后用自己的密码再登录一次，不会拿到对方登录得到的会话。
     
     Returns:
-        (AuthService | None, error_message)
+        (AuthService | None, error_message, 登录在 login_pool 中的排队情况)
+
+    Raises:
+        LoginQueueFull: 登录排队已满或排队超时
     """
-    now = time.time()
-    
-    # 检查缓存中是否有有效 session
-    if student_id in _session_cache:
-        auth_service, last_active = _session_cache[student_id]
-        
-        # 检查是否过期
-        if now - last_active < SESSION_MAX_IDLE:
-            # 5 分钟内活跃过的 session 跳过 HTTP 验证，直接复用
-            if now - last_active < SESSION_SKIP_VERIFY:
-                _session_cache[student_id] = (auth_service, now)
-                return auth_service, ""
-            # 超过 5 分钟，需要验证 session 是否仍有效
-            if auth_service.ensure_logged_in():
-                _session_cache[student_id] = (auth_service, now)
-                return auth_service, ""
-            else:
-                logger.info(f"Session 已过期，重新登录: {student_id}")
-                del _session_cache[student_id]
-        else:
-            logger.info(f"Session 空闲超时: {student_id}")
-            del _session_cache[student_id]
+    auth_service = await _reuse_cached_session(student_id)
+    if auth_service:
+        return auth_service, "", QueueWait()
     
     # 需要登录
     if not password:
-        return None, "需要密码"
+        return None, "需要密码", QueueWait()
     
-    auth_service = AuthService()
-    result = auth_service.login(student_id, password)
+    digest = _password_digest(password)
+    while True:
+        inflight = _login_inflight.get(student_id)
+        if inflight is None:
+            break
+        other_digest, task = inflight
+        if hmac.compare_digest(other_digest, digest):
+            _login_stats["coalesced"] += 1
+            logger.info(f"合并进行中的登录: {student_id}")
+            return await asyncio.shield(task)
+        # 密码不同：不共享结果，也不复用它缓存的会话；等它结束后自行登录
+        _login_stats["password_mismatch"] += 1
+        await asyncio.wait({task})
     
-    if not result["success"]:
-        return None, result.get("message", "登录失败，请检查学号和密码")
+    _login_stats["logins"] += 1
+    task = asyncio.ensure_future(_login_and_cache(student_id, password))
+    _login_inflight[student_id] = (digest, task)
+    task.add_done_callback(lambda t: _login_done(student_id, t))
+    return await asyncio.shield(task)
+
+
+async def _reuse_cached_session(student_id: str) -> Optional[AuthService]:
+    """
+    检查缓存（本地 → 共享存储）中是否有可复用的有效 session。
+
+    请求路径上不做 HTTP 验证：会话有效性由后台保活任务（services.keepalive）维护，
+    探测失败的会话会被标记失效并移除。
+    """
+    if student_id not in _session_cache and not await _load_from_store(student_id):
+        return None
+    
+    now = time.time()
+    auth_service, last_active = _session_cache[student_id]
     
-    # 额外验证：确认 session 确实可以访问受保护页面
-    if not auth_service.ensure_logged_in():
-        logger.warning(f"登录声称成功但 session 验证失败: {student_id}")
-        return None, "学号或密码错误"
+    if now - last_active < SESSION_MAX_IDLE and auth_service.is_logged_in:
+        _session_cache[student_id] = (auth_service, now)
+        if await _sync_to_store(student_id, auth_service, now):
+            return auth_service
+        return None
+    
+    if auth_service.is_logged_in:
+        logger.info(f"Session 空闲超时: {student_id}")
+    else:
+        logger.info(f"Session 已失效，重新登录: {student_id}")
+    await _drop_session(student_id, auth_service)
+    return None
+
+
+async def _drop_session(student_id: str, auth_service: AuthService):
+    """移除并关闭会话（期间可能已被新登录替换，只移除自己这一份）"""
+    if _session_cache.get(student_id, (None,))[0] is auth_service:
+        del _session_cache[student_id]
+        _store_synced.pop(student_id, None)
+        await _delete_from_store(student_id)
+    await auth_service.close()
+
+
+async def _login_and_cache(student_id: str,
+                           password: str) -> tuple[Optional[AuthService], str, QueueWait]:
+    """在登录池中登录，成功后写入会话缓存"""
+    (auth_service, error_msg), wait = await login_pool.run(
+        lambda: _login(student_id, password)
+    )
+    if wait.position:
+        logger.info(f"登录排队等待 {wait.waited:.2f} 秒（入队时第 {wait.position} 位）: {student_id}")
+    if auth_service:
+        now = time.time()
+        # 替换掉的旧会话由会话缓存延后关闭（可能仍有请求在用）
+        _session_cache[student_id] = (auth_service, now)
+        await _save_to_store(student_id, auth_service, now)
+        await _session_cache.close_pending()
+        if LOGIN_PREFETCH:
+            task = asyncio.create_task(_prefetch_after_login(student_id, auth_service))
+            _prefetch_tasks.add(task)
+            task.add_done_callback(_prefetch_tasks.discard)
+    return auth_service, error_msg, wait
+
+
+async def _prefetch_after_login(student_id: str, auth_service: AuthService):
+    """
+    登录后在后台预取成绩 / 考试（LOGIN_PREFETCH），App 首屏请求直接命中缓存。
+    预取经过 single-flight，与 App 的同名请求合并为一次上游抓取。
+    """
+    fetchers = {"grades": fetch_grades, "exams": fetch_exams}
+    for name in LOGIN_PREFETCH:
+        fetch = fetchers.get(name)
+        session = auth_service.get_session()
+        if fetch is None or session is None:
+            continue
+        try:
+            await fetch(session, student_id=student_id)
+        except Exception as e:
+            logger.info(f"登录后预取 {name} 失败: {student_id}: {e!r}")
+
+
+def _login_done(student_id: str, task: asyncio.Task):
+    inflight = _login_inflight.get(student_id)
+    if inflight and inflight[1] is task:
+        del _login_inflight[student_id]
+    if not task.cancelled():
+        task.exception()
+
+
+def _password_digest(password: str) -> bytes:
+    """密码的进程内 HMAC 摘要（仅用于比较，不保存明文）"""
+    return hmac.new(_DIGEST_KEY, password.encode("utf-8"), hashlib.sha256).digest()
+
+
+async def _login(student_id: str, password: str) -> tuple[Optional[AuthService], str]:
+    """执行完整登录流程并验证 session"""
+    auth_service = AuthService()
+    try:
+        result = await auth_service.login(student_id, password)
+        
+        if not result["success"]:
+            await auth_service.close()
+            return None, result.get("message", "登录失败，请检查学号和密码")
+        
+        # 额外验证：确认 session 确实可以访问受保护页面
+        state = await auth_service.ensure_logged_in()
+        if state == SESSION_DEAD:
+            logger.warning(f"登录声称成功但 session 验证失败: {student_id}")
+            await auth_service.close()
+            return None, "学号或密码错误"
+        if state != SESSION_VALID:
+            logger.warning(f"登录后验证 session 时上游无响应: {student_id}")
+            await auth_service.close()
+            return None, "教务系统暂时无法访问，请稍后重试"
+    except BaseException:
+        # 登录过程中抛出异常（如上游限流、任务被取消）：关闭新建的连接池再抛出
+        await auth_service.close()
+        raise
     
-    _session_cache[student_id] = (auth_service, now)
     return auth_service, ""
 
 
-def get_cached_session(student_id: str) -> Optional[AuthService]:
-    """仅获取缓存的 session，不创建新的"""
-    if student_id in _session_cache:
+async def get_cached_session(student_id: str) -> Optional[AuthService]:
+    """仅获取缓存的 session（本地 → 共享存储），不创建新的"""
+    if student_id in _session_cache or await _load_from_store(student_id):
         auth_service, last_active = _session_cache[student_id]
         now = time.time()
         if now - last_active < SESSION_MAX_IDLE and auth_service.is_logged_in:
             _session_cache[student_id] = (auth_service, now)
-            return auth_service
+            if await _sync_to_store(student_id, auth_service, now):
+                return auth_service
     return None
 
 
-def invalidate_session(student_id: str):
-    """使 session 失效"""
+async def invalidate_session(student_id: str):
+    """使 session 失效（包括共享存储中的记录），并清除该学号的响应缓存（内存和磁盘）"""
+    await invalidate_student(student_id)
+    _store_synced.pop(student_id, None)
+    await _delete_from_store(student_id)
     if student_id in _session_cache:
+        auth_service, _ = _session_cache.pop(student_id)
+        await auth_service.close()
+
+
+async def _load_from_store(student_id: str) -> bool:
+    """从共享存储恢复会话到本地缓存，成功返回 True"""
+    try:
+        record = await _store.get(student_id)
+    except Exception as e:
+        logger.warning(f"读取会话存储失败: {e}")
+        return False
+    if not record or not record.get("is_logged_in"):
+        return False
+    last_active = record.get("last_active", 0.0)
+    if time.time() - last_active >= SESSION_MAX_IDLE:
+        return False
+    
+    # 并发恢复时以先完成的为准
+    if student_id not in _session_cache:
+        _session_cache[student_id] = (AuthService.from_record(record), last_active)
+        _store_synced[student_id] = time.time()
+        logger.info(f"从会话存储恢复 session: {student_id}")
+    return True
+
+
+async def _save_to_store(student_id: str, auth_service: AuthService, last_active: float):
+    """把会话（cookie jar + 用户信息 + 活跃时间）写入共享存储"""
+    try:
+        await _store.put(student_id, auth_service.to_record(last_active), ttl=SESSION_MAX_IDLE)
+        _store_synced[student_id] = time.time()
+    except Exception as e:
+        logger.warning(f"写入会话存储失败: {e}")
+
+
+async def _delete_from_store(student_id: str):
+    try:
+        await _store.delete(student_id)
+    except Exception as e:
+        logger.warning(f"删除会话存储记录失败: {e}")
+
+
+async def _sync_to_store(student_id: str, auth_service: AuthService, now: float) -> bool:
+    """
+    定期把本地会话的活跃时间和 cookie 同步到共享存储。
+
+    若存储中的记录已被删除（在其他 worker 上登出），丢弃本地会话并返回 False。
+    """
+    if now - _store_synced.get(student_id, 0.0) < SESSION_STORE_SYNC_INTERVAL:
+        return True
+    try:
+        exists = await _store.get(student_id) is not None
+    except Exception as e:
+        logger.warning(f"读取会话存储失败: {e}")
+        return True
+    if not exists:
+        await _discard_local(student_id, auth_service)
+        return False
+    await _save_to_store(student_id, auth_service, now)
+    return True
+
+
+async def _discard_local(student_id: str, auth_service: AuthService):
+    """存储中的记录已被删除（在其他 worker 上登出）：只丢弃本地会话"""
+    logger.info(f"会话已在其他进程失效: {student_id}")
+    entry = _session_cache.get(student_id)
+    if entry and entry[0] is auth_service:
         del _session_cache[student_id]
+    _store_synced.pop(student_id, None)
+    await auth_service.close()
 
 
-def cleanup_expired_sessions():
-    """清理过期的 session"""
-    now = time.time()
-    expired = [
-        sid for sid, (_, last_active) in _session_cache.items()
-        if now - last_active >= SESSION_MAX_IDLE
-    ]
+async def _claim_probe(student_id: str, auth_service: AuthService) -> bool:
+    """
+    保活探测前与其他 worker 协调，返回本 worker 是否应探测该会话：
+    存储中的 verified_at 较新（其他 worker 刚验证过）则沿用，不再探测；
+    否则取得该学号的探测租约才探测。存储不可用时照常探测。
+    """
+    try:
+        record = await _store.get(student_id)
+    except Exception as e:
+        logger.warning(f"读取会话存储失败: {e}")
+        return True
+    if record is None:
+        await _discard_local(student_id, auth_service)
+        return False
+    auth_service.verified_at = max(auth_service.verified_at, record.get("verified_at", 0.0))
+    if time.time() - auth_service.verified_at < KEEPALIVE_REFRESH_AFTER:
+        return False
+    try:
+        return await _store.acquire_lease(f"probe:{student_id}", KEEPALIVE_PROBE_LEASE)
+    except Exception as e:
+        logger.warning(f"获取保活租约失败: {e}")
+        return True
+
+
+async def _record_verified(student_id: str, auth_service: AuthService):
+    """探测成功后把 verified_at 写回存储（活跃时间取本地与存储中较新的一个）"""
+    entry = _session_cache.get(student_id)
+    if not entry or entry[0] is not auth_service:
+        return
+    try:
+        record = await _store.get(student_id)
+    except Exception as e:
+        logger.warning(f"读取会话存储失败: {e}")
+        return
+    if record is None:
+        return
+    last_active = max(entry[1], record.get("last_active", 0.0))
+    await _save_to_store(student_id, auth_service, last_active)
+
+
+async def cleanup_expired_sessions():
+    """清理过期的 session，关闭已淘汰会话的连接池"""
+    expired = _session_cache.evict_idle(time.time(), SESSION_MAX_IDLE)
     for sid in expired:
-        del _session_cache[sid]
+        _store_synced.pop(sid, None)
+    # LRU 淘汰的会话同样不再需要同步记录
+    for sid in [sid for sid in _store_synced if sid not in _session_cache]:
+        del _store_synced[sid]
+    await _session_cache.close_pending()
+    try:
+        await _store.purge_expired()
+    except Exception as e:
+        logger.warning(f"清理会话存储失败: {e}")
+    if expired:
+        logger.info(f"已清理过期 session: {len(expired)} 个")
+
+
+async def _reaper_loop():
+    while True:
+        await asyncio.sleep(SESSION_REAP_INTERVAL)
+        try:
+            await cleanup_expired_sessions()
+        except Exception:
+            logger.exception("清理 session 失败")
+
+
+async def startup_sessions():
+    """
+    启动时调用：加载会话存储，并启动保活和清理任务。
+
+    存储中的会话不在启动时批量验证：请求到来时按需恢复，由保活任务验证。
+    """
+    await _store.load()
+    _background_tasks.append(asyncio.create_task(_keepalive.run()))
+    _background_tasks.append(asyncio.create_task(_reaper_loop()))
+    if SESSION_SNAPSHOT_INTERVAL > 0:
+        _background_tasks.append(asyncio.create_task(_snapshot_loop()))
+
+
+async def shutdown_sessions():
+    """关闭时调用：停止后台任务，快照所有本地会话并关闭存储"""
+    tasks = _background_tasks + list(_prefetch_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _background_tasks.clear()
+    
+    saved = await snapshot_sessions()
+    logger.info(f"会话快照已保存: {saved} 个")
+    await _store.close()
+    for auth_service, _ in _session_cache.values():
+        await auth_service.close()
+    await _session_cache.close_pending(force=True)
+
+
+async def snapshot_sessions() -> int:
+    """把本地所有有效会话（最新 cookie 和活跃时间）写入存储并落盘"""
+    saved = 0
+    for student_id, (auth_service, last_active) in _session_cache.items():
+        if auth_service.is_logged_in:
+            await _save_to_store(student_id, auth_service, last_active)
+            saved += 1
+    try:
+        await _store.flush()
+    except Exception as e:
+        logger.warning(f"会话快照落盘失败: {e}")
+    return saved
+
+
+async def _snapshot_loop():
+    while True:
+        await asyncio.sleep(SESSION_SNAPSHOT_INTERVAL)
+        await snapshot_sessions()
+
+
+def _list_sessions() -> list[tuple[str, AuthService, float]]:
+    return [(sid, svc, last_active) for sid, (svc, last_active) in _session_cache.items()]
+
+
+_keepalive = SessionKeepalive(
+    list_sessions=_list_sessions,
+    on_dead=_drop_session,
+    interval=KEEPALIVE_INTERVAL,
+    refresh_after=KEEPALIVE_REFRESH_AFTER,
+    max_idle=SESSION_MAX_IDLE,
+    max_probes=KEEPALIVE_MAX_PROBES,
+    concurrency=KEEPALIVE_CONCURRENCY,
+    claim=_claim_probe,
+    on_valid=_record_verified,
+)
+
+
+metrics.register("session_cache", _session_cache.stats)
+metrics.register("login_dedup", lambda: {**_login_stats, "in_flight": len(_login_inflight)})
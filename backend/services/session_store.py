@@ -0,0 +1,362 @@
+"""
+共享会话存储
+
+进程内的 AuthService 对象无法跨 worker 共享，因此把会话序列化为一条记录：
+  {student_id, student_name, class_name, is_logged_in, last_active, cookies: [...]}
+写入可被多个 uvicorn worker 共同访问的存储。任意 worker 收到请求时，
+本地没有该用户的会话就从存储中恢复（重建 cookie jar）。
+存储同时提供短期租约（acquire_lease），多个 worker 借此协调同一会话的保活探测。
+
+后端（通过 SESSION_STORE_URL 选择）：
+  memory://                进程内字典（单 worker，默认）；
+                           配置 snapshot_path 后 flush()/load() 会写入/读取快照文件，
+                           用于重启后恢复会话
+  sqlite:///path/to/db     SQLite 文件（单机多 worker）
+  redis://host:port/db     Redis 协议（多机），只用到 GET/SET（含 NX）/DEL/SCAN，
+                           任何兼容 RESP 协议的服务都可以作为替身
+"""
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(ABC):
+    """会话存储接口：record 为可 JSON 序列化的 dict；后端必须实现 get / put / delete / keys"""
+
+    @abstractmethod
+    async def get(self, student_id: str) -> Optional[dict]:
+        """读取记录，不存在或已过期时返回 None"""
+
+    @abstractmethod
+    async def put(self, student_id: str, record: dict, ttl: float):
+        """写入记录，ttl 秒后过期"""
+
+    @abstractmethod
+    async def delete(self, student_id: str):
+        """删除记录（不存在时忽略）"""
+
+    @abstractmethod
+    async def keys(self) -> list[str]:
+        """所有未过期记录的学号"""
+
+    @abstractmethod
+    async def acquire_lease(self, name: str, ttl: float) -> bool:
+        """尝试取得名为 name 的租约（ttl 秒后自动释放），已被占用时返回 False"""
+
+    async def purge_expired(self):
+        """删除已过期的记录（自带过期机制的后端无需操作）"""
+
+    async def load(self):
+        """启动时加载持久化数据（持久化后端无需操作）"""
+
+    async def flush(self):
+        """关闭前把数据落盘（持久化后端无需操作）"""
+
+    async def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """进程内存储（记录同样以 JSON 保存，与其他后端行为一致）"""
+
+    def __init__(self, snapshot_path: str = ""):
+        self.snapshot_path = snapshot_path
+        self._data: dict[str, tuple[str, float]] = {}
+        # 租约名 → 到期时间
+        self._leases: dict[str, float] = {}
+
+    async def get(self, student_id: str) -> Optional[dict]:
+        item = self._data.get(student_id)
+        if not item:
+            return None
+        data, expires_at = item
+        if expires_at <= time.time():
+            del self._data[student_id]
+            return None
+        return json.loads(data)
+
+    async def put(self, student_id: str, record: dict, ttl: float):
+        self._data[student_id] = (json.dumps(record, ensure_ascii=False), time.time() + ttl)
+
+    async def delete(self, student_id: str):
+        self._data.pop(student_id, None)
+
+    async def keys(self) -> list[str]:
+        now = time.time()
+        return [k for k, (_, expires_at) in self._data.items() if expires_at > now]
+
+    async def acquire_lease(self, name: str, ttl: float) -> bool:
+        now = time.time()
+        if self._leases.get(name, 0.0) > now:
+            return False
+        self._leases[name] = now + ttl
+        return True
+
+    async def purge_expired(self):
+        now = time.time()
+        for k in [k for k, (_, expires_at) in self._data.items() if expires_at <= now]:
+            del self._data[k]
+        for k in [k for k, expires_at in self._leases.items() if expires_at <= now]:
+            del self._leases[k]
+
+    async def load(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取会话快照失败: {e}")
+            return
+        now = time.time()
+        for student_id, (data, expires_at) in snapshot.items():
+            if expires_at > now:
+                self._data[student_id] = (data, expires_at)
+        logger.info(f"已加载会话快照: {len(self._data)} 个")
+
+    async def flush(self):
+        if not self.snapshot_path:
+            return
+        now = time.time()
+        snapshot = {k: v for k, v in self._data.items() if v[1] > now}
+        await asyncio.to_thread(self._write_snapshot, snapshot)
+
+    def _write_snapshot(self, snapshot: dict):
+        # 快照包含会话 cookie：仅属主可读，写临时文件后原子替换
+        tmp_path = self.snapshot_path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, self.snapshot_path)
+
+
+class SqliteSessionStore(SessionStore):
+    """SQLite 存储（WAL 模式，同一台机器上的多个 worker 可共享）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            # 库中保存会话 cookie：与快照文件一样仅属主可读（-wal / -shm 沿用库文件的权限）
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+            os.chmod(path, 0o600)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " student_id TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                " name TEXT PRIMARY KEY,"
+                " expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def _execute(self, sql: str, params: tuple = (), fetch: bool = False):
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            rows = cur.fetchall() if fetch else None
+            self._conn.commit()
+            return rows
+
+    async def get(self, student_id: str) -> Optional[dict]:
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT data FROM sessions WHERE student_id = ? AND expires_at > ?",
+            (student_id, time.time()),
+            True,
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    async def put(self, student_id: str, record: dict, ttl: float):
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO sessions (student_id, data, expires_at) VALUES (?, ?, ?)",
+            (student_id, json.dumps(record, ensure_ascii=False), time.time() + ttl),
+        )
+
+    async def delete(self, student_id: str):
+        await asyncio.to_thread(
+            self._execute, "DELETE FROM sessions WHERE student_id = ?", (student_id,)
+        )
+
+    async def purge_expired(self):
+        now = time.time()
+        await asyncio.to_thread(
+            self._execute, "DELETE FROM sessions WHERE expires_at <= ?", (now,)
+        )
+        await asyncio.to_thread(
+            self._execute, "DELETE FROM leases WHERE expires_at <= ?", (now,)
+        )
+
+    def _acquire_lease(self, name: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            # 只有租约不存在或已过期时才写入成功（一条语句，跨进程原子）
+            cur = self._conn.execute(
+                "INSERT INTO leases (name, expires_at) VALUES (?, ?)"
+                " ON CONFLICT (name) DO UPDATE SET expires_at = excluded.expires_at"
+                " WHERE leases.expires_at <= ?",
+                (name, now + ttl, now),
+            )
+            self._conn.commit()
+            return cur.rowcount == 1
+
+    async def acquire_lease(self, name: str, ttl: float) -> bool:
+        return await asyncio.to_thread(self._acquire_lease, name, ttl)
+
+    async def keys(self) -> list[str]:
+        await self.purge_expired()
+        rows = await asyncio.to_thread(
+            self._execute, "SELECT student_id FROM sessions", (), True
+        )
+        return [r[0] for r in rows]
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisError(Exception):
+    """Redis 返回的错误回复"""
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Redis 协议存储（RESP2），不依赖 redis 客户端库。
+
+    每条记录一个 key（前缀 + 学号），过期交给 Redis 的 PX 处理。
+    """
+
+    KEY_PREFIX = "bnu:session:"
+    LEASE_PREFIX = "bnu:lease:"
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._roundtrip("AUTH", self.password)
+        if self.db:
+            await self._roundtrip("SELECT", str(self.db))
+
+    async def _roundtrip(self, *args: str):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg.encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._writer.write(b"".join(parts))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis 连接已关闭")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RedisError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise RedisError(f"无法识别的回复: {line[:40]!r}")
+
+    async def _execute(self, *args: str):
+        async with self._lock:
+            if self._writer is None or self._writer.is_closing():
+                await self._connect()
+            try:
+                return await self._roundtrip(*args)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # 连接断开：重连后重试一次
+                await self._connect()
+                return await self._roundtrip(*args)
+
+    async def get(self, student_id: str) -> Optional[dict]:
+        data = await self._execute("GET", self.KEY_PREFIX + student_id)
+        return json.loads(data) if data else None
+
+    async def put(self, student_id: str, record: dict, ttl: float):
+        await self._execute(
+            "SET", self.KEY_PREFIX + student_id,
+            json.dumps(record, ensure_ascii=False),
+            "PX", str(max(1, int(ttl * 1000))),
+        )
+
+    async def delete(self, student_id: str):
+        await self._execute("DEL", self.KEY_PREFIX + student_id)
+
+    async def acquire_lease(self, name: str, ttl: float) -> bool:
+        reply = await self._execute(
+            "SET", self.LEASE_PREFIX + name, "1", "NX", "PX", str(max(1, int(ttl * 1000))),
+        )
+        return reply == "OK"
+
+    async def keys(self) -> list[str]:
+        result = []
+        cursor = "0"
+        while True:
+            cursor, batch = await self._execute(
+                "SCAN", cursor, "MATCH", self.KEY_PREFIX + "*", "COUNT", "200"
+            )
+            result.extend(k[len(self.KEY_PREFIX):] for k in batch)
+            if cursor == "0":
+                return result
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def create_session_store(url: str, snapshot_path: str = "") -> SessionStore:
+    """根据 URL 创建会话存储；snapshot_path 仅对 memory 后端有效"""
+    parsed = urlparse(url)
+    if parsed.scheme in ("", "memory"):
+        return MemorySessionStore(snapshot_path)
+    if parsed.scheme == "sqlite":
+        # sqlite:///relative.db → "relative.db"；sqlite:////abs/path.db → "/abs/path.db"
+        return SqliteSessionStore(parsed.path[1:] or "sessions.db")
+    if parsed.scheme == "redis":
+        db = int(parsed.path.lstrip("/") or 0)
+        return RedisSessionStore(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=db,
+            password=parsed.password,
+        )
+    raise ValueError(f"不支持的会话存储: {url}")
@@ -0,0 +1,97 @@
+"""
+Single-flight 请求合并
+
+同一个 key 同时只有一次上游抓取在进行：并发的相同请求等待同一个任务并共享结果
+（或异常）。用于课表/成绩/考试抓取，避免 App 冷启动和重复刷新时
+把同一份数据从 WebVPN 抓好几遍。
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """按 key 合并并发的异步调用"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        # 由 start() 发起、没有调用方等待结果的后台任务
+        self._background: set[asyncio.Task] = set()
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.background_failures = 0
+        metrics.register(f"singleflight.{name}", self.stats)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行 fn()，若相同 key 已有进行中的调用则直接等待其结果。
+
+        实际抓取运行在独立 task 中：发起者断开（被取消）不会中断其他等待者。
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._launch(key, fn)
+        else:
+            self.coalesced += 1
+            logger.info(f"[{self.name}] 合并进行中的请求: {key}")
+        return await asyncio.shield(task)
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> asyncio.Task:
+        """
+        在后台启动 fn()（相同 key 已在进行则复用），不等待结果。
+
+        用于 stale-while-revalidate 的后台刷新：没有调用方接收异常，
+        失败时记录 warning 日志并计入 background_failures。
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = self._launch(key, fn)
+            self._background.add(task)
+        return task
+
+    def _launch(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> asyncio.Task:
+        self.executions += 1
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        background = task in self._background
+        self._background.discard(task)
+        # 所有等待者都已离开时，避免 "exception was never retrieved" 警告
+        if task.cancelled() or task.exception() is None:
+            return
+        self.failures += 1
+        if background:
+            self.background_failures += 1
+            logger.warning(f"[{self.name}] 后台刷新失败: {key}: {task.exception()!r}")
+        else:
+            logger.debug(f"[{self.name}] 请求失败: {key}: {task.exception()!r}")
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "background_failures": self.background_failures,
+            "in_flight": len(self._inflight),
+        }
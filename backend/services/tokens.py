@@ -0,0 +1,128 @@
+"""
+教务系统安全 token 缓存
+
+课表数据接口的 t 参数和成绩查询表单的 kingoKey（SetTokenkey.jsp）在同一个会话内
+可以重复使用，不必每次查询前都重新获取：
+  - 按上游会话（UpstreamClient）缓存，会话释放后自动清理；超过 max_age 主动重取
+  - 同一会话并发获取时只向上游请求一次
+  - 数据接口拒绝 token 时（is_token_rejected），调用方 invalidate 后重取并重试一次；
+    返回登录页说明会话本身已失效（services.upstream.is_login_page），不是 token 的问题
+
+获取流程可以分级（levels）：先用最少的请求获取，token 被数据接口拒绝时该会话升级到
+下一级（更完整地模拟浏览器），即"学到"该会话所需的最少步骤。级别按会话保存，
+随会话释放：一个会话的偶发拒绝不会让其他会话（或之后的新会话）都走完整流程；
+token 获取失败（网络错误、返回空）只说明这次没取到，不升级。
+"""
+
+import time
+import asyncio
+import logging
+import weakref
+from typing import Awaitable, Callable
+
+from services import metrics
+from services.rate_limit import is_throttled_page
+from services.upstream import is_login_page
+
+logger = logging.getLogger(__name__)
+
+
+def is_token_rejected(html: str) -> bool:
+    """
+    数据接口的响应是否像是 token 被拒：
+    既没有数据表格，也不是"没有检索到记录"、限流提示或登录页。
+    调用方应先检查 is_login_page：登录页表示会话失效，应让会话失败而不是重取 token
+    """
+    if "没有检索到记录" in html or is_throttled_page(html) or is_login_page(html):
+        return False
+    return "<table" not in html.lower()
+
+
+class TokenCache:
+    """按会话缓存一种 token"""
+
+    def __init__(self, name: str, fetch: Callable[..., Awaitable[str]],
+                 max_age: float, levels: int = 1):
+        """
+        Args:
+            fetch: async fetch(session) -> token（levels > 1 时为 fetch(session, level)），
+                   失败返回空字符串
+            max_age: token 的最长复用时间（秒）
+            levels: 获取流程的级数，0 为最少步骤
+        """
+        self.name = name
+        self.max_age = max_age
+        self.levels = levels
+        self._fetch = fetch
+        # session → (token, 获取时间)
+        self._tokens: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        # session → 获取流程级别（没有记录为 0）
+        self._levels: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._locks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.fetches = 0
+        self.rejections = 0
+        self.escalations = 0
+        metrics.register(f"tokens.{name}", self.stats)
+
+    async def get(self, session) -> str:
+        """返回可用的 token（缓存或新获取），获取失败返回空字符串"""
+        cached = self._tokens.get(session)
+        if cached and time.monotonic() - cached[1] < self.max_age:
+            self.hits += 1
+            return cached[0]
+
+        lock = self._locks.get(session)
+        if lock is None:
+            lock = self._locks[session] = asyncio.Lock()
+        async with lock:
+            # 等锁期间其他请求可能已经取到
+            cached = self._tokens.get(session)
+            if cached and time.monotonic() - cached[1] < self.max_age:
+                self.hits += 1
+                return cached[0]
+
+            token = await self._fetch_token(session)
+            if token:
+                self._tokens[session] = (token, time.monotonic())
+            return token
+
+    def level(self, session) -> int:
+        """会话当前使用的获取流程级别"""
+        return self._levels.get(session, 0)
+
+    async def _fetch_token(self, session) -> str:
+        self.fetches += 1
+        if self.levels > 1:
+            return await self._fetch(session, self.level(session))
+        return await self._fetch(session)
+
+    def invalidate(self, session, rejected: bool = False):
+        """
+        丢弃会话的 token；rejected=True 表示有效会话上的数据接口拒绝了该 token，
+        同时升级该会话的获取流程（会话失效导致的失败不应传 rejected）
+        """
+        self._tokens.pop(session, None)
+        if rejected:
+            self.rejections += 1
+            level = self.level(session)
+            if level < self.levels - 1:
+                self._levels[session] = level + 1
+                self.escalations += 1
+                logger.warning(f"[{self.name}] token 被数据接口拒绝，"
+                               f"该会话的获取流程升级到第 {level + 1} 级")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.fetches
+        levels: dict[int, int] = {}
+        for level in self._levels.values():
+            levels[level] = levels.get(level, 0) + 1
+        return {
+            "escalated_sessions": dict(sorted(levels.items())),
+            "sessions": len(self._tokens),
+            "hits": self.hits,
+            "fetches": self.fetches,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "rejections": self.rejections,
+            "escalations": self.escalations,
+        }
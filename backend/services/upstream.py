@@ -0,0 +1,205 @@
+"""
+上游 HTTP 客户端（异步）
+
+所有发往 WebVPN / CAS / 教务系统的请求都经由 UpstreamClient 发出。
+底层为 httpx.AsyncClient，请求期间让出事件循环，
+同一个 uvicorn worker 可以同时挂起大量用户的上游请求。
+
+每个用户一个 UpstreamClient（独立 cookie jar），接口风格与 requests.Session 接近：
+  - get / post 默认跟随重定向
+  - data 为 str 时按原样作为请求体发送（表单已手工编码的场景）
+  - encoding 参数用于指定响应解码方式（教务系统页面为 GBK）
+  - 每个请求发出前先经过上游限流器（services.rate_limit）
+  - stream() 以流式读取响应体（大页面边下载边解析，不整体保存在内存中）
+
+会话失效后，上游的请求会被重定向到 CAS 登录页（is_login_page）；数据接口遇到时
+把会话标记为 expired 并抛出 SessionExpired，由路由返回 401 提示重新登录。
+"""
+
+import ssl
+from contextlib import asynccontextmanager
+from http.cookiejar import Cookie
+from typing import AsyncIterator, Optional, Union
+
+import httpx
+
+from config import DEFAULT_HEADERS, UPSTREAM_MAX_CONNECTIONS, UPSTREAM_MAX_KEEPALIVE
+from services.rate_limit import RateLimiter, upstream_limiter
+
+# 上游异常（供调用方捕获，避免到处依赖 httpx）
+UpstreamError = httpx.HTTPError
+UpstreamTimeout = httpx.TimeoutException
+UpstreamConnectionError = httpx.TransportError
+
+# CAS 登录页标题中的标记（只在页面开头查找，避免误判正文中出现的同名文字）
+LOGIN_PAGE_MARKER = "统一身份认证"
+LOGIN_PAGE_HEAD = 1000
+
+
+def is_login_page(html: str) -> bool:
+    """响应是否为 CAS 登录页（会话已失效，请求被重定向到登录）"""
+    return LOGIN_PAGE_MARKER in html[:LOGIN_PAGE_HEAD]
+
+
+class SessionExpired(Exception):
+    """上游会话已失效：数据接口返回了登录页"""
+
+# 所有客户端共用一个 SSL 上下文，避免每次登录都重新加载证书
+_ssl_context: Optional[ssl.SSLContext] = None
+
+
+def _get_ssl_context() -> ssl.SSLContext:
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+class UpstreamClient:
+    """单个用户的上游会话（cookie jar + 连接池）"""
+
+    def __init__(self, limit_key: str = "",
+                 limiter: Optional[RateLimiter] = upstream_limiter):
+        # limit_key 通常是学号，用于按用户限流
+        self.limit_key = limit_key
+        self._limiter = limiter
+        # 数据接口返回登录页时置位，持有该会话的 AuthService 随之视为未登录
+        self.expired = False
+        self._client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            follow_redirects=True,
+            verify=_get_ssl_context(),
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            ),
+        )
+
+    @property
+    def cookies(self) -> httpx.Cookies:
+        return self._client.cookies
+
+    def cookie_names(self) -> list[str]:
+        """当前 cookie jar 中所有 cookie 的名字（同名不同域的 cookie 不会冲突）"""
+        return [c.name for c in self._client.cookies.jar]
+
+    def export_cookies(self) -> list[dict]:
+        """导出 cookie jar（可 JSON 序列化，用于会话存储）"""
+        return [
+            {
+                "name": c.name,
+                "value": c.value,
+                "domain": c.domain,
+                "path": c.path,
+                "secure": c.secure,
+                "expires": c.expires,
+            }
+            for c in self._client.cookies.jar
+        ]
+
+    def import_cookies(self, cookies: list[dict]):
+        """从 export_cookies() 的结果恢复 cookie jar"""
+        jar = self._client.cookies.jar
+        for c in cookies:
+            domain = c.get("domain", "")
+            jar.set_cookie(Cookie(
+                version=0,
+                name=c["name"],
+                value=c["value"],
+                port=None,
+                port_specified=False,
+                domain=domain,
+                domain_specified=bool(domain),
+                domain_initial_dot=domain.startswith("."),
+                path=c.get("path") or "/",
+                path_specified=True,
+                secure=c.get("secure", False),
+                expires=c.get("expires"),
+                discard=c.get("expires") is None,
+                comment=None,
+                comment_url=None,
+                rest={},
+            ))
+
+    async def request(self, method: str, url: str, *,
+                      data: Union[str, bytes, dict, None] = None,
+                      headers: Optional[dict] = None,
+                      timeout: float = 15,
+                      allow_redirects: bool = True,
+                      encoding: Optional[str] = None) -> httpx.Response:
+        """
+        发送请求；encoding 不为空时在读取 .text 之前设置响应编码。
+
+        Raises:
+            RateLimitExceeded: 限流队列已满或等待超时（请求未发出）
+        """
+        if self._limiter:
+            await self._limiter.acquire(self.limit_key)
+
+        resp = await self._client.send(
+            self._build_request(method, url, data, headers, timeout),
+            follow_redirects=allow_redirects,
+        )
+        if encoding:
+            resp.encoding = encoding
+        return resp
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, *,
+                     data: Union[str, bytes, dict, None] = None,
+                     headers: Optional[dict] = None,
+                     timeout: float = 15,
+                     allow_redirects: bool = True,
+                     encoding: Optional[str] = None) -> AsyncIterator[httpx.Response]:
+        """
+        流式请求：async with session.stream(...) as resp，
+        在块内用 resp.aiter_bytes() 读取响应体；退出时关闭响应。
+        参数与 request() 相同。
+
+        Raises:
+            RateLimitExceeded: 限流队列已满或等待超时（请求未发出）
+        """
+        if self._limiter:
+            await self._limiter.acquire(self.limit_key)
+
+        resp = await self._client.send(
+            self._build_request(method, url, data, headers, timeout),
+            follow_redirects=allow_redirects,
+            stream=True,
+        )
+        try:
+            if encoding:
+                resp.encoding = encoding
+            yield resp
+        finally:
+            await resp.aclose()
+
+    def _build_request(self, method: str, url: str,
+                       data: Union[str, bytes, dict, None],
+                       headers: Optional[dict], timeout: float) -> httpx.Request:
+        if isinstance(data, (str, bytes)):
+            content, form = data, None
+        else:
+            content, form = None, data
+        return self._client.build_request(
+            method,
+            url,
+            content=content,
+            data=form,
+            headers=headers,
+            timeout=timeout,
+        )
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        """关闭连接池"""
+        await self._client.aclose()
+
+    @property
+    def is_closed(self) -> bool:
+        return self._client.is_closed
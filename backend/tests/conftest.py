@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试按 backend 目录下的模块路径导入（services.xxx），与 uvicorn main:app 一致
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
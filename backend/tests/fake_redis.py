@@ -0,0 +1,122 @@
+"""
+进程内的 Redis 替身：实现 RedisSessionStore 用到的 RESP2 命令子集
+（AUTH / SELECT / PING / GET / SET [NX] [PX|EX] / DEL / SCAN），数据只保存在内存中。
+
+drop_connections() 断开所有客户端连接，用于测试断线重连。
+"""
+
+import time
+import asyncio
+import fnmatch
+from typing import Optional
+
+
+class FakeRedis:
+    def __init__(self, password: Optional[str] = None):
+        self.password = password
+        self.host = "127.0.0.1"
+        self.port = 0
+        self.connections = 0
+        self.commands: list[list[str]] = []
+        self._data: dict[str, tuple[str, float]] = {}
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    async def __aenter__(self) -> "FakeRedis":
+        self._server = await asyncio.start_server(self._serve, self.host, 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self.drop_connections()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def drop_connections(self):
+        for writer in list(self._writers):
+            writer.close()
+        self._writers.clear()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        self._writers.add(writer)
+        authed = self.password is None
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                self.commands.append(args)
+                name = args[0].upper()
+                if name == "AUTH":
+                    authed = args[1] == self.password
+                    writer.write(b"+OK\r\n" if authed else b"-WRONGPASS invalid password\r\n")
+                elif not authed:
+                    writer.write(b"-NOAUTH Authentication required.\r\n")
+                else:
+                    writer.write(self._dispatch(name, args[1:]))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[list[str]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        assert line[:1] == b"*", line
+        args = []
+        for _ in range(int(line[1:-2])):
+            header = await reader.readline()
+            assert header[:1] == b"$", header
+            data = await reader.readexactly(int(header[1:-2]) + 2)
+            args.append(data[:-2].decode("utf-8"))
+        return args
+
+    def _get(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at and expires_at <= time.time():
+            del self._data[key]
+            return None
+        return value
+
+    def _dispatch(self, name: str, args: list[str]) -> bytes:
+        if name in ("SELECT", "PING"):
+            return b"+OK\r\n" if name == "SELECT" else b"+PONG\r\n"
+        if name == "GET":
+            return _bulk(self._get(args[0]))
+        if name == "SET":
+            key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+            expires_at = 0.0
+            if "PX" in options:
+                expires_at = time.time() + int(args[2 + options.index("PX") + 1]) / 1000
+            elif "EX" in options:
+                expires_at = time.time() + int(args[2 + options.index("EX") + 1])
+            if "NX" in options and self._get(key) is not None:
+                return _bulk(None)
+            self._data[key] = (value, expires_at)
+            return b"+OK\r\n"
+        if name == "DEL":
+            removed = sum(1 for key in args if self._get(key) is not None)
+            for key in args:
+                self._data.pop(key, None)
+            return b":%d\r\n" % removed
+        if name == "SCAN":
+            pattern = args[args.index("MATCH") + 1] if "MATCH" in args else "*"
+            keys = [k for k in list(self._data) if self._get(k) is not None
+                    and fnmatch.fnmatchcase(k, pattern)]
+            return b"*2\r\n" + _bulk("0") + b"*%d\r\n" % len(keys) + b"".join(_bulk(k) for k in keys)
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+
+def _bulk(value: Optional[str]) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    data = value.encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
@@ -0,0 +1,65 @@
+"""
+内部记录（models.records）与响应模型（models.schemas）的一致性：
+字段名和顺序相同，样例数据的 JSON 输出（默认 / 紧凑格式）逐字节一致
+"""
+
+import typing
+from dataclasses import fields
+
+import pytest
+
+from models import records, schemas
+
+PAIRS = [
+    (records.ScheduleSlotRecord, schemas.ScheduleSlot),
+    (records.CourseRecord, schemas.Course),
+    (records.ScheduleRecord, schemas.ScheduleResponse),
+    (records.GradeRecord, schemas.Grade),
+    (records.GradesRecord, schemas.GradesResponse),
+    (records.ExamRecord, schemas.Exam),
+    (records.ExamsRecord, schemas.ExamsResponse),
+]
+
+
+def _sample(cls):
+    """按字段类型构造一个所有字段都非默认值的样例记录"""
+    return cls(**{f.name: _sample_value(f.type) for f in fields(cls)})
+
+
+def _sample_value(tp):
+    if typing.get_origin(tp) is list:
+        (item,) = typing.get_args(tp)
+        return [_sample_value(item)]
+    if tp is str:
+        return "样例"
+    if tp is int:
+        return 6        # 作为 weeks_mask 时为第 1、2 周
+    if tp is float:
+        return 1.5
+    return _sample(tp)
+
+
+@pytest.mark.parametrize("record, model", PAIRS, ids=lambda cls: cls.__name__)
+def test_fields_match_schema(record, model):
+    assert [f.name for f in fields(record)] == list(model.model_fields)
+    for name in model.model_computed_fields:
+        assert hasattr(record, name), f"{record.__name__} 缺少计算字段 {name}"
+
+
+@pytest.mark.parametrize("record, model",
+                         [(r, m) for r, m in PAIRS if hasattr(r, "to_json")],
+                         ids=lambda cls: cls.__name__)
+@pytest.mark.parametrize("compact", [False, True])
+def test_json_matches_schema(record, model, compact):
+    sample = _sample(record)
+    validated = model.model_validate(sample, from_attributes=True)
+    context = {"compact": True} if compact else None
+    assert sample.to_json(compact) == validated.model_dump_json(context=context).encode("utf-8")
+
+
+@pytest.mark.parametrize("record", [r for r, _ in PAIRS if hasattr(r, "from_json")],
+                         ids=lambda cls: cls.__name__)
+def test_json_roundtrip(record):
+    sample = _sample(record)
+    assert record.from_json(sample.to_json()) == sample
+    assert record.from_json(sample.to_json(compact=True)) == sample
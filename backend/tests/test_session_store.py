@@ -0,0 +1,188 @@
+"""
+会话存储（services.session_store）三种后端的行为测试；Redis 后端连接进程内替身 FakeRedis
+"""
+
+import os
+import stat
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from fake_redis import FakeRedis
+from services.session_store import (
+    MemorySessionStore,
+    RedisError,
+    RedisSessionStore,
+    SqliteSessionStore,
+    create_session_store,
+)
+
+BACKENDS = ["memory", "sqlite", "redis"]
+
+RECORD = {"student_id": "202311000001", "student_name": "张三", "is_logged_in": True,
+          "last_active": 1.5, "cookies": [{"name": "wengine_vpn_ticket", "value": "abc"}]}
+
+
+@asynccontextmanager
+async def open_store(kind: str, tmp_path):
+    if kind == "memory":
+        store = MemorySessionStore()
+        yield store
+    elif kind == "sqlite":
+        store = SqliteSessionStore(str(tmp_path / "sessions.db"))
+        yield store
+    else:
+        async with FakeRedis() as server:
+            store = RedisSessionStore(server.host, server.port)
+            yield store
+    await store.close()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_get_put_delete(kind, tmp_path):
+    async def scenario():
+        async with open_store(kind, tmp_path) as store:
+            assert await store.get("202311000001") is None
+            await store.put("202311000001", RECORD, ttl=60)
+            assert await store.get("202311000001") == RECORD
+            await store.put("202311000002", dict(RECORD, student_id="202311000002"), ttl=60)
+            assert sorted(await store.keys()) == ["202311000001", "202311000002"]
+
+            await store.put("202311000001", dict(RECORD, last_active=9.0), ttl=60)
+            assert (await store.get("202311000001"))["last_active"] == 9.0
+
+            await store.delete("202311000001")
+            await store.delete("202311000001")   # 不存在时忽略
+            assert await store.get("202311000001") is None
+            assert await store.keys() == ["202311000002"]
+
+    run(scenario())
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_ttl(kind, tmp_path):
+    async def scenario():
+        async with open_store(kind, tmp_path) as store:
+            await store.put("short", RECORD, ttl=0.05)
+            await store.put("long", RECORD, ttl=60)
+            await asyncio.sleep(0.1)
+            assert await store.get("short") is None
+            assert await store.keys() == ["long"]
+            await store.purge_expired()
+            assert await store.get("long") == RECORD
+
+    run(scenario())
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_lease(kind, tmp_path):
+    async def scenario():
+        async with open_store(kind, tmp_path) as store:
+            assert await store.acquire_lease("probe:1", 0.05)
+            assert not await store.acquire_lease("probe:1", 0.05)
+            assert await store.acquire_lease("probe:2", 0.05)
+            await asyncio.sleep(0.1)
+            assert await store.acquire_lease("probe:1", 0.05)
+
+    run(scenario())
+
+
+def test_sqlite_shared_between_connections(tmp_path):
+    """同一个 SQLite 文件上的两个存储（两个 worker）看到相同的记录和租约"""
+    async def scenario():
+        path = str(tmp_path / "sessions.db")
+        a, b = SqliteSessionStore(path), SqliteSessionStore(path)
+        await a.put("202311000001", RECORD, ttl=60)
+        assert await b.get("202311000001") == RECORD
+        assert await a.acquire_lease("probe:202311000001", 60)
+        assert not await b.acquire_lease("probe:202311000001", 60)
+        await b.delete("202311000001")
+        assert await a.get("202311000001") is None
+        await a.close()
+        await b.close()
+
+    run(scenario())
+
+
+def test_sqlite_file_is_private(tmp_path):
+    path = tmp_path / "sessions.db"
+    store = SqliteSessionStore(str(path))
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    run(store.close())
+
+    # 已存在、权限过宽的文件同样收紧
+    os.chmod(path, 0o644)
+    store = SqliteSessionStore(str(path))
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    run(store.close())
+
+
+def test_memory_snapshot_roundtrip(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "snapshot.json")
+        store = MemorySessionStore(path)
+        await store.put("202311000001", RECORD, ttl=60)
+        await store.put("expired", RECORD, ttl=0.01)
+        await asyncio.sleep(0.02)
+        await store.flush()
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+        restored = MemorySessionStore(path)
+        await restored.load()
+        assert await restored.keys() == ["202311000001"]
+        assert await restored.get("202311000001") == RECORD
+
+    run(scenario())
+
+
+def test_redis_reconnects_after_disconnect():
+    async def scenario():
+        async with FakeRedis() as server:
+            store = RedisSessionStore(server.host, server.port)
+            await store.put("202311000001", RECORD, ttl=60)
+            assert server.connections == 1
+
+            server.drop_connections()
+            await asyncio.sleep(0.01)
+            assert await store.get("202311000001") == RECORD
+            assert server.connections == 2
+            await store.close()
+
+    run(scenario())
+
+
+def test_redis_auth_select_and_ttl_argument():
+    async def scenario():
+        async with FakeRedis(password="secret") as server:
+            store = create_session_store(f"redis://:secret@{server.host}:{server.port}/2")
+            start = time.time()
+            await store.put("202311000001", RECORD, ttl=30)
+            assert server.commands[:2] == [["AUTH", "secret"], ["SELECT", "2"]]
+            set_command = server.commands[2]
+            assert set_command[:2] == ["SET", RedisSessionStore.KEY_PREFIX + "202311000001"]
+            assert set_command[3:] == ["PX", "30000"]
+            assert time.time() - start < 5
+            await store.close()
+
+            bad = RedisSessionStore(server.host, server.port, password="wrong")
+            with pytest.raises(RedisError):
+                await bad.get("202311000001")
+            await bad.close()
+
+    run(scenario())
+
+
+def test_create_session_store_urls(tmp_path):
+    assert isinstance(create_session_store("memory://"), MemorySessionStore)
+    store = create_session_store(f"sqlite:///{tmp_path}/s.db")
+    assert isinstance(store, SqliteSessionStore)
+    assert store.path == f"{tmp_path}/s.db"
+    run(store.close())
+    with pytest.raises(ValueError):
+        create_session_store("mongodb://localhost")
@@ -0,0 +1,57 @@
+"""
+基于 lxml 的快速 HTML 提取工具
+
+直接使用 lxml 的树和编译好的 XPath，避免 BeautifulSoup 在 Python 层逐节点包装对象。
+文本提取与 BeautifulSoup（lxml 解析器）的 get_text 保持逐字一致：
+  - 不包含注释
+  - 不包含 script / style / template / rt / rp 内的文本（bs4 把这些视为特殊字符串类型）
+  - strip=True 时每段文本分别 strip，丢弃空段后直接拼接
+"""
+
+from lxml import etree
+
+# BeautifulSoup get_text 默认不包含的文本所在标签
+_SPECIAL_STRING_TAGS = frozenset(("script", "style", "template", "rt", "rp"))
+
+
+def parse_document(html: str):
+    """
+    解析 HTML 文本，返回文档根元素（无法解析时抛出 ValueError）。
+
+    使用 lxml.etree 的 HTML 解析器（与 bs4 的 lxml 解析器相同，线程内共享），
+    不经过 lxml.html 的自定义元素类，节点访问更快。
+    """
+    root = etree.HTML(html)
+    if root is None:
+        raise ValueError("空文档")
+    return root
+
+
+def get_text(el, strip: bool = False) -> str:
+    """等价于 BeautifulSoup 的 tag.get_text() / tag.get_text(strip=True)"""
+    if not len(el):
+        # 没有子节点（最常见的单元格）：只有自身文本
+        text = el.text or ""
+        return text.strip() if strip else text
+    strings = _collect_strings(el, [])
+    if strip:
+        return "".join([s.strip() for s in strings])
+    return "".join(strings)
+
+
+def _collect_strings(el, out: list) -> list:
+    if el.text:
+        out.append(el.text)
+    for child in el:
+        # 注释 / 处理指令的 tag 不是字符串：跳过其内容，但保留其后的文本
+        tag = child.tag
+        if tag.__class__ is str and tag not in _SPECIAL_STRING_TAGS:
+            _collect_strings(child, out)
+        if child.tail:
+            out.append(child.tail)
+    return out
+
+
+def xpath(expr: str) -> etree.XPath:
+    """编译 XPath（结果为普通字符串，不保留到树的引用）"""
+    return etree.XPath(expr, smart_strings=False)
@@ -0,0 +1,345 @@
+"""
+声明式 HTML 表格提取
+
+课表、成绩、考试三个解析器的共同部分：找到页面中的第一个表格，逐行取出单元格文本，
+按列定义映射成字段。列定义（TableSchema）描述：
+  - 字段在第几列（index），或按表头关键词定位（headers，第一行作为表头）
+  - 类型转换（convert，如 _safe_float），缺失列的默认值
+  - 行过滤：最少单元格数、隐藏单元格（style 含 "display: none"）、跳过表头类行
+每行只遍历一次、每个单元格只取一次文本。
+
+文档有两个后端，接口相同：
+  LxmlDocument   lxml.etree + 编译好的 XPath（默认，快）
+  SoupDocument   BeautifulSoup（回退），行为与原先各解析器的实现一致
+parse_with_fallback(html, fn) 先用 lxml 运行 fn，出错时用 BeautifulSoup 重新运行。
+TableStream 按块增量提取（边下载边解析，见类说明）。
+"""
+
+import logging
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from bs4 import BeautifulSoup
+from lxml import etree
+
+from utils import fast_html
+
+logger = logging.getLogger(__name__)
+
+# 为 False 时始终使用 BeautifulSoup 解析
+FAST_PARSER = True
+
+
+@dataclass(frozen=True)
+class Column:
+    """一列：index 为固定位置；headers 为表头关键词（按顺序匹配）"""
+    field: str
+    index: Optional[int] = None
+    headers: tuple[str, ...] = ()
+    convert: Optional[Callable[[str], Any]] = None
+    default: Any = ""
+
+
+@dataclass(frozen=True)
+class TableSchema:
+    columns: tuple[Column, ...]
+    # 数据行取自第一个 tbody（没有则整个表格）；False 时取整个表格的行
+    use_tbody: bool = True
+    # 第一行是表头：按 Column.headers 定位列，并跳过该行
+    header_row: bool = False
+    # td 数少于该值的行跳过
+    min_cells: int = 0
+    # 丢弃 style 含 "display: none" 的单元格，列号按剩余单元格计算
+    skip_hidden: bool = False
+    # 去掉隐藏单元格后少于该值的行跳过
+    min_visible: int = 0
+    # 按单元格文本跳过的行（表头、空行等）
+    skip_row: Optional[Callable[[list[str]], bool]] = None
+
+
+@dataclass
+class TableRow:
+    texts: list[str]
+    values: dict[str, Any] = field(default_factory=dict)
+
+    def __getitem__(self, name: str) -> Any:
+        return self.values[name]
+
+
+class LxmlDocument:
+    """lxml 后端"""
+
+    def __init__(self, html: str):
+        self.root = fast_html.parse_document(html)
+
+    def find(self, tag: str, style: Optional[str] = None):
+        found = _find_xpath(tag, style, True)(self.root)
+        return found[0] if found else None
+
+    def find_all(self, tag: str, style: Optional[str] = None) -> list:
+        return _find_xpath(tag, style, False)(self.root)
+
+    @staticmethod
+    def text(el, strip: bool = False) -> str:
+        return fast_html.get_text(el, strip)
+
+    @staticmethod
+    def first(el, tag: str):
+        return next(el.iter(tag), None)
+
+    @staticmethod
+    def descendants(el, *tags: str) -> list:
+        # iter() 包含自身；这里传入的元素标签与 tags 不同（如 tr → td），结果即后代
+        return list(el.iter(*tags))
+
+    @staticmethod
+    def style(el) -> str:
+        return el.get("style") or ""
+
+
+@lru_cache(maxsize=None)
+def _find_xpath(tag: str, style: Optional[str], first: bool):
+    expr = f"//{tag}"
+    if style:
+        expr += f'[contains(@style, "{style}")]'
+    if first:
+        expr = f"({expr})[1]"
+    return fast_html.xpath(expr)
+
+
+class SoupDocument:
+    """BeautifulSoup 后端（回退）"""
+
+    def __init__(self, html: str):
+        self.root = BeautifulSoup(html, "lxml")
+
+    def find(self, tag: str, style: Optional[str] = None):
+        if style:
+            return self.root.find(tag, style=lambda s: s and style in str(s))
+        return self.root.find(tag)
+
+    def find_all(self, tag: str, style: Optional[str] = None) -> list:
+        if style:
+            return self.root.find_all(tag, style=lambda s: s and style in str(s))
+        return self.root.find_all(tag)
+
+    @staticmethod
+    def text(el, strip: bool = False) -> str:
+        return el.get_text(strip=True) if strip else el.get_text()
+
+    @staticmethod
+    def first(el, tag: str):
+        return el.find(tag)
+
+    @staticmethod
+    def descendants(el, *tags: str) -> list:
+        return el.find_all(list(tags) if len(tags) > 1 else tags[0])
+
+    @staticmethod
+    def style(el) -> str:
+        return el.get("style") or ""
+
+
+def parse_with_fallback(html: str, fn: Callable[[Any], Any], name: str = "") -> Any:
+    """用 lxml 后端运行 fn(doc)，失败时回退到 BeautifulSoup"""
+    if FAST_PARSER:
+        try:
+            return fn(LxmlDocument(html))
+        except Exception as e:
+            logger.warning(f"{name}快速解析失败，回退到 BeautifulSoup: {e!r}")
+    return fn(SoupDocument(html))
+
+
+def extract_table(doc, schema: TableSchema) -> Optional[list[TableRow]]:
+    """
+    提取文档中第一个表格的数据行；没有表格时返回 None。
+
+    行和单元格的选取与 BeautifulSoup 的 find / find_all 相同（包含所有后代）。
+    """
+    table = doc.find("table")
+    if table is None:
+        return None
+
+    text = doc.text
+    columns = schema.columns
+    positions = _fixed_positions(columns)
+
+    container = table
+    if schema.use_tbody:
+        tbody = doc.first(table, "tbody")
+        if tbody is not None:
+            container = tbody
+    rows = doc.descendants(container, "tr")
+
+    if schema.header_row:
+        headers = []
+        first_row = doc.first(table, "tr")
+        if first_row is not None:
+            headers = [text(c, strip=True) for c in doc.descendants(first_row, "td", "th")]
+        positions.update(_map_headers(headers, columns))
+        if headers:
+            rows = rows[1:]
+
+    result = []
+    for row in rows:
+        extracted = _extract_row(doc, row, schema, positions)
+        if extracted is not None:
+            result.append(extracted)
+    return result
+
+
+def _extract_row(doc, row, schema: TableSchema,
+                 positions: dict[str, int]) -> Optional[TableRow]:
+    """按列定义提取一行；被过滤的行返回 None"""
+    cells = doc.descendants(row, "td")
+    if len(cells) < schema.min_cells:
+        return None
+    if schema.skip_hidden:
+        cells = [td for td in cells if "display: none" not in doc.style(td)]
+        if len(cells) < schema.min_visible:
+            return None
+
+    text = doc.text
+    texts = [text(td, strip=True) for td in cells]
+    if schema.skip_row is not None and schema.skip_row(texts):
+        return None
+
+    values = {}
+    for column in schema.columns:
+        idx = positions.get(column.field)
+        if idx is None or idx >= len(texts):
+            values[column.field] = column.default
+        elif column.convert is not None:
+            values[column.field] = column.convert(texts[idx])
+        else:
+            values[column.field] = texts[idx]
+    return TableRow(texts, values)
+
+
+def _fixed_positions(columns: tuple[Column, ...]) -> dict[str, int]:
+    return {c.field: c.index for c in columns if c.index is not None}
+
+
+def _map_headers(headers: list[str], columns: tuple[Column, ...]) -> dict[str, int]:
+    """
+    按关键词定位列：对每个表头依次尝试所有关键词（按列定义顺序），
+    第一个出现在表头中、且对应字段尚未定位的关键词生效
+    """
+    keywords = [(kw, c.field) for c in columns for kw in c.headers]
+    positions: dict[str, int] = {}
+    for i, h in enumerate(headers):
+        for kw, name in keywords:
+            if kw in h and name not in positions:
+                positions[name] = i
+                break
+    return positions
+
+
+class TableStream:
+    """
+    增量提取：按块 feed() 解码后的 HTML 文本，返回本块中已结束的数据行。
+
+    使用 lxml 的 HTMLPullParser，只关心第一个表格中的 tbody 和 tr；每行处理完即清空并从树中
+    移除，内存占用与单行相当，而不是整个文档。行的选取与 extract_table 相同：
+    use_tbody 时只取第一个 tbody 中的行（thead 中的表头、之后的 tbody / tfoot 不取）；
+    遇到 tbody 之前无法知道是否有 tbody，这之前结束的行先暂存（已提取，不保留元素），
+    遇到 tbody 时丢弃，表格结束时仍没有 tbody 才产出。与 extract_table 的差异：
+      - 行按结束顺序产出（表格嵌套在单元格中时，内层行先于外层行）
+      - 不支持按表头定位列（header_row）
+    """
+
+    def __init__(self, schema: TableSchema):
+        if schema.header_row:
+            raise ValueError("流式提取不支持按表头定位列")
+        self.schema = schema
+        self._positions = _fixed_positions(schema.columns)
+        self._parser = etree.HTMLPullParser(events=("start", "end"),
+                                            tag=("table", "tbody", "tr"))
+        self._depth = 0          # 当前位于第一个表格内的 table 嵌套层数
+        self._tbody = None       # 第一个表格中的第一个 tbody（use_tbody 时）
+        self._tbody_done = False
+        self._pending: list[TableRow] = []   # 遇到 tbody 之前结束的行
+        self.found = False       # 是否遇到过表格
+        self.done = False        # 第一个表格是否已结束
+
+    def feed(self, text: str) -> list[TableRow]:
+        self._parser.feed(text)
+        return self._drain()
+
+    def close(self) -> list[TableRow]:
+        """结束输入，返回剩余的行"""
+        try:
+            self._parser.close()
+        except etree.LxmlError:
+            # 空文档等情况：已产出的行仍然有效
+            pass
+        rows = self._drain()
+        if not self.done:
+            rows.extend(self._flush_pending())
+        return rows
+
+    def _drain(self) -> list[TableRow]:
+        rows = []
+        for event, el in self._parser.read_events():
+            if el.tag == "table":
+                if self.done:
+                    continue
+                if event == "start":
+                    self.found = True
+                    self._depth += 1
+                else:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self.done = True
+                        rows.extend(self._flush_pending())
+                continue
+            if el.tag == "tbody":
+                if not (self._depth and self.schema.use_tbody):
+                    continue
+                if event == "start" and self._tbody is None:
+                    self._tbody = el
+                    self._pending.clear()
+                elif event == "end" and el is self._tbody:
+                    self._tbody_done = True
+                continue
+            if event != "end":
+                continue
+            if self._depth:
+                if not self.schema.use_tbody:
+                    self._collect(el, rows)
+                elif self._tbody is None:
+                    self._collect(el, self._pending)
+                elif not self._tbody_done and self._in_tbody(el):
+                    self._collect(el, rows)
+            self._release(el)
+        return rows
+
+    def _collect(self, el, rows: list[TableRow]):
+        row = _extract_row(_STREAM_DOC, el, self.schema, self._positions)
+        if row is not None:
+            rows.append(row)
+
+    def _in_tbody(self, el) -> bool:
+        return any(a is self._tbody for a in el.iterancestors("tbody"))
+
+    def _flush_pending(self) -> list[TableRow]:
+        # 表格中没有 tbody：暂存的行就是数据行
+        if self._tbody is not None:
+            return []
+        rows, self._pending = self._pending, []
+        return rows
+
+    @staticmethod
+    def _release(el):
+        # 嵌套在外层行中的行要留给外层行取文本，只释放最外层的行
+        if next(el.iterancestors("tr"), None) is None:
+            el.clear()
+            parent = el.getparent()
+            if parent is not None:
+                while el.getprevious() is not None:
+                    del parent[0]
+
+
+# 流式提取只用到文档接口中与单个元素相关的静态方法
+_STREAM_DOC = LxmlDocument
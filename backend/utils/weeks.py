@@ -0,0 +1,53 @@
+"""
+上课周次的位掩码表示
+
+第 n 位为 1 表示第 n 周上课，例如 1-3,8 周 → 0b100001110（270）。
+一个 int 代替周次列表：判断某周是否上课为 O(1) 位运算，区间展开不分配列表。
+"""
+
+from typing import Iterable, Iterator
+
+
+def range_mask(start: int, end: int) -> int:
+    """第 start ~ end 周（含两端）；start > end 时为空"""
+    if start > end:
+        return 0
+    return ((1 << (end + 1)) - 1) ^ ((1 << start) - 1)
+
+
+def parse_mask(weeks_str: str) -> int:
+    """
+    解析周次字符串
+    "1-3,8" → 0b100001110
+    "1-15" → 第 1 ~ 15 位
+    """
+    mask = 0
+    for part in weeks_str.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            mask |= range_mask(int(start), int(end))
+        else:
+            mask |= 1 << int(part)
+    return mask
+
+
+def to_mask(weeks: Iterable[int]) -> int:
+    mask = 0
+    for week in weeks:
+        mask |= 1 << week
+    return mask
+
+
+def iter_weeks(mask: int) -> Iterator[int]:
+    """按从小到大的顺序逐个产出周次"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def has_week(mask: int, week: int) -> bool:
+    return week >= 0 and (mask >> week) & 1 == 1